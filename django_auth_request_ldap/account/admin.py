@@ -1,37 +1,34 @@
 from django.contrib import admin
-from django.db import models
+from django.contrib.admin.views.main import ORDER_VAR
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.forms import AdminPasswordChangeForm
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 from django.contrib.auth.models import User as DJUser, Group as DJGroup
-from django.contrib.admin.models import LogEntryManager, LogEntry
 
 from .models import User, Group
+from .search import get_search_index
 from .forms import UserCreationForm, UserChangeForm, GroupEditForm, GroupCreationForm
 
 
-class LogEntryQuerySet(models.QuerySet):
-    def select_related(self, *args):
-        prefetch_user = False
-        if 'user' in args:
-            args = [x for x in args if x != 'user']
-            prefetch_user = True
-        elif len(args) == 0:
-            args = ['content_type']
-            prefetch_user = True
-        qs = super(LogEntryQuerySet, self).select_related(*args)
-        if prefetch_user:
-            qs = qs.prefetch_related('user')
-        return qs
-
-
-class LogEntryQuerySetManager(LogEntryManager.from_queryset(LogEntryQuerySet)):
-    pass
-LogEntry.objects = LogEntryQuerySetManager()
-LogEntry.objects.contribute_to_class(LogEntry, 'objects')
-
-
-class GroupAdmin(admin.ModelAdmin):
+class SearchIndexMixin(object):
+    """
+    Answers changelist searches from the local search index, so typing in
+    the search box doesn't turn into a substring search in LDAP. Matches
+    are listed best first, unless a column is picked to sort on.
+    """
+    def get_search_results(self, request, queryset, search_term):
+        index = get_search_index(self.model)
+        if index is None or not search_term:
+            return super(SearchIndexMixin, self).get_search_results(request, queryset, search_term)
+        pks = [pk for pk, label in index.ranked(search_term)]
+        if not pks:
+            return queryset.none(), False
+        if ORDER_VAR in request.GET:
+            return queryset.filter(pk__in=pks), False
+        return queryset.ranked(pks), False
+
+
+class GroupAdmin(SearchIndexMixin, admin.ModelAdmin):
     search_fields = ('name',)
     ordering = ('name',)
     readonly_fields = ['dn', 'name']
@@ -71,7 +68,7 @@ class GroupAdmin(admin.ModelAdmin):
         return super(GroupAdmin, self).get_form(request, obj, **defaults)
 
 
-class UserAdmin(DjangoUserAdmin):
+class UserAdmin(SearchIndexMixin, DjangoUserAdmin):
     add_form_template = 'admin/auth/user/add_form.html'
     change_user_password_template = None
     fieldsets = (
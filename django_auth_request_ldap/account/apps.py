@@ -1,7 +1,46 @@
 from django.apps import AppConfig
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_migrate, post_save, post_delete
 from django.utils.translation import ugettext_lazy as _
 
 
 class AccountConfig(AppConfig):
     name = 'account'
     verbose_name = _("Account")
+
+    def ready(self):
+        from .breaker import patch_ldap_connections
+        from .bus import (get_bus, publish_changed_users, publish_changed_groups, resend_changed_users,
+                          resend_changed_groups)
+        from django.contrib.auth.models import update_last_login as django_update_last_login
+        from .lastlogin import update_last_login
+        from .manager import patch_log_entry_manager
+        from .permissions import invalidate_changed_users, invalidate_changed_groups
+        from .search import register_search_index, update_search_index, remove_from_search_index
+        from .sessions import invalidate_session_users
+        from .signals import users_changed, groups_changed
+        from .utils import invalidate_permission_catalog
+
+        patch_log_entry_manager()
+        patch_ldap_connections()
+        user_logged_in.disconnect(django_update_last_login, dispatch_uid='update_last_login')
+        user_logged_in.connect(update_last_login, dispatch_uid='account_update_last_login')
+        post_migrate.connect(invalidate_permission_catalog, dispatch_uid='account_invalidate_permission_catalog')
+        users_changed.connect(invalidate_changed_users, dispatch_uid='account_permissions_users_changed')
+        groups_changed.connect(invalidate_changed_groups, dispatch_uid='account_permissions_groups_changed')
+        users_changed.connect(invalidate_session_users, dispatch_uid='account_sessions_users_changed')
+        users_changed.connect(publish_changed_users, dispatch_uid='account_bus_users_changed')
+        groups_changed.connect(publish_changed_groups, dispatch_uid='account_bus_groups_changed')
+        bus = get_bus()
+        bus.subscribe('user', resend_changed_users)
+        bus.subscribe('group', resend_changed_groups)
+
+        User = self.get_model('User')
+        Group = self.get_model('Group')
+        user_index = register_search_index(User, ['username', 'first_name', 'last_name', 'email', '_full_name'])
+        group_index = register_search_index(Group, ['name', 'description'])
+        bus.subscribe('user', user_index.refresh)
+        bus.subscribe('group', group_index.refresh)
+        for model in (User, Group):
+            post_save.connect(update_search_index, sender=model, dispatch_uid='account_search_index_save')
+            post_delete.connect(remove_from_search_index, sender=model, dispatch_uid='account_search_index_delete')
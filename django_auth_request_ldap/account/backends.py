@@ -3,7 +3,9 @@ from django.views.decorators.debug import sensitive_variables
 from django.utils import six
 from django.utils.encoding import force_text
 
+from .breaker import UNAVAILABLE_ERRORS
 from .models import User
+from .sessions import fetch_session_user, get_session_user
 
 
 class LDAPBackend(ModelBackend):
@@ -15,11 +17,13 @@ class LDAPBackend(ModelBackend):
             return None
         username = force_text(username)
         try:
-            user = User.objects.get(**{User.USERNAME_FIELD: username})
+            user = fetch_session_user(**{User.USERNAME_FIELD: username})
             if user.check_password(password):
                 return user
         except User.DoesNotExist:
             User().check_password("")
+        except UNAVAILABLE_ERRORS:
+            return None
 
     def get_group_permissions(self, user_obj, obj=None):
         if not isinstance(user_obj, User):
@@ -35,6 +39,7 @@ class LDAPBackend(ModelBackend):
         if user_id is None:
             return None
         try:
-            return User.objects.get(pk=user_id)
-        except User.DoesNotExist:
+            return get_session_user(user_id)
+        except (User.DoesNotExist,) + UNAVAILABLE_ERRORS:
+            # Without LDAP or a cached copy, the session's user is unknown.
             return None
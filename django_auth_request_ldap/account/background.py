@@ -0,0 +1,68 @@
+"""
+The background threads of a worker process.
+
+Web servers fork their workers after importing the application, and a
+thread started before the fork doesn't exist in the child, so the threads
+are started on first use in every process rather than at import.
+"""
+from django.db import connections
+
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundThread(object):
+    """
+    A daemon thread that calls ``func`` every ``interval`` seconds, or as
+    soon as it is woken up. It is started by the first ``start()`` in each
+    process; ``on_start`` is called just before, to drop state inherited
+    from the parent process.
+    """
+    def __init__(self, name, func, interval, on_start=None, error="Background thread failed"):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.on_start = on_start
+        self.error = error
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+
+    def start(self):
+        """
+        Starts the thread unless it runs in this process already; returns
+        whether it was started.
+        """
+        if self.pid == os.getpid():
+            return False
+        with self.lock:
+            if self.pid == os.getpid():
+                return False
+            if self.on_start is not None:
+                self.on_start()
+            self.pid = os.getpid()
+            self.wakeup.clear()
+            self.thread = threading.Thread(target=self.run, name=self.name)
+            self.thread.daemon = True
+            self.thread.start()
+        return True
+
+    def wake(self):
+        self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.func()
+            except Exception:
+                logger.exception(self.error)
+            finally:
+                # Don't keep idle connections in this thread.
+                for connection in connections.all():
+                    connection.close()
@@ -0,0 +1,236 @@
+"""
+Circuit breakers around LDAP, so a stalled slapd fails requests fast
+instead of tying up every worker until nginx gives up.
+
+Every LDAP operation of ldapdb's connections runs through the breaker of
+its database alias (see ``patch_ldap_connections``). After
+``ACCOUNT_LDAP_BREAKER_THRESHOLD`` consecutive failures (time-outs and
+lost connections, not errors like "no such object") the breaker opens:
+operations fail at once with ``LDAPUnavailable`` for
+``ACCOUNT_LDAP_BREAKER_RESET_TIME`` seconds, after which a single
+operation is let through to see whether LDAP is back.
+
+While a breaker is open, callers serve what they have cached past its
+time-to-live and refresh it in the background (``revalidate``). Operation
+time-outs come from the ``CONNECTION_OPTIONS`` of the LDAP databases;
+``ACCOUNT_LDAP_TIMEOUT`` bounds the binds of ``User.check_password``.
+"""
+from django.conf import settings
+from django.db import connections
+
+from collections import Counter
+import functools
+import logging
+import threading
+import time
+
+import ldap
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_LDAP_TIMEOUT = getattr(settings, 'ACCOUNT_LDAP_TIMEOUT', 5)
+ACCOUNT_LDAP_BREAKER_THRESHOLD = getattr(settings, 'ACCOUNT_LDAP_BREAKER_THRESHOLD', 5)
+ACCOUNT_LDAP_BREAKER_RESET_TIME = getattr(settings, 'ACCOUNT_LDAP_BREAKER_RESET_TIME', 30)
+ACCOUNT_LDAP_REVALIDATE_THREADS = getattr(settings, 'ACCOUNT_LDAP_REVALIDATE_THREADS', 4)
+
+# Errors that say LDAP can't be reached, rather than that the operation
+# was wrong.
+UNAVAILABLE_ERRORS = (ldap.SERVER_DOWN, ldap.TIMEOUT, ldap.TIMELIMIT_EXCEEDED, ldap.CONNECT_ERROR,
+                      ldap.UNAVAILABLE, ldap.BUSY)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# Counts of degraded service, next to the breakers' own counts.
+metrics = Counter()
+
+
+class LDAPUnavailable(ldap.SERVER_DOWN):
+    """
+    Raised instead of trying LDAP while its breaker is open.
+    """
+
+
+class CircuitBreaker(object):
+    def __init__(self, name, threshold=ACCOUNT_LDAP_BREAKER_THRESHOLD, reset_time=ACCOUNT_LDAP_BREAKER_RESET_TIME):
+        self.name = name
+        self.threshold = threshold
+        self.reset_time = reset_time
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def before(self):
+        with self.lock:
+            self.counts['calls'] += 1
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and time.time() - self.opened_at >= self.reset_time:
+                self.state = HALF_OPEN
+                self.trial = False
+            if self.state == HALF_OPEN and not self.trial:
+                # Let a single operation find out whether LDAP is back.
+                self.trial = True
+                return
+            self.counts['rejected'] += 1
+        raise LDAPUnavailable({'desc': "LDAP circuit breaker %s is open" % self.name})
+
+    def succeeded(self):
+        with self.lock:
+            if self.state != CLOSED:
+                logger.warning("LDAP circuit breaker %s closed", self.name)
+            self.state = CLOSED
+            self.failures = 0
+            self.trial = False
+
+    def failed(self):
+        with self.lock:
+            self.counts['failures'] += 1
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+                if self.state == CLOSED:
+                    self.counts['opened'] += 1
+                logger.error("LDAP circuit breaker %s opened after %d failures", self.name, self.failures)
+                self.state = OPEN
+                self.opened_at = time.time()
+                self.trial = False
+
+    def call(self, func, *args, **kwargs):
+        self.before()
+        try:
+            result = func(*args, **kwargs)
+        except UNAVAILABLE_ERRORS:
+            self.failed()
+            raise
+        except Exception:
+            # LDAP answered, if only with an error.
+            self.succeeded()
+            raise
+        self.succeeded()
+        return result
+
+    @property
+    def is_open(self):
+        return self.state != CLOSED
+
+    def as_dict(self):
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'opened_at': self.opened_at,
+            'counts': dict(self.counts),
+        }
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(alias):
+    breaker = _breakers.get(alias)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(alias, CircuitBreaker(alias))
+    return breaker
+
+
+def ldap_degraded(model=None):
+    """
+    Whether the breaker of the LDAP database that ``model`` (by default any
+    LDAP model) is read from isn't closed.
+    """
+    from django.db import router
+    if model is None:
+        from .models import User as model
+    return get_breaker(router.db_for_read(model)).is_open
+
+
+def status():
+    return {
+        'breakers': dict((alias, breaker.as_dict()) for alias, breaker in _breakers.items()),
+        'degraded': dict(metrics),
+    }
+
+
+def _guarded(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        from .replicas import replica_set
+        breaker = get_breaker(self.alias)
+        try:
+            return breaker.call(method, self, *args, **kwargs)
+        except UNAVAILABLE_ERRORS as e:
+            if not isinstance(e, LDAPUnavailable):
+                # Reconnect on the next operation, rather than reusing a
+                # connection that timed out.
+                self.connection = None
+            if not replica_set.is_replica(self.alias):
+                raise
+            # Out of rotation until its next good probe; every replica that
+            # fails is tried once, then the primary.
+            replica_set.mark_failed(self.alias)
+            if method.__name__ == 'search_s':
+                alias = replica_set.read_alias()
+                if alias != self.alias:
+                    metrics['replica_retries'] += 1
+                    return connections[alias].search_s(*args, **kwargs)
+            raise
+    wrapper._account_guarded = True
+    return wrapper
+
+
+def patch_ldap_connections():
+    """
+    Runs the operations of ldapdb's connections through the breakers.
+    Called from AccountConfig.ready.
+    """
+    from ldapdb.backends.ldap.base import DatabaseWrapper
+    for name in ('add_s', 'delete_s', 'modify_s', 'rename_s', 'search_s'):
+        method = getattr(DatabaseWrapper, name)
+        if not getattr(method, '_account_guarded', False):
+            setattr(DatabaseWrapper, name, _guarded(method))
+
+
+class Revalidator(object):
+    """
+    Runs refreshes of stale cache entries in the background, at most one
+    per key and ``threads`` at a time; refreshes beyond that are dropped,
+    the next request for the entry asks again.
+    """
+    def __init__(self, threads=ACCOUNT_LDAP_REVALIDATE_THREADS):
+        self.threads = threads
+        self.running = set()
+        self.lock = threading.Lock()
+
+    def submit(self, key, func, *args):
+        with self.lock:
+            if key in self.running or len(self.running) >= self.threads:
+                return False
+            self.running.add(key)
+        thread = threading.Thread(target=self.run, args=(key, func) + args, name='revalidate')
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def run(self, key, func, *args):
+        try:
+            func(*args)
+        except UNAVAILABLE_ERRORS:
+            pass
+        except Exception:
+            logger.exception("Revalidating %s failed", key)
+        finally:
+            with self.lock:
+                self.running.discard(key)
+            for connection in connections.all():
+                connection.close()
+
+revalidator = Revalidator()
+
+
+def revalidate(key, func, *args):
+    metrics['revalidations'] += 1
+    return revalidator.submit(key, func, *args)
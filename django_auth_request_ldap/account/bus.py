@@ -0,0 +1,318 @@
+"""
+Invalidation bus: tells every worker process, on every node, to drop what
+it has cached about a changed object.
+
+Changes are published as typed invalidations: a kind (``'user'``,
+``'group'``, ``'zone'``, ...) and the primary keys that changed, or
+``None`` for everything of that kind. Every process polls the bus at the
+start of a request (see ``InvalidationMiddleware``) and hands the
+invalidations published by other processes to the handlers subscribed to
+their kind; the publishing process invalidates its own caches directly.
+
+The transport is chosen with ``ACCOUNT_INVALIDATION_TRANSPORT``:
+
+* ``account.bus.DatabaseTransport`` (default) appends to a table that is
+  polled at most every ``ACCOUNT_INVALIDATION_POLL_INTERVAL`` seconds,
+  with a single indexed query. Every poll re-reads the rows of the last
+  ``ACCOUNT_INVALIDATION_OVERLAP`` seconds, which must exceed the longest
+  transaction that publishes invalidations (and the clock skew between
+  nodes).
+* ``account.bus.RedisTransport`` uses Redis pub/sub, at
+  ``ACCOUNT_INVALIDATION_REDIS_URL``; requires the ``redis`` package.
+* ``account.bus.LocalTransport`` connects the buses of a single process,
+  for tests.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from collections import defaultdict, deque
+from datetime import timedelta
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_INVALIDATION_TRANSPORT = getattr(settings, 'ACCOUNT_INVALIDATION_TRANSPORT',
+                                         'account.bus.DatabaseTransport')
+ACCOUNT_INVALIDATION_POLL_INTERVAL = getattr(settings, 'ACCOUNT_INVALIDATION_POLL_INTERVAL', 1)
+ACCOUNT_INVALIDATION_RETENTION = getattr(settings, 'ACCOUNT_INVALIDATION_RETENTION', 3600)
+ACCOUNT_INVALIDATION_OVERLAP = getattr(settings, 'ACCOUNT_INVALIDATION_OVERLAP', 30)
+ACCOUNT_INVALIDATION_REDIS_URL = getattr(settings, 'ACCOUNT_INVALIDATION_REDIS_URL', 'redis://localhost:6379/0')
+ACCOUNT_INVALIDATION_REDIS_CHANNEL = getattr(settings, 'ACCOUNT_INVALIDATION_REDIS_CHANNEL', 'account-invalidation')
+
+
+class Invalidation(object):
+    def __init__(self, kind, keys=None, origin=None):
+        self.kind = kind
+        self.keys = None if keys is None else list(keys)
+        self.origin = origin
+
+    def to_json(self):
+        return json.dumps({'kind': self.kind, 'keys': self.keys, 'origin': self.origin})
+
+    @classmethod
+    def from_json(cls, data):
+        data = json.loads(data)
+        return cls(data['kind'], data['keys'], data['origin'])
+
+    def __repr__(self):
+        return "<Invalidation: %s %s>" % (self.kind, 'everything' if self.keys is None else self.keys)
+
+
+class LocalTransport(object):
+    """
+    Delivers invalidations to every other LocalTransport in this process.
+    """
+    poll_interval = 0
+    transports = []
+    lock = threading.Lock()
+
+    def __init__(self):
+        self.queue = deque()
+        with self.lock:
+            self.transports.append(self)
+
+    def publish(self, invalidation):
+        with self.lock:
+            for transport in self.transports:
+                if transport is not self:
+                    transport.queue.append(invalidation)
+
+    def receive(self):
+        messages = []
+        while self.queue:
+            messages.append(self.queue.popleft())
+        return messages
+
+    def close(self):
+        with self.lock:
+            if self in self.transports:
+                self.transports.remove(self)
+
+
+class DatabaseTransport(object):
+    """
+    Publishes invalidations as rows of ``InvalidationEvent``; receiving
+    returns the rows added since the previous call. Rows older than
+    ``ACCOUNT_INVALIDATION_RETENTION`` seconds are pruned now and then.
+
+    Rows become visible when their transaction commits, which needn't be
+    in the order of their ids, so a row can show up behind rows already
+    received. Receiving therefore re-reads the rows created in the
+    ``overlap`` seconds before the newest one received, skipping the ids
+    it has seen.
+    """
+    poll_interval = ACCOUNT_INVALIDATION_POLL_INTERVAL
+    overlap = ACCOUNT_INVALIDATION_OVERLAP
+    batch_size = 1000
+
+    def __init__(self):
+        # Creation time of the newest row received, and the ids received
+        # within the overlap before it.
+        self.since = None
+        self.seen = {}
+        self.pruned_at = 0
+
+    @property
+    def model(self):
+        from .models import InvalidationEvent
+        return InvalidationEvent
+
+    def publish(self, invalidation):
+        self.model.objects.create(origin=invalidation.origin, kind=invalidation.kind,
+                                  keys=json.dumps(invalidation.keys or []),
+                                  everything=invalidation.keys is None)
+        now = time.time()
+        if now - self.pruned_at >= ACCOUNT_INVALIDATION_RETENTION / 10.0:
+            self.pruned_at = now
+            cutoff = timezone.now() - timedelta(seconds=ACCOUNT_INVALIDATION_RETENTION)
+            self.model.objects.filter(created__lt=cutoff).delete()
+
+    def receive(self):
+        if self.since is None:
+            # Only what's published from now on is of interest.
+            self.since = timezone.now()
+            return []
+        cutoff = self.since - timedelta(seconds=self.overlap)
+        self.seen = dict((pk, created) for pk, created in self.seen.items() if created >= cutoff)
+        events = self.model.objects.filter(created__gte=cutoff)
+        if self.seen:
+            events = events.exclude(id__in=list(self.seen))
+        events = list(events.order_by('created', 'id')[:self.batch_size])
+        for event in events:
+            self.seen[event.id] = event.created
+            self.since = max(self.since, event.created)
+        return [Invalidation(event.kind, None if event.everything else json.loads(event.keys), event.origin)
+                for event in events]
+
+
+class RedisTransport(object):
+    """
+    Publishes invalidations on a Redis channel; a background thread
+    collects what other processes publish until the next poll.
+    """
+    poll_interval = 0
+
+    def __init__(self, url=ACCOUNT_INVALIDATION_REDIS_URL, channel=ACCOUNT_INVALIDATION_REDIS_CHANNEL):
+        if redis is None:
+            raise ImproperlyConfigured("RedisTransport requires the redis package.")
+        self.client = redis.StrictRedis.from_url(url)
+        self.channel = channel
+        self.queue = deque()
+        self.thread = None
+
+    def publish(self, invalidation):
+        self.client.publish(self.channel, invalidation.to_json())
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    self.queue.append(Invalidation.from_json(message['data'].decode('utf-8')))
+            except Exception:
+                logger.exception("Lost the invalidation channel, reconnecting")
+                # Whatever was published meanwhile is lost, so drop it all.
+                self.queue.append(None)
+                time.sleep(1)
+
+    def forked(self):
+        self.queue.clear()
+        self.thread = None
+
+    def receive(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.listen, name='account-invalidation')
+            self.thread.daemon = True
+            self.thread.start()
+        messages = []
+        while self.queue:
+            messages.append(self.queue.popleft())
+        return messages
+
+
+class InvalidationBus(object):
+    def __init__(self, transport=None):
+        self.pid = os.getpid()
+        self.origin = uuid.uuid4().hex
+        self.transport = transport if transport is not None else import_string(ACCOUNT_INVALIDATION_TRANSPORT)()
+        self.handlers = defaultdict(list)
+        self.polled_at = 0
+        self.lock = threading.Lock()
+
+    def check_fork(self):
+        # Workers forked from a preloaded master must not share its origin,
+        # or they would ignore each other's invalidations.
+        if os.getpid() != self.pid:
+            self.pid = os.getpid()
+            self.origin = uuid.uuid4().hex
+            if hasattr(self.transport, 'forked'):
+                self.transport.forked()
+
+    def subscribe(self, kind, handler):
+        """
+        Calls ``handler(keys)`` for every invalidation of ``kind`` published
+        by another process; ``keys`` is ``None`` for everything.
+        """
+        if handler not in self.handlers[kind]:
+            self.handlers[kind].append(handler)
+
+    def publish(self, kind, keys=None):
+        self.check_fork()
+        try:
+            self.transport.publish(Invalidation(kind, keys, self.origin))
+        except Exception:
+            # Other processes catch up when their caches expire.
+            logger.exception("Could not publish the invalidation of %s %s", kind, keys)
+
+    def dispatch(self, invalidation):
+        for handler in self.handlers[invalidation.kind]:
+            try:
+                handler(invalidation.keys)
+            except Exception:
+                logger.exception("Invalidation handler %r failed for %r", handler, invalidation)
+
+    def invalidate_everything(self):
+        for kind in list(self.handlers):
+            self.dispatch(Invalidation(kind))
+
+    def poll(self, force=False):
+        """
+        Applies the invalidations published by other processes since the
+        previous poll; without ``force``, at most once per the transport's
+        poll interval.
+        """
+        now = time.time()
+        if not force and now - self.polled_at < self.transport.poll_interval:
+            return 0
+        self.check_fork()
+        if not self.lock.acquire(False):
+            # Another thread is polling already.
+            return 0
+        try:
+            self.polled_at = now
+            try:
+                messages = self.transport.receive()
+            except DatabaseError:
+                logger.exception("Could not poll for invalidations")
+                return 0
+            for invalidation in messages:
+                if invalidation is None:
+                    self.invalidate_everything()
+                elif invalidation.origin != self.origin:
+                    self.dispatch(invalidation)
+            return len(messages)
+        finally:
+            self.lock.release()
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_bus():
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                _bus = InvalidationBus()
+    return _bus
+
+
+def publish_changed_users(sender, pks, remote=False, **kwargs):
+    if not remote:
+        get_bus().publish('user', pks)
+
+
+def publish_changed_groups(sender, pks, remote=False, **kwargs):
+    if not remote:
+        get_bus().publish('group', pks)
+
+
+# Invalidations from other processes are replayed as the signals they came
+# from, so every receiver of users_changed and groups_changed also covers
+# changes made elsewhere. Receivers need the keys; a lost channel is
+# covered by the cache timeouts instead.
+
+def resend_changed_users(keys):
+    from .signals import users_changed
+    if keys is not None:
+        users_changed.send(sender=InvalidationBus, pks=keys, remote=True)
+
+
+def resend_changed_groups(keys):
+    from .signals import groups_changed
+    if keys is not None:
+        groups_changed.send(sender=InvalidationBus, pks=keys, remote=True)
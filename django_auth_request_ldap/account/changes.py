@@ -0,0 +1,104 @@
+from django.db import connections, router
+from django.utils.encoding import force_text
+
+import ldap
+
+
+class ChangeFeed(object):
+    """
+    Follows the changes to the entries of an LDAP model by polling the
+    operational ``modifyTimestamp`` attribute, so edits made directly in
+    LDAP (bypassing ``save()``) are noticed as well.
+
+    ``modifyTimestamp`` has a resolution of one second and the search is
+    inclusive, so entries changed in the same second as the previous poll
+    are reported again; consumers must treat changes idempotently.
+    Removed entries never show up in a timestamp search, which is what
+    ``keys()`` is for.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.last_seen = None
+
+    @property
+    def connection(self):
+        # Always the primary; a lagging replica could report changes with a
+        # timestamp from before the previous poll, which would be missed.
+        return connections[router.db_for_write(self.model)]
+
+    @property
+    def key_attribute(self):
+        return self.model._meta.pk.db_column
+
+    def object_filter(self):
+        return ''.join('(objectClass=%s)' % x for x in self.model.object_classes)
+
+    def search(self, filterstr, attrlist):
+        scope = getattr(self.model, 'search_scope', ldap.SCOPE_SUBTREE)
+        return self.connection.search_s(self.model.base_dn, scope, filterstr, attrlist)
+
+    def _key(self, attrs):
+        values = attrs.get(self.key_attribute)
+        if values:
+            return self.model._meta.pk.to_python(force_text(values[0]))
+        return None
+
+    def _keys_from(self, results):
+        return set(key for key in (self._key(attrs) for dn, attrs in results) if key is not None)
+
+    def poll_entries(self, attributes=()):
+        """
+        Returns ``(pk, attributes)`` for every entry modified since the
+        previous poll, with the requested (raw) attributes; the first poll
+        returns every entry.
+        """
+        filterstr = self.object_filter()
+        if self.last_seen is not None:
+            filterstr += '(modifyTimestamp>=%s)' % self.last_seen
+        results = self.search('(&%s)' % filterstr, [self.key_attribute, 'modifyTimestamp'] + list(attributes))
+        entries = []
+        for dn, attrs in results:
+            # Generalized time compares correctly as a string, and using the
+            # server's own timestamps keeps us clear of clock skew.
+            stamp = force_text(attrs.get('modifyTimestamp', [''])[0])
+            if stamp and (self.last_seen is None or stamp > self.last_seen):
+                self.last_seen = stamp
+            key = self._key(attrs)
+            if key is not None:
+                entries.append((key, attrs))
+        return entries
+
+    def poll(self):
+        """
+        Returns the primary keys of all entries modified since the previous
+        poll; the first poll returns every entry.
+        """
+        return set(key for key, attrs in self.poll_entries())
+
+    def attribute_map(self, attribute, filterstr=''):
+        """
+        Returns a mapping of (the first value of) ``attribute`` to primary
+        key, for all entries or those matching the extra ``filterstr``.
+        """
+        results = self.search('(&%s%s)' % (self.object_filter(), filterstr), [self.key_attribute, attribute])
+        mapping = {}
+        for dn, attrs in results:
+            key = self._key(attrs)
+            if key is not None and attrs.get(attribute):
+                mapping[force_text(attrs[attribute][0])] = key
+        return mapping
+
+    def keys(self):
+        """
+        Returns the primary keys of every entry currently present.
+        """
+        return self._keys_from(self.search('(&%s)' % self.object_filter(), [self.key_attribute]))
+
+    def fetch(self, keys, chunk_size=100):
+        """
+        Loads the instances for ``keys``, a chunk at a time.
+        """
+        keys = list(keys)
+        for offset in range(0, len(keys), chunk_size):
+            for obj in self.model.objects.filter(pk__in=keys[offset:offset + chunk_size]):
+                yield obj
@@ -1,7 +1,7 @@
 from django import forms
 from django.conf import settings
-from django.db import models, router
-from django.db.models import fields, SubfieldBase
+from django.db import models
+from django.db.models import fields, Q, SubfieldBase
 try:
     from django.db.models.related import PathInfo
 except ImportError:
@@ -14,13 +14,20 @@ from django.utils.functional import cached_property
 from ldapdb import escape_ldap_filter
 from ldapdb.models.fields import ListField, IntegerField as LDAPIntegerField
 
+from functools import reduce
 import calendar
+import copy
 import datetime
+import operator
 
+from .replicas import is_ldap_alias
 from .utils import LDAP_DN_SUFFIX
 
 LDAP_LIST_DEFAULT = getattr(settings, 'LDAP_LIST_DEFAULT', None) or ('cn=admin,%s' % LDAP_DN_SUFFIX)
 
+# Keeps the OR-filters of prefetch searches to a size servers accept.
+PREFETCH_CHUNK_SIZE = 100
+
 
 class DateTimeField(fields.DateTimeField):
     def from_ldap(self, value, connection):
@@ -116,7 +123,7 @@ class DefaultListField(ListField):
         return super(DefaultListField, self).formfield(**defaults)
 
 
-def create_related_manager(from_model, from_field_name, to_model, to_field_name):  # noqa
+def create_related_manager(from_model, from_field_name, to_model, to_field_name, cache_name=None):  # noqa
     class RelatedManager(models.Manager):
         def __init__(self, instance):
             super(RelatedManager, self).__init__()
@@ -124,15 +131,51 @@ def create_related_manager(from_model, from_field_name, to_model, to_field_name)
             self.model = to_model
 
         def __call__(self, **kwargs):
-            manager = create_related_manager(from_model, from_field_name, to_model, to_field_name)
+            manager = create_related_manager(from_model, from_field_name, to_model, to_field_name, cache_name)
             return manager(self.instance)
         do_not_call_in_templates = True
 
         def get_queryset(self):
+            try:
+                return self.instance._prefetched_objects_cache[cache_name]
+            except (AttributeError, KeyError):
+                pass
             qs = super(RelatedManager, self).get_queryset()
             qs = qs.filter(**{"%s__contains" % to_field_name: getattr(self.instance, from_field_name)})
             return qs
 
+        def get_prefetch_queryset(self, instances, queryset=None):
+            """
+            Supports ``prefetch_related()``: finds the related objects of all
+            ``instances`` with one search per ``PREFETCH_CHUNK_SIZE``
+            instances, rather than one search each.
+
+            An object related to several instances is returned once for each
+            of them, as a copy keyed on the instance it belongs to.
+            """
+            if queryset is None:
+                queryset = super(RelatedManager, self).get_queryset()
+            # LDAP compares DNs without regard to case.
+            keys = dict((getattr(instance, from_field_name).lower(), getattr(instance, from_field_name))
+                        for instance in instances if getattr(instance, from_field_name))
+            related = []
+            values = list(keys.values())
+            for offset in range(0, len(values), PREFETCH_CHUNK_SIZE):
+                chunk = values[offset:offset + PREFETCH_CHUNK_SIZE]
+                condition = reduce(operator.or_, [Q(**{"%s__contains" % to_field_name: key}) for key in chunk])
+                for obj in queryset.filter(condition):
+                    for value in getattr(obj, to_field_name):
+                        key = keys.get(value.lower())
+                        if key is not None:
+                            item = copy.copy(obj)
+                            item._prefetch_key = key
+                            related.append(item)
+            return (related, operator.attrgetter('_prefetch_key'), operator.attrgetter(from_field_name), False,
+                    cache_name)
+
+        def _forget_prefetched(self):
+            getattr(self.instance, '_prefetched_objects_cache', {}).pop(cache_name, None)
+
         def _clear(self, commit=True):
             key = getattr(self.instance, from_field_name)
             affected = []
@@ -146,6 +189,7 @@ def create_related_manager(from_model, from_field_name, to_model, to_field_name)
             return affected
 
         def clear(self):
+            self._forget_prefetched()
             self._clear()
 
         def _add(self, objs, commit=True):
@@ -161,6 +205,7 @@ def create_related_manager(from_model, from_field_name, to_model, to_field_name)
             return affected
 
         def add(self, *objs):
+            self._forget_prefetched()
             self._add(objs)
 
         def _remove(self, objs, commit=True):
@@ -176,6 +221,7 @@ def create_related_manager(from_model, from_field_name, to_model, to_field_name)
             return affected
 
         def remove(self, *objs):
+            self._forget_prefetched()
             self._remove(objs)
 
         def set(self, *objs):
@@ -184,6 +230,7 @@ def create_related_manager(from_model, from_field_name, to_model, to_field_name)
             if it fails, nothing is comitted..
             also, this prevents groups from being saved twice.
             """
+            self._forget_prefetched()
             cleared = self._clear(commit=False)
             new = self._add(objs, commit=False)
             for item in cleared:
@@ -196,15 +243,16 @@ def create_related_manager(from_model, from_field_name, to_model, to_field_name)
 
 
 class RelatedObjectsDescriptor(DeferredAttribute):
-    def __init__(self, model, to, to_field_name, from_field_name='dn'):
+    def __init__(self, model, to, to_field_name, from_field_name='dn', name=None):
         self.model = model
         self.from_field_name = from_field_name
         self.to = to
         self.to_field_name = to_field_name
+        self.name = name
 
     @cached_property
     def related_manager_cls(self):
-        return create_related_manager(self.model, self.from_field_name, self.to, self.to_field_name)
+        return create_related_manager(self.model, self.from_field_name, self.to, self.to_field_name, self.name)
 
     def __get__(self, instance, instance_type=None):
         if instance is None:
@@ -242,7 +290,8 @@ class SimpleRelationField(RelatedField):
         super(SimpleRelationField, self).contribute_to_class(cls, name)
         cls._meta.local_fields.remove(self)
         cls._meta.virtual_fields.append(self)
-        setattr(cls, self.attname, RelatedObjectsDescriptor(cls, self.to, self.to_field_name, self.from_field_name))
+        setattr(cls, self.attname, RelatedObjectsDescriptor(cls, self.to, self.to_field_name, self.from_field_name,
+                                                            self.name))
 
     def contribute_to_related_class(self, cls, name):
         pass
@@ -320,7 +369,7 @@ class IntField(LDAPIntegerField):
                            prepared=False):
         "Returns field's value prepared for database lookup."
         prepped = self.get_prep_lookup(lookup_type, value)
-        if connection.alias != router.db_for_read(self.model):
+        if not is_ldap_alias(connection.alias):
             if isinstance(prepped, (list, tuple)):
                 return prepped
         return [prepped]
@@ -334,7 +383,7 @@ class IntField(LDAPIntegerField):
         # if we then have a relation from a normal SQL database (and seriously, it
         # is a tricky thing to do.. with constraints and all), like with a foreignkey
         # .. it will save normally.
-        if connection.alias != router.db_for_read(self.model):
+        if not is_ldap_alias(connection.alias):
             return str(value)
         return [str(value)]
 
@@ -2,13 +2,14 @@ from django import forms
 from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm as DJ_UserCreationForm
 from django.contrib.admin.widgets import FilteredSelectMultiple
+from django.core.exceptions import ImproperlyConfigured
 from django.utils.translation import ugettext as __, ugettext_lazy as _
 from django.utils.encoding import smart_str
 from django.utils.safestring import mark_safe
 from django.forms.util import flatatt
 
 from .models import User, Group
-from .utils import PermissionsIterator
+from .utils import permission_catalog
 
 try:
     from suit.widgets import SuitSplitDateTimeWidget
@@ -24,6 +25,15 @@ if SUIT_ENABLED:
 else:
     user_widgets = {}
 
+try:
+    from django_select2 import AutoSelect2MultipleField, AutoHeavySelect2MultipleWidget, NO_ERR_RESP
+    SELECT2_ENABLED = 'django_select2' in settings.INSTALLED_APPS
+except ImportError:
+    SELECT2_ENABLED = False
+
+ACCOUNT_PERMISSION_SEARCH = getattr(settings, 'ACCOUNT_PERMISSION_SEARCH', SELECT2_ENABLED)
+ACCOUNT_PERMISSION_SEARCH_PAGE_SIZE = getattr(settings, 'ACCOUNT_PERMISSION_SEARCH_PAGE_SIZE', 25)
+
 
 class ReadOnlyPasswordHashWidget(forms.Widget):
     def render(self, name, value, attrs):
@@ -51,9 +61,39 @@ class ReadOnlyPasswordHashField(forms.Field):
         super(ReadOnlyPasswordHashField, self).__init__(*args, **kwargs)
 
 
+if SELECT2_ENABLED:
+    class PermissionChoices(AutoSelect2MultipleField):
+        """
+        Permissions searched server-side, so pages don't have to ship every
+        permission as an ``<option>``.
+        """
+        def security_check(self, request, *args, **kwargs):
+            return request.user.is_active and request.user.is_staff
+
+        def get_results(self, request, term, page, context):
+            size = ACCOUNT_PERMISSION_SEARCH_PAGE_SIZE
+            results, has_more = permission_catalog.search(term, (page - 1) * size, size)
+            return NO_ERR_RESP, has_more, results
+
+        def validate_value(self, value):
+            return value in permission_catalog
+
+        def get_val_txt(self, value):
+            return permission_catalog.get_label(value)
+
+
+def permissions_field():
+    if ACCOUNT_PERMISSION_SEARCH:
+        if not SELECT2_ENABLED:
+            raise ImproperlyConfigured("ACCOUNT_PERMISSION_SEARCH requires django_select2 in INSTALLED_APPS.")
+        return PermissionChoices(required=False, widget=AutoHeavySelect2MultipleWidget(
+            select2_options={'width': '440px', 'placeholder': 'Find permission ...'}))
+    return forms.MultipleChoiceField(choices=permission_catalog, required=False,
+                                     widget=FilteredSelectMultiple('permissions', False, attrs={'rows': 10}))
+
+
 class GroupEditForm(forms.ModelForm):
-    permissions = forms.MultipleChoiceField(choices=PermissionsIterator(), required=False,
-                                            widget=FilteredSelectMultiple('permissions', False, attrs={'rows': 10}))
+    permissions = permissions_field()
 
     def __init__(self, *args, **kwargs):
         instance = kwargs.get('instance', None)
@@ -65,8 +105,7 @@ class GroupEditForm(forms.ModelForm):
 class UserChangeForm(forms.ModelForm):
     groups = forms.ModelMultipleChoiceField(queryset=Group.objects.all(), required=False,
                                             widget=FilteredSelectMultiple('groups', False, attrs={'rows': '10'}))
-    permissions = forms.MultipleChoiceField(choices=PermissionsIterator(), required=False,
-                                            widget=FilteredSelectMultiple('permissions', False, attrs={'rows': 10}))
+    permissions = permissions_field()
     password = ReadOnlyPasswordHashField(label=_("Password"),
                                          help_text=_("Raw passwords are not stored, so there is no way to see "
                                                      "this user's password, but you can change the password "
@@ -114,8 +153,8 @@ class UserCreationForm(DJ_UserCreationForm):
 
 
 class GroupCreationForm(forms.ModelForm):
-    permissions = forms.MultipleChoiceField(choices=PermissionsIterator(), required=False,
-                                            widget=FilteredSelectMultiple('permissions', False, attrs={'rows': 10}))
+    permissions = permissions_field()
+
     class Meta:
         fields = ['name', 'permissions']
         model = Group
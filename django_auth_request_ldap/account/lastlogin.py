@@ -0,0 +1,104 @@
+"""
+Write-behind updates of ``last_login``.
+
+Django's ``update_last_login`` saves the whole user on every login, which
+means a ``SambaDomainName`` search and a full LDAP modify before the login
+response goes out. Instead, logins are queued per user (a later login
+replaces an earlier one that wasn't written yet) and a background thread
+writes them every ``ACCOUNT_LAST_LOGIN_FLUSH_INTERVAL`` seconds, as a
+modify of just ``djangoLastLogon``, at most
+``ACCOUNT_LAST_LOGIN_BATCH_SIZE`` users per connection. Whatever is still
+queued when the process exits is written then.
+
+These writes don't fire ``users_changed``: the last login is no reason to
+drop cached session users, and the read mirror notices the change through
+``modifyTimestamp`` anyway.
+"""
+from django.conf import settings
+from django.db import connections, router
+from django.utils import timezone
+
+import atexit
+import logging
+import threading
+
+import ldap
+
+from .background import BackgroundThread
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_LAST_LOGIN_WRITE_BEHIND = getattr(settings, 'ACCOUNT_LAST_LOGIN_WRITE_BEHIND', True)
+ACCOUNT_LAST_LOGIN_FLUSH_INTERVAL = getattr(settings, 'ACCOUNT_LAST_LOGIN_FLUSH_INTERVAL', 10)
+ACCOUNT_LAST_LOGIN_BATCH_SIZE = getattr(settings, 'ACCOUNT_LAST_LOGIN_BATCH_SIZE', 100)
+
+
+class LastLoginWriter(object):
+    def __init__(self, interval=ACCOUNT_LAST_LOGIN_FLUSH_INTERVAL, batch_size=ACCOUNT_LAST_LOGIN_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.thread = BackgroundThread('account-last-login', self.flush, interval,
+                                       error="Could not write last logins")
+
+    def queue(self, user, when):
+        with self.lock:
+            self.pending[user.pk] = (user.dn, when)
+            full = len(self.pending) >= self.batch_size
+        self.start()
+        if full:
+            self.thread.wake()
+
+    def start(self):
+        self.thread.start()
+
+    def take(self):
+        with self.lock:
+            items = list(self.pending.items())[:self.batch_size]
+            for pk, entry in items:
+                del self.pending[pk]
+        return items
+
+    def requeue(self, items):
+        with self.lock:
+            for pk, entry in items:
+                # Unless the user logged in again meanwhile.
+                self.pending.setdefault(pk, entry)
+
+    def flush(self):
+        """
+        Writes every queued last login; returns the number written.
+        """
+        from .models import User
+        field = User._meta.get_field('last_login')
+        written = 0
+        items = self.take()
+        while items:
+            connection = connections[router.db_for_write(User)]
+            for index, (pk, (dn, when)) in enumerate(items):
+                try:
+                    connection.modify_s(dn, [(ldap.MOD_REPLACE, field.db_column, [field.to_ldap(when)])])
+                    written += 1
+                except ldap.NO_SUCH_OBJECT:
+                    pass
+                except ldap.LDAPError:
+                    # Try again at the next flush.
+                    logger.exception("Could not write the last login of %s", dn)
+                    self.requeue(items[index:])
+                    return written
+            items = self.take()
+        return written
+
+writer = LastLoginWriter()
+atexit.register(writer.flush)
+
+
+def update_last_login(sender, user, **kwargs):
+    """
+    Replaces ``django.contrib.auth.models.update_last_login``.
+    """
+    user.last_login = timezone.now()
+    if ACCOUNT_LAST_LOGIN_WRITE_BEHIND and ACCOUNT_LAST_LOGIN_FLUSH_INTERVAL:
+        writer.queue(user, user.last_login)
+    else:
+        user.save()
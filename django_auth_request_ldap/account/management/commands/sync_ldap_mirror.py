@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+import time
+
+from account.mirror import MirrorSync, staleness
+
+
+class Command(BaseCommand):
+    help = "Keeps the SQL read mirror of LDAP users and groups up to date."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', default=False,
+                            help="Sync once (including a full reconcile) and exit.")
+        parser.add_argument('--interval', type=float, default=10,
+                            help="Seconds between polls for modified entries.")
+        parser.add_argument('--reconcile-every', type=int, default=60,
+                            help="Number of polls between checks for deleted entries.")
+
+    def handle(self, *args, **options):
+        sync = MirrorSync()
+        polls = 0
+        while True:
+            started = time.time()
+            reconcile = options['once'] or polls % options['reconcile_every'] == 0
+            changed, removed = sync.sync(reconcile=reconcile)
+            polls += 1
+            if changed or removed or int(options['verbosity']) > 1:
+                self.stdout.write("synced %d changed, %d removed entries in %.2fs; staleness: %s" % (
+                    changed, removed, time.time() - started, staleness()))
+            if options['once']:
+                return
+            time.sleep(max(0, options['interval'] - (time.time() - started)))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from account.watcher import ChangeWatcher, ACCOUNT_CHANGE_WATCHER_INTERVAL
+
+
+class Command(BaseCommand):
+    help = "Invalidates cached identities, permissions and decisions for entries changed directly in LDAP."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=ACCOUNT_CHANGE_WATCHER_INTERVAL,
+                            help="Seconds between polls for modified entries.")
+
+    def handle(self, *args, **options):
+        ChangeWatcher().run(interval=options['interval'])
@@ -1,10 +1,247 @@
-from django.db import models
+from django.db import connections, models, router
+from django.db.models.query_utils import deferred_class_factory
+from django.utils.encoding import force_text
+
+import ldap
+
+from .mirror import mirror_get
+
+LOOKUP_CHUNK_SIZE = 100
 
 
 class LDAPQuerySet(models.QuerySet):
+    """
+    Answers some queries with searches of its own, rather than through
+    ldapdb's compiler:
+
+    * Plain ``get()`` lookups by key under ``only()``/``defer()`` request
+      just the loaded attributes; the other attributes are loaded from LDAP
+      when they are first accessed (see ``CustomRDNModel.refresh_from_db``).
+    * ``filter(pk__in=...)``, and with it ``in_bulk()`` and the prefetching
+      of relations to LDAP models, is a single OR-filter search per
+      ``LOOKUP_CHUNK_SIZE`` keys.
+    * ``ranked(pks)`` lists the entries in the order of ``pks``, whatever
+      the ordering, for search results that come ranked.
+
+    Other queries still load every attribute.
+    """
+    def __init__(self, *args, **kwargs):
+        super(LDAPQuerySet, self).__init__(*args, **kwargs)
+        # (keys, number of conditions) of a pending pk__in filter.
+        self._pk_in = None
+        self._ranking = None
+        self._use_mirror = True
+
+    def _clone(self, *args, **kwargs):
+        clone = super(LDAPQuerySet, self)._clone(*args, **kwargs)
+        clone._pk_in = self._pk_in
+        clone._ranking = self._ranking
+        clone._use_mirror = self._use_mirror
+        return clone
+
     def using(self, alias):
+        # ldapdb's Model.save() diffs against objects.using(alias).get(),
+        # which must be what is in LDAP, not the read mirror.
+        return self.from_ldap()
+
+    def from_ldap(self):
+        """
+        Never answers from the SQL read mirror.
+        """
+        clone = self._clone()
+        clone._use_mirror = False
+        return clone
+
+    def loaded_fields(self):
+        """
+        The concrete fields loaded under ``only()``/``defer()``, or ``None``
+        when every field is.
+        """
+        names, defer = self.query.deferred_loading
+        if not names:
+            return None
+        opts = self.model._meta
+        # The key and the dn are needed to load the rest, or to save.
+        required = set([opts.pk.attname, 'dn'])
+        return [field for field in opts.concrete_fields
+                if field.attname in required or ((field.name in names) != defer)]
+
+    def object_filter(self):
+        return ''.join('(objectClass=%s)' % x for x in self.model.object_classes)
+
+    def field_filter(self, field, value, connection):
+        if isinstance(value, models.Model):
+            value = value.pk
+        value = field.get_db_prep_lookup('exact', value, connection)[0]
+        return '(%s=%s)' % (field.db_column, force_text(value))
+
+    def lookup_filter(self, lookups, connection):
+        """
+        Turns exact lookups on concrete fields into an LDAP filter; returns
+        ``None`` for anything else.
+        """
+        opts = self.model._meta
+        filterstr = self.object_filter()
+        for lookup, value in lookups.items():
+            if lookup.endswith('__exact'):
+                lookup = lookup[:-len('__exact')]
+            if lookup == 'pk':
+                field = opts.pk
+            else:
+                field = dict((f.name, f) for f in opts.concrete_fields).get(lookup)
+            if field is None or not field.db_column:
+                return None
+            filterstr += self.field_filter(field, value, connection)
+        return '(&%s)' % filterstr
+
+    def from_entry(self, dn, attrs, fields, connection):
+        values = []
+        for field in fields:
+            if field.attname == 'dn':
+                values.append(force_text(dn))
+            elif hasattr(field, 'from_ldap'):
+                values.append(field.from_ldap(attrs.get(field.db_column, []), connection=connection))
+            else:
+                values.append(None)
+        loaded = set(field.attname for field in fields)
+        skip = [field.attname for field in self.model._meta.concrete_fields if field.attname not in loaded]
+        model = deferred_class_factory(self.model, skip) if skip else self.model
+        return model.from_db(connection.alias, [field.attname for field in fields], values)
+
+    def search(self, connection, filterstr, fields=None):
+        """
+        Returns the instances matching ``filterstr``, with just ``fields``
+        (all by default) loaded.
+        """
+        if fields is None:
+            fields = self.model._meta.concrete_fields
+        scope = getattr(self.model, 'search_scope', ldap.SCOPE_SUBTREE)
+        attrlist = [field.db_column for field in fields if field.db_column]
+        results = connection.search_s(self.model.base_dn, scope, filterstr, attrlist)
+        return [self.from_entry(dn, attrs, fields, connection) for dn, attrs in results]
+
+    def selective_get(self, fields, lookups):
+        connection = connections[router.db_for_read(self.model)]
+        filterstr = self.lookup_filter(lookups, connection)
+        if filterstr is None:
+            return None
+        results = self.search(connection, filterstr, fields)
+        if not results:
+            raise self.model.DoesNotExist("%s matching query does not exist." % self.model._meta.object_name)
+        if len(results) > 1:
+            raise self.model.MultipleObjectsReturned("get() returned more than one %s -- it returned %d!" % (
+                self.model._meta.object_name, len(results)))
+        return results[0]
+
+    def get(self, *args, **kwargs):
+        fields = self.loaded_fields()
+        # Plain lookups by key can be answered by the SQL read mirror.
+        if not args and not self.query.where:
+            obj = mirror_get(self.model, kwargs, fields) if self._use_mirror else None
+            if obj is not None:
+                return obj
+            if fields is not None:
+                obj = self.selective_get(fields, kwargs)
+                if obj is not None:
+                    return obj
+        return super(LDAPQuerySet, self.full()).get(*args, **kwargs)
+
+    def full(self):
+        if self.query.deferred_loading[0]:
+            clone = self._clone()
+            clone.query.clear_deferred_loading()
+            return clone
         return self
 
+    def _filter_or_exclude(self, negate, *args, **kwargs):
+        clone = super(LDAPQuerySet, self)._filter_or_exclude(negate, *args, **kwargs)
+        pk_lookups = ('pk__in', '%s__in' % self.model._meta.pk.name)
+        if not negate and not args and len(kwargs) == 1 and list(kwargs)[0] in pk_lookups \
+                and isinstance(list(kwargs.values())[0], (list, tuple, set, frozenset)) and not self.query.where:
+            # The condition stays in the query, for count() and any further
+            # filtering, which makes the search below unusable again.
+            clone._pk_in = (list(list(kwargs.values())[0]), len(clone.query.where.children))
+        return clone
+
+    def can_search_pk_in(self):
+        query = self.query
+        return (self._pk_in is not None and len(query.where.children) == self._pk_in[1] and
+                not query.order_by and not query.extra_order_by and
+                not query.low_mark and query.high_mark is None)
+
+    def search_pk_in(self):
+        keys = self._pk_in[0]
+        connection = connections[router.db_for_read(self.model)]
+        pk_field = self.model._meta.pk
+        fields = self.loaded_fields()
+        found = {}
+        for offset in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+            chunk = keys[offset:offset + LOOKUP_CHUNK_SIZE]
+            filterstr = '(&%s(|%s))' % (self.object_filter(),
+                                        ''.join(self.field_filter(pk_field, key, connection) for key in chunk))
+            for obj in self.search(connection, filterstr, fields):
+                # Overlapping chunks yield every entry once.
+                found.setdefault(obj.pk, obj)
+        return list(found.values())
+
+    def ranked(self, pks):
+        clone = self.filter(pk__in=list(pks))
+        clone._ranking = dict((pk, position) for position, pk in enumerate(pks))
+        return clone
+
+    def search_ranked(self):
+        query = self.query
+        low_mark, high_mark = query.low_mark, query.high_mark
+        clone = self._clone()
+        clone._ranking = None
+        clone.query.clear_ordering(force_empty=True)
+        clone.query.clear_limits()
+        results = sorted(clone.iterator(), key=lambda obj: self._ranking.get(obj.pk, len(self._ranking)))
+        return results[low_mark:high_mark]
+
+    def iterator(self):
+        if self._ranking is not None:
+            return iter(self.search_ranked())
+        if self.can_search_pk_in():
+            return iter(self.search_pk_in())
+        # Searches of ldapdb's own always load every attribute.
+        if self.query.deferred_loading[0]:
+            return self.full().iterator()
+        return super(LDAPQuerySet, self).iterator()
+
 
 class LDAPManager(models.Manager.from_queryset(LDAPQuerySet)):
     pass
+
+
+class LogEntryQuerySet(models.QuerySet):
+    def select_related(self, *args):
+        prefetch_user = False
+        if 'user' in args:
+            args = [x for x in args if x != 'user']
+            prefetch_user = True
+        elif len(args) == 0:
+            args = ['content_type']
+            prefetch_user = True
+        qs = super(LogEntryQuerySet, self).select_related(*args)
+        if prefetch_user:
+            qs = qs.prefetch_related('user')
+        return qs
+
+
+def patch_log_entry_manager():
+    """
+    The admin log can't join against users stored in LDAP, so swap in a
+    manager that prefetches them instead. Called from AccountConfig.ready
+    rather than at import time of account.admin.
+    """
+    from django.contrib.admin.models import LogEntryManager, LogEntry
+
+    if getattr(LogEntry.objects, '_account_patched', False):
+        return
+
+    class LogEntryQuerySetManager(LogEntryManager.from_queryset(LogEntryQuerySet)):
+        _account_patched = True
+
+    LogEntry.objects = LogEntryQuerySetManager()
+    LogEntry.objects.contribute_to_class(LogEntry, 'objects')
@@ -0,0 +1,36 @@
+from django.contrib.auth import SESSION_KEY
+
+import time
+
+from .bus import get_bus
+from .sessions import ACCOUNT_SESSION_REFRESH_INTERVAL, SESSION_REFRESHED_KEY
+
+
+class SessionRefreshMiddleware(object):
+    """
+    Extends the expiry of authenticated sessions at most once every
+    ``ACCOUNT_SESSION_REFRESH_INTERVAL`` seconds, instead of saving the
+    session on every request like ``SESSION_SAVE_EVERY_REQUEST`` does.
+
+    Must come after ``SessionMiddleware``.
+    """
+    def process_request(self, request):
+        session = request.session
+        if SESSION_KEY not in session:
+            return None
+        now = int(time.time())
+        refreshed = session.get(SESSION_REFRESHED_KEY)
+        if refreshed is None or now - refreshed >= ACCOUNT_SESSION_REFRESH_INTERVAL:
+            # Marks the session as modified, so it's saved with a new expiry.
+            session[SESSION_REFRESHED_KEY] = now
+        return None
+
+
+class InvalidationMiddleware(object):
+    """
+    Applies the invalidations published by other processes before the
+    request uses any cache; see account.bus.
+    """
+    def process_request(self, request):
+        get_bus().poll()
+        return None
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_remove_fk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MirroredGroup',
+            fields=[
+                ('gid', models.IntegerField(serialize=False, primary_key=True)),
+                ('dn', models.CharField(unique=True, max_length=255)),
+                ('name', models.CharField(unique=True, max_length=200)),
+                ('description', models.CharField(max_length=200, blank=True)),
+                ('permissions', models.TextField(blank=True)),
+                ('synced_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MirroredUser',
+            fields=[
+                ('id', models.IntegerField(serialize=False, primary_key=True)),
+                ('dn', models.CharField(unique=True, max_length=255)),
+                ('username', models.CharField(unique=True, max_length=200)),
+                ('first_name', models.CharField(max_length=200, blank=True)),
+                ('last_name', models.CharField(max_length=200, blank=True)),
+                ('full_name', models.CharField(max_length=400, blank=True)),
+                ('email', models.CharField(max_length=254, blank=True)),
+                ('password', models.CharField(max_length=200, blank=True)),
+                ('group', models.IntegerField(default=65534)),
+                ('home_directory', models.CharField(max_length=255, blank=True)),
+                ('login_shell', models.CharField(max_length=255, blank=True)),
+                ('is_staff', models.BooleanField(default=False)),
+                ('is_superuser', models.BooleanField(default=False)),
+                ('is_active', models.BooleanField(default=True)),
+                ('date_joined', models.DateTimeField(null=True)),
+                ('last_login', models.DateTimeField(null=True)),
+                ('user_permissions', models.TextField(blank=True)),
+                ('synced_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MirroredMembership',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('member_dn', models.CharField(max_length=255, db_index=True)),
+                ('group', models.ForeignKey(related_name='memberships', to='account.MirroredGroup')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MirrorState',
+            fields=[
+                ('model', models.CharField(max_length=100, serialize=False, primary_key=True)),
+                ('last_seen', models.CharField(max_length=32, blank=True)),
+                ('synced_at', models.DateTimeField(null=True)),
+                ('reconciled_at', models.DateTimeField(null=True)),
+                ('entries', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='mirroredmembership',
+            unique_together=set([('group', 'member_dn')]),
+        ),
+    ]
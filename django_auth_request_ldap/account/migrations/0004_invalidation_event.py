@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0003_read_mirror'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvalidationEvent',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('origin', models.CharField(max_length=32)),
+                ('kind', models.CharField(max_length=32)),
+                ('keys', models.TextField(blank=True)),
+                ('everything', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0004_invalidation_event'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='mirroreduser',
+            name='password',
+        ),
+    ]
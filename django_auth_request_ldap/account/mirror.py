@@ -0,0 +1,245 @@
+"""
+An optional SQL read mirror of the LDAP users, groups and memberships.
+
+``manage.py sync_ldap_mirror`` keeps the mirror tables current by
+following each model's ``ChangeFeed``. With ``ACCOUNT_READ_MIRROR``
+enabled, unfiltered ``User.objects.get()``/``Group.objects.get()`` lookups
+and ``User.get_groups()`` are answered from the mirror, as long as it was
+synced less than ``ACCOUNT_READ_MIRROR_MAX_STALENESS`` seconds ago; anything
+else, and every write, still goes to LDAP. Password hashes aren't mirrored;
+the attributes that aren't are loaded from LDAP when first accessed.
+"""
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models.query_utils import deferred_class_factory
+from django.utils import timezone
+
+import logging
+import time
+
+from .changes import ChangeFeed
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_READ_MIRROR = getattr(settings, 'ACCOUNT_READ_MIRROR', False)
+ACCOUNT_READ_MIRROR_MAX_STALENESS = getattr(settings, 'ACCOUNT_READ_MIRROR_MAX_STALENESS', 300)
+ACCOUNT_READ_MIRROR_STATE_CHECK = getattr(settings, 'ACCOUNT_READ_MIRROR_STATE_CHECK', 5)
+
+# User fields copied into the mirror, by mirror column name; the rest of
+# the LDAP attributes are deferred on mirrored users.
+MIRRORED_USER_FIELDS = {
+    'id': 'id',
+    'dn': 'dn',
+    'username': 'username',
+    'first_name': 'first_name',
+    'last_name': 'last_name',
+    'full_name': '_full_name',
+    'email': 'email',
+    'group': 'group',
+    'home_directory': 'home_directory',
+    'login_shell': 'login_shell',
+    'is_staff': 'is_staff',
+    'is_superuser': 'is_superuser',
+    'is_active': 'is_active',
+    'date_joined': 'date_joined',
+    'last_login': 'last_login',
+}
+MIRRORED_GROUP_FIELDS = {
+    'gid': 'gid',
+    'dn': 'dn',
+    'name': 'name',
+    'description': 'description',
+}
+
+# Lookups that can be answered from the mirror, mapped to mirror columns.
+MIRROR_LOOKUPS = {
+    'User': {'pk': 'id', 'id': 'id', 'username': 'username'},
+    'Group': {'pk': 'gid', 'gid': 'gid', 'name': 'name'},
+}
+
+
+def _models():
+    from .models import User, Group, MirroredUser, MirroredGroup, MirroredMembership, MirrorState
+    return User, Group, MirroredUser, MirroredGroup, MirroredMembership, MirrorState
+
+
+def _label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.model_name)
+
+
+def _join(values):
+    return '\n'.join(values or [])
+
+
+def _split(value):
+    return [x for x in value.split('\n') if x]
+
+
+class MirrorSync(object):
+    """
+    Copies changed users and groups from LDAP into the mirror tables.
+    """
+    def __init__(self):
+        User, Group, MirroredUser, MirroredGroup, MirroredMembership, MirrorState = _models()
+        self.feeds = [ChangeFeed(Group), ChangeFeed(User)]
+        for feed in self.feeds:
+            state = MirrorState.objects.filter(model=_label(feed.model)).first()
+            if state is not None and state.last_seen:
+                feed.last_seen = state.last_seen
+
+    def store_user(self, user):
+        User, Group, MirroredUser, MirroredGroup, MirroredMembership, MirrorState = _models()
+        defaults = dict((column, getattr(user, attname)) for column, attname in MIRRORED_USER_FIELDS.items())
+        defaults['user_permissions'] = _join(user.user_permissions)
+        defaults['synced_at'] = timezone.now()
+        pk = defaults.pop('id')
+        MirroredUser.objects.update_or_create(id=pk, defaults=defaults)
+
+    def store_group(self, group):
+        User, Group, MirroredUser, MirroredGroup, MirroredMembership, MirrorState = _models()
+        defaults = dict((column, getattr(group, attname)) for column, attname in MIRRORED_GROUP_FIELDS.items())
+        defaults['permissions'] = _join(group.permissions)
+        defaults['synced_at'] = timezone.now()
+        pk = defaults.pop('gid')
+        mirrored, created = MirroredGroup.objects.update_or_create(gid=pk, defaults=defaults)
+        members = set(group.members)
+        existing = set(mirrored.memberships.values_list('member_dn', flat=True))
+        mirrored.memberships.filter(member_dn__in=existing - members).delete()
+        MirroredMembership.objects.bulk_create([MirroredMembership(group=mirrored, member_dn=dn)
+                                                for dn in members - existing])
+
+    def sync(self, reconcile=False):
+        """
+        Applies the changes since the previous sync; with ``reconcile``,
+        also removes entries that were deleted from LDAP. Returns the
+        number of changed and removed entries.
+        """
+        User, Group, MirroredUser, MirroredGroup, MirroredMembership, MirrorState = _models()
+        changed = removed = 0
+        for feed in self.feeds:
+            store = self.store_user if feed.model is User else self.store_group
+            mirror_model = MirroredUser if feed.model is User else MirroredGroup
+            previous = feed.last_seen
+            keys = feed.poll()
+            try:
+                with transaction.atomic():
+                    for obj in feed.fetch(keys):
+                        store(obj)
+                        changed += 1
+                    now = timezone.now()
+                    state, created = MirrorState.objects.get_or_create(model=_label(feed.model))
+                    if reconcile:
+                        missing = set(mirror_model.objects.values_list('pk', flat=True)) - feed.keys()
+                        mirror_model.objects.filter(pk__in=missing).delete()
+                        removed += len(missing)
+                        state.reconciled_at = now
+                    state.last_seen = feed.last_seen or ''
+                    state.synced_at = now
+                    state.entries = mirror_model.objects.count()
+                    state.save()
+            except Exception:
+                # Nothing was stored, so the next sync asks for the same changes.
+                feed.last_seen = previous
+                raise
+        return changed, removed
+
+
+def staleness():
+    """
+    Returns the number of seconds since each mirrored model was last
+    synced, or ``None`` for models that were never synced.
+    """
+    User, Group, MirroredUser, MirroredGroup, MirroredMembership, MirrorState = _models()
+    states = dict((x.model, x) for x in MirrorState.objects.all())
+    now = timezone.now()
+    result = {}
+    for model in (User, Group):
+        state = states.get(_label(model))
+        if state is None or state.synced_at is None:
+            result[_label(model)] = None
+        else:
+            result[_label(model)] = (now - state.synced_at).total_seconds()
+    return result
+
+_fresh = {'checked_at': None, 'fresh': False}
+
+
+def mirror_available():
+    if not ACCOUNT_READ_MIRROR:
+        return False
+    now = time.time()
+    if _fresh['checked_at'] is None or now - _fresh['checked_at'] >= ACCOUNT_READ_MIRROR_STATE_CHECK:
+        ages = staleness().values()
+        fresh = all(age is not None and age <= ACCOUNT_READ_MIRROR_MAX_STALENESS for age in ages)
+        if _fresh['fresh'] and not fresh:
+            logger.warning("LDAP read mirror is stale (%s), reading from LDAP", ages)
+        _fresh.update(checked_at=now, fresh=fresh)
+    return _fresh['fresh']
+
+
+def _mirrored_instance(model, values):
+    # What isn't mirrored is deferred, and loaded from LDAP when accessed.
+    fields = model._meta.concrete_fields
+    skip = [field.attname for field in fields if field.attname not in values]
+    names = [field.attname for field in fields if field.attname in values]
+    return (deferred_class_factory(model, skip) if skip else model).from_db(
+        router.db_for_read(model), names, [values[name] for name in names])
+
+
+def user_from_mirror(row):
+    User = _models()[0]
+    values = dict((attname, getattr(row, column)) for column, attname in MIRRORED_USER_FIELDS.items())
+    values['user_permissions'] = _split(row.user_permissions)
+    return _mirrored_instance(User, values)
+
+
+def group_from_mirror(row):
+    Group = _models()[1]
+    values = dict((attname, getattr(row, column)) for column, attname in MIRRORED_GROUP_FIELDS.items())
+    values['permissions'] = _split(row.permissions)
+    return _mirrored_instance(Group, values)
+
+
+def mirrored_attnames(model):
+    User = _models()[0]
+    if model is User:
+        return set(MIRRORED_USER_FIELDS.values()) | set(['user_permissions'])
+    return set(MIRRORED_GROUP_FIELDS.values()) | set(['permissions'])
+
+
+def mirror_get(model, lookups, fields=None):
+    """
+    Answers ``model.objects.get(**lookups)`` from the mirror. Returns
+    ``None`` when the mirror can't answer the lookup, or doesn't have all
+    of ``fields``, so the caller should ask LDAP instead.
+    """
+    columns = MIRROR_LOOKUPS.get(model._meta.object_name)
+    if columns is None or len(lookups) != 1 or not mirror_available():
+        return None
+    if fields is not None and not set(field.attname for field in fields) <= mirrored_attnames(model):
+        return None
+    lookup, value = list(lookups.items())[0]
+    if lookup not in columns:
+        return None
+    User, Group, MirroredUser, MirroredGroup, MirroredMembership, MirrorState = _models()
+    if model is User:
+        row = MirroredUser.objects.filter(**{columns[lookup]: value}).first()
+        if row is None:
+            raise model.DoesNotExist("%s matching query does not exist." % model._meta.object_name)
+        return user_from_mirror(row)
+    row = MirroredGroup.objects.filter(**{columns[lookup]: value}).first()
+    if row is None:
+        raise model.DoesNotExist("%s matching query does not exist." % model._meta.object_name)
+    return group_from_mirror(row)
+
+
+def mirror_groups_for(user):
+    """
+    Returns the groups ``user`` is a member of according to the mirror, or
+    ``None`` when the mirror isn't available.
+    """
+    if not mirror_available():
+        return None
+    MirroredGroup = _models()[3]
+    return [group_from_mirror(row) for row in MirroredGroup.objects.filter(memberships__member_dn=user.dn)]
+
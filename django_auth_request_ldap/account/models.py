@@ -1,19 +1,23 @@
 from django.conf import settings
 from django.core import validators
-from django.db import DEFAULT_DB_ALIAS, router
+from django.db import DEFAULT_DB_ALIAS, models, router
 from django.core.mail import send_mail
 from django.utils.encoding import force_text, python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 from django.utils import timezone
 from ldapdb.models.fields import CharField, ListField
 
-from .utils import process_shells, CustomRDNModel
+from .utils import process_shells, CustomRDNModel, LazyChoices
 from .fields import DefaultListField, BooleanField, SimpleRelationField, DateTimeField, IntField
 from .manager import LDAPManager
+from .permissions import get_compiled_permissions
+from .signals import users_changed, groups_changed
+from .mirror import mirror_groups_for
+from .sessions import credential_fingerprint
 
 LDAP_DN_SUFFIX = getattr(settings, 'LDAP_DN_SUFFIX', '')
 
-AVAILABLE_SHELLS = process_shells(getattr(settings, 'LDAP_SHELLS', [
+AVAILABLE_SHELLS = LazyChoices(process_shells, getattr(settings, 'LDAP_SHELLS', [
     '/bin/bash',
     '/bin/sh',
     '/bin/csh',
@@ -101,8 +105,15 @@ class Group(CustomRDNModel):
             self.description = '.'
 
     def save(self, using=None, *args, **kwargs):
+        self.load_deferred()
         self.check_hidden_fields()
         super(Group, self).save(using=using)
+        groups_changed.send(sender=self.__class__, pks=[self.pk])
+
+    def delete(self, using=None):
+        pk = self.pk
+        super(Group, self).delete(using=using)
+        groups_changed.send(sender=self.__class__, pks=[pk])
 
     def __str__(self):
         return self.name
@@ -229,13 +240,34 @@ class User(CustomRDNModel):
             self.home_directory = '/home/%s' % self.username
 
     def save(self, using=None, *args, **kwargs):
+        self.load_deferred()
         self.check_hidden_fields()
         self.check_values()
         super(User, self).save(using=using)
+        self._perm_cache = None
+        users_changed.send(sender=self.__class__, pks=[self.pk])
+
+    def delete(self, using=None):
+        pk = self.pk
+        super(User, self).delete(using=using)
+        users_changed.send(sender=self.__class__, pks=[pk])
 
     def get_username(self):
         return getattr(self, self.USERNAME_FIELD)
 
+    def get_groups(self):
+        """
+        The groups this user is a member of, read from the SQL mirror when
+        it is enabled and fresh.
+        """
+        groups = getattr(self, '_groups_cache', None)
+        if groups is None:
+            groups = mirror_groups_for(self)
+            if groups is None:
+                groups = list(self.groups.all())
+            self._groups_cache = groups
+        return groups
+
     def is_anonymous(self):
         return False
 
@@ -282,45 +314,45 @@ class User(CustomRDNModel):
         password = force_text(password)
         db_alias = router.db_for_read(self.__class__) or DEFAULT_DB_ALIAS
         import ldap
+        from .breaker import ACCOUNT_LDAP_TIMEOUT, get_breaker
         conn = ldap.initialize(settings.DATABASES[db_alias]['NAME'])
+        conn.set_option(ldap.OPT_NETWORK_TIMEOUT, ACCOUNT_LDAP_TIMEOUT)
+        conn.set_option(ldap.OPT_TIMEOUT, ACCOUNT_LDAP_TIMEOUT)
         try:
-            conn.bind_s(self.dn, password)
+            get_breaker(db_alias).call(conn.bind_s, self.dn, password)
         except Exception:
             return False
         return True
 
+    def get_session_auth_hash(self):
+        """
+        Sessions are bound to this fingerprint, so changing the password or
+        deactivating the user ends all of their sessions.
+        """
+        return credential_fingerprint(self)
+
+    def get_compiled_permissions(self):
+        compiled = getattr(self, '_perm_cache', None)
+        if compiled is None:
+            compiled = get_compiled_permissions(self)
+            self._perm_cache = compiled
+        return compiled
+
     def get_group_permissions(self, obj=None):
-        permissions = getattr(self, '_group_perm_cache', None)
-        if not permissions:
-            permissions = set()
-            for group in self.groups.all():
-                permissions.update(group.permissions)
-            self._group_perm_cache = permissions
-        return permissions
+        return self.get_compiled_permissions().group_permissions
 
     def get_user_permissions(self, obj=None):
-        permissions = getattr(self, '_user_perm_cache', None)
-        if not permissions:
-            permissions = set()
-            permissions.update(self.permissions)
-            self._user_perm_cache = permissions
-        return permissions
+        return self.get_compiled_permissions().user_permissions
 
     def get_all_permissions(self, obj=None):
-        permissions = getattr(self, '_perm_cache', None)
-        if not permissions:
-            permissions = set()
-            permissions.update(self.get_user_permissions(obj))
-            permissions.update(self.get_group_permissions(obj))
-            self._perm_cache = permissions
-        return permissions
+        return self.get_compiled_permissions().all_permissions
 
     def has_perm(self, perm, obj=None):
         if not self.is_active:
             return False
         if self.is_superuser:
             return True
-        return perm in self.get_all_permissions()
+        return self.get_compiled_permissions().has_perm(perm)
 
     def has_perms(self, perm_list, obj=None):
         for perm in perm_list:
@@ -333,12 +365,67 @@ class User(CustomRDNModel):
             return False
         if self.is_superuser:
             return True
-        for perm in self.get_all_permissions():
-            if perm[:perm.index('.')] == app_label:
-                return True
-        return False
+        return self.get_compiled_permissions().has_module_perms(app_label)
 
     class Meta:
         verbose_name = _('user')
         verbose_name_plural = _('users')
         managed = False
+
+
+# SQL read mirror of the LDAP users and groups; see account.mirror.
+
+class MirroredGroup(models.Model):
+    gid = models.IntegerField(primary_key=True)
+    dn = models.CharField(max_length=255, unique=True)
+    name = models.CharField(max_length=200, unique=True)
+    description = models.CharField(max_length=200, blank=True)
+    permissions = models.TextField(blank=True)
+    synced_at = models.DateTimeField(default=timezone.now)
+
+
+class MirroredUser(models.Model):
+    id = models.IntegerField(primary_key=True)
+    dn = models.CharField(max_length=255, unique=True)
+    username = models.CharField(max_length=200, unique=True)
+    first_name = models.CharField(max_length=200, blank=True)
+    last_name = models.CharField(max_length=200, blank=True)
+    full_name = models.CharField(max_length=400, blank=True)
+    email = models.CharField(max_length=254, blank=True)
+    group = models.IntegerField(default=65534)
+    home_directory = models.CharField(max_length=255, blank=True)
+    login_shell = models.CharField(max_length=255, blank=True)
+    is_staff = models.BooleanField(default=False)
+    is_superuser = models.BooleanField(default=False)
+    is_active = models.BooleanField(default=True)
+    date_joined = models.DateTimeField(null=True)
+    last_login = models.DateTimeField(null=True)
+    user_permissions = models.TextField(blank=True)
+    synced_at = models.DateTimeField(default=timezone.now)
+
+
+class MirroredMembership(models.Model):
+    group = models.ForeignKey(MirroredGroup, related_name='memberships')
+    member_dn = models.CharField(max_length=255, db_index=True)
+
+    class Meta:
+        unique_together = [('group', 'member_dn')]
+
+
+class MirrorState(models.Model):
+    model = models.CharField(max_length=100, primary_key=True)
+    last_seen = models.CharField(max_length=32, blank=True)
+    synced_at = models.DateTimeField(null=True)
+    reconciled_at = models.DateTimeField(null=True)
+    entries = models.IntegerField(default=0)
+
+
+class InvalidationEvent(models.Model):
+    """
+    An invalidation published through ``account.bus.DatabaseTransport``.
+    """
+    origin = models.CharField(max_length=32)
+    kind = models.CharField(max_length=32)
+    keys = models.TextField(blank=True)
+    everything = models.BooleanField(default=False)
+    created = models.DateTimeField(default=timezone.now, db_index=True)
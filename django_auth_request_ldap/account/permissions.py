@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.core.cache import cache
+
+import time
+
+ACCOUNT_PERMISSION_CACHE_TIME = getattr(settings, 'ACCOUNT_PERMISSION_CACHE_TIME', 300)
+
+PERMISSION_EPOCH_KEY = 'account_permission_epoch'
+
+
+class CompiledPermissions(object):
+    """
+    The effective permissions of a single user, compiled once so that
+    has_perm and has_module_perms are simple set lookups.
+    """
+    def __init__(self, user_permissions, group_permissions):
+        self.user_permissions = frozenset(user_permissions)
+        self.group_permissions = frozenset(group_permissions)
+        self.all_permissions = self.user_permissions | self.group_permissions
+        self.app_labels = frozenset(perm.split('.', 1)[0] for perm in self.all_permissions if '.' in perm)
+
+    def has_perm(self, perm):
+        return perm in self.all_permissions
+
+    def has_module_perms(self, app_label):
+        return app_label in self.app_labels
+
+    def __repr__(self):
+        return "<CompiledPermissions: %d permissions>" % len(self.all_permissions)
+
+
+def _new_epoch():
+    # Seeded from the clock, so an epoch lost to eviction isn't handed out
+    # again while permissions may still be cached under it.
+    return int(time.time() * 1000)
+
+
+def get_permission_epoch():
+    epoch = cache.get(PERMISSION_EPOCH_KEY)
+    if epoch is None:
+        # Another worker may beat us to it, in which case we use their value.
+        epoch = _new_epoch()
+        cache.add(PERMISSION_EPOCH_KEY, epoch, None)
+        epoch = cache.get(PERMISSION_EPOCH_KEY, epoch)
+    return epoch
+
+
+def bump_permission_epoch():
+    """
+    Invalidates every compiled permission set at once; called whenever a
+    group changes, as that may affect any number of users.
+    """
+    try:
+        return cache.incr(PERMISSION_EPOCH_KEY)
+    except ValueError:
+        epoch = _new_epoch()
+        cache.set(PERMISSION_EPOCH_KEY, epoch, None)
+        return epoch
+
+
+def _permission_key(epoch, user_pk):
+    return 'account_perms_%s_%s' % (epoch, user_pk)
+
+
+def compile_permissions(user):
+    group_permissions = set()
+    for group in user.get_groups():
+        group_permissions.update(group.permissions)
+    return CompiledPermissions(user.user_permissions or [], group_permissions)
+
+
+def get_compiled_permissions(user):
+    if not ACCOUNT_PERMISSION_CACHE_TIME or user.pk is None:
+        return compile_permissions(user)
+    key = _permission_key(get_permission_epoch(), user.pk)
+    compiled = cache.get(key)
+    if compiled is None:
+        compiled = compile_permissions(user)
+        cache.set(key, compiled, ACCOUNT_PERMISSION_CACHE_TIME)
+    return compiled
+
+
+def invalidate_user_permissions(user_pk):
+    if ACCOUNT_PERMISSION_CACHE_TIME and user_pk is not None:
+        cache.delete(_permission_key(get_permission_epoch(), user_pk))
+
+
+def invalidate_changed_users(sender, pks, remote=False, **kwargs):
+    if not remote:
+        for pk in pks:
+            invalidate_user_permissions(pk)
+
+
+def invalidate_changed_groups(sender, pks, remote=False, **kwargs):
+    if not remote:
+        bump_permission_epoch()
@@ -0,0 +1,209 @@
+"""
+Read replicas for the LDAP models.
+
+Writes always go to the primary, the LDAP alias ldapdb picks (the first
+``ldapdb`` database). Searches are spread over the aliases listed in
+``LDAP_REPLICAS``: every ``LDAP_REPLICA_CHECK_INTERVAL`` seconds a
+background thread times a base search on each replica, over a connection
+of its own that gives up after ``LDAP_REPLICA_PROBE_TIMEOUT`` seconds,
+and reads go to a random healthy replica, weighted by the inverse of its
+average latency. When no replica is healthy, reads fail over to the
+primary. A replica that can't be reached during a read is taken out of
+rotation at once, and the read is retried elsewhere (see
+``account.breaker``).
+
+A thread that wrote to LDAP keeps reading from the primary for
+``LDAP_REPLICA_STICKY_TIME`` seconds, so it sees its own writes despite
+replication lag; ``ReplicaStickinessMiddleware`` carries that over to the
+client's next requests, which may be served by another worker.
+"""
+from django.conf import settings
+
+import logging
+import random
+import threading
+import time
+
+import ldap
+
+from .background import BackgroundThread
+
+logger = logging.getLogger(__name__)
+
+LDAP_REPLICAS = getattr(settings, 'LDAP_REPLICAS', [])
+LDAP_REPLICA_CHECK_INTERVAL = getattr(settings, 'LDAP_REPLICA_CHECK_INTERVAL', 5)
+LDAP_REPLICA_PROBE_TIMEOUT = getattr(settings, 'LDAP_REPLICA_PROBE_TIMEOUT', 2)
+LDAP_REPLICA_STICKY_TIME = getattr(settings, 'LDAP_REPLICA_STICKY_TIME', 10)
+LDAP_REPLICA_STICKY_COOKIE = getattr(settings, 'LDAP_REPLICA_STICKY_COOKIE', 'ldap_primary')
+
+# Weight of the latest probe in the latency average.
+LATENCY_WEIGHT = 0.3
+# Latencies below this don't make a replica any more preferable.
+MIN_LATENCY = 0.001
+
+
+def is_ldap_alias(alias):
+    return settings.DATABASES.get(alias, {}).get('ENGINE') == 'ldapdb.backends.ldap'
+
+
+class Replica(object):
+    def __init__(self, alias):
+        self.alias = alias
+        # Assumed healthy until the first probe says otherwise.
+        self.healthy = True
+        self.latency = None
+        self.failures = 0
+        self.checked_at = None
+
+    def connect(self, timeout=LDAP_REPLICA_PROBE_TIMEOUT):
+        """
+        Opens a connection to the replica like ldapdb does, but bounded by
+        ``timeout``, so a replica that hangs can't stall the probes.
+        """
+        settings_dict = settings.DATABASES[self.alias]
+        connection = ldap.initialize(settings_dict['NAME'])
+        for option, value in settings_dict.get('CONNECTION_OPTIONS', {}).items():
+            connection.set_option(option, value)
+        connection.set_option(ldap.OPT_NETWORK_TIMEOUT, timeout)
+        connection.set_option(ldap.OPT_TIMEOUT, timeout)
+        if settings_dict.get('TLS', False):
+            connection.start_tls_s()
+        connection.simple_bind_s(settings_dict['USER'], settings_dict['PASSWORD'])
+        return connection
+
+    def probe(self):
+        from .utils import LDAP_DN_SUFFIX
+        connection = None
+        try:
+            connection = self.connect()
+            start = time.time()
+            connection.search_s(LDAP_DN_SUFFIX, ldap.SCOPE_BASE, '(objectClass=*)', ['1.1'])
+            elapsed = time.time() - start
+        except Exception:
+            self.mark_failed()
+            logger.warning("LDAP replica %s is down", self.alias, exc_info=True)
+            return False
+        finally:
+            if connection is not None:
+                try:
+                    connection.unbind_s()
+                except ldap.LDAPError:
+                    pass
+        self.latency = elapsed if self.latency is None else (
+            LATENCY_WEIGHT * elapsed + (1 - LATENCY_WEIGHT) * self.latency)
+        if not self.healthy:
+            logger.info("LDAP replica %s is back", self.alias)
+        self.healthy = True
+        self.failures = 0
+        self.checked_at = time.time()
+        return True
+
+    def mark_failed(self):
+        self.healthy = False
+        self.failures += 1
+        self.checked_at = time.time()
+
+    def __repr__(self):
+        return "<Replica: %s %s>" % (self.alias, 'up' if self.healthy else 'down')
+
+
+class ReplicaSet(object):
+    def __init__(self, aliases=LDAP_REPLICAS, interval=LDAP_REPLICA_CHECK_INTERVAL):
+        self.replicas = [Replica(alias) for alias in aliases]
+        self.thread = BackgroundThread('ldap-replicas', self.check, interval,
+                                       error="Could not check the LDAP replicas")
+        self.local = threading.local()
+
+    def start(self):
+        if self.replicas and self.thread.start():
+            # Probe at once rather than after the first interval.
+            self.thread.wake()
+
+    def check(self):
+        for replica in self.replicas:
+            replica.probe()
+
+    def healthy(self):
+        return [replica for replica in self.replicas if replica.healthy]
+
+    def choose(self, primary):
+        """
+        The alias to read from: a random healthy replica, favoring the fast
+        ones, or ``primary`` when this thread is pinned to it or no replica
+        is healthy.
+        """
+        if not self.replicas or self.pinned():
+            return primary
+        self.start()
+        healthy = self.healthy()
+        if not healthy:
+            return primary
+        weights = [1.0 / max(replica.latency or MIN_LATENCY, MIN_LATENCY) for replica in healthy]
+        point = random.uniform(0, sum(weights))
+        for replica, weight in zip(healthy, weights):
+            point -= weight
+            if point <= 0:
+                return replica.alias
+        return healthy[-1].alias
+
+    def is_replica(self, alias):
+        return any(replica.alias == alias for replica in self.replicas)
+
+    def mark_failed(self, alias):
+        """
+        Takes a replica out of rotation until its next successful probe.
+        """
+        for replica in self.replicas:
+            if replica.alias == alias:
+                replica.mark_failed()
+
+    def read_alias(self):
+        """
+        The alias the next search of the LDAP models goes to.
+        """
+        from django.db import router
+        from .models import User
+        return router.db_for_read(User)
+
+    def pin(self, seconds=LDAP_REPLICA_STICKY_TIME):
+        """
+        Reads of this thread go to the primary for ``seconds``.
+        """
+        self.local.pinned_until = max(getattr(self.local, 'pinned_until', 0), time.time() + seconds)
+
+    def written(self):
+        """
+        Called on every write to LDAP: pins this thread to the primary.
+        """
+        self.local.written = True
+        self.pin()
+
+    def unpin(self):
+        self.local.pinned_until = 0
+        self.local.written = False
+
+    def pinned(self):
+        return getattr(self.local, 'pinned_until', 0) > time.time()
+
+    def has_written(self):
+        return getattr(self.local, 'written', False)
+
+replica_set = ReplicaSet()
+
+
+class ReplicaStickinessMiddleware(object):
+    """
+    Pins requests to the LDAP primary while the client's own writes may not
+    have reached the replicas yet.
+    """
+    def process_request(self, request):
+        replica_set.unpin()
+        if LDAP_REPLICA_STICKY_COOKIE in request.COOKIES:
+            replica_set.pin()
+        return None
+
+    def process_response(self, request, response):
+        if replica_set.has_written():
+            response.set_cookie(LDAP_REPLICA_STICKY_COOKIE, '1', max_age=LDAP_REPLICA_STICKY_TIME, httponly=True)
+        replica_set.unpin()
+        return response
@@ -0,0 +1,183 @@
+from django.conf import settings
+from django.utils.encoding import force_text
+
+from collections import defaultdict
+
+import threading
+import time
+
+from .changes import ChangeFeed
+
+ACCOUNT_SEARCH_INDEX = getattr(settings, 'ACCOUNT_SEARCH_INDEX', True)
+ACCOUNT_SEARCH_INDEX_SYNC_INTERVAL = getattr(settings, 'ACCOUNT_SEARCH_INDEX_SYNC_INTERVAL', 60)
+ACCOUNT_SEARCH_INDEX_RECONCILE_INTERVAL = getattr(settings, 'ACCOUNT_SEARCH_INDEX_RECONCILE_INTERVAL', 900)
+ACCOUNT_SEARCH_INDEX_MAX_RESULTS = getattr(settings, 'ACCOUNT_SEARCH_INDEX_MAX_RESULTS', 500)
+
+
+def trigrams(text):
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+class SearchIndex(object):
+    """
+    In-memory trigram index over a few text fields of an LDAP model, kept
+    in sync incrementally through a ``ChangeFeed``.
+
+    Results have the same semantics as an ``icontains`` search over the
+    fields, ranked by how well the best field matches (exact, prefix,
+    word prefix, substring) and by field order.
+    """
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = fields
+        self.feed = ChangeFeed(model)
+        self.documents = {}
+        self.labels = {}
+        self.postings = defaultdict(set)
+        self.lock = threading.RLock()
+        self.synced_at = None
+        self.reconciled_at = None
+
+    def document(self, obj):
+        return tuple(force_text(getattr(obj, field, '') or '').lower() for field in self.fields)
+
+    def _remove(self, pk):
+        document = self.documents.pop(pk, None)
+        self.labels.pop(pk, None)
+        if document is None:
+            return
+        for gram in trigrams(' '.join(document)):
+            posting = self.postings.get(gram)
+            if posting is not None:
+                posting.discard(pk)
+                if not posting:
+                    del self.postings[gram]
+
+    def update(self, obj):
+        with self.lock:
+            self._remove(obj.pk)
+            document = self.document(obj)
+            self.documents[obj.pk] = document
+            self.labels[obj.pk] = force_text(obj)
+            for gram in trigrams(' '.join(document)):
+                self.postings[gram].add(obj.pk)
+
+    def remove(self, pk):
+        with self.lock:
+            self._remove(pk)
+
+    def sync(self, force=False):
+        now = time.time()
+        if not force and self.synced_at is not None and now - self.synced_at < ACCOUNT_SEARCH_INDEX_SYNC_INTERVAL:
+            return
+        with self.lock:
+            self.synced_at = now
+            for obj in self.feed.fetch(self.feed.poll()):
+                self.update(obj)
+            if self.reconciled_at is None or now - self.reconciled_at >= ACCOUNT_SEARCH_INDEX_RECONCILE_INTERVAL:
+                self.reconciled_at = now
+                for pk in set(self.documents) - self.feed.keys():
+                    self._remove(pk)
+
+    def refresh(self, pks):
+        """
+        Reloads the entries ``pks`` (all with ``None``) after another
+        process changed them, dropping those that are gone. Subscribed to
+        the invalidation bus; the feed would only notice on the next sync.
+        """
+        if self.synced_at is None:
+            # Not loaded yet; the first sync reads everything.
+            return
+        if pks is None:
+            with self.lock:
+                self.reconciled_at = None
+                self.sync(force=True)
+            return
+        missing = set(pks)
+        with self.lock:
+            for obj in self.feed.fetch(list(missing)):
+                missing.discard(obj.pk)
+                self.update(obj)
+            for pk in missing:
+                self._remove(pk)
+
+    def rank(self, document, term):
+        best = None
+        for position, value in enumerate(document):
+            if value == term:
+                score = 0
+            elif value.startswith(term):
+                score = 1
+            elif (' ' + term) in value or ('.' + term) in value or ('@' + term) in value:
+                score = 2
+            elif term in value:
+                score = 3
+            else:
+                continue
+            score = (score, position)
+            if best is None or score < best:
+                best = score
+        return best
+
+    def ranked(self, term):
+        """
+        Returns ``(pk, label)`` pairs of every match for ``term``, best first.
+        """
+        self.sync()
+        term = force_text(term).lower().strip()
+        with self.lock:
+            if len(term) >= 3:
+                postings = sorted((self.postings.get(gram, ()) for gram in trigrams(term)), key=len)
+                candidates = set(postings[0]).intersection(*postings[1:]) if postings else set()
+            else:
+                candidates = self.documents.keys()
+            ranked = []
+            for pk in candidates:
+                score = self.rank(self.documents[pk], term)
+                if score is not None:
+                    ranked.append((score, self.labels[pk], pk))
+        ranked.sort()
+        return [(pk, label) for score, label, pk in ranked]
+
+    def search(self, term, offset=0, limit=None):
+        """
+        Returns a list of ``(pk, label)`` pairs for ``term``, and whether
+        more results are available.
+        """
+        if limit is None:
+            limit = ACCOUNT_SEARCH_INDEX_MAX_RESULTS
+        ranked = self.ranked(term)
+        return ranked[offset:offset + limit], len(ranked) > offset + limit
+
+    def __len__(self):
+        return len(self.documents)
+
+
+_indexes = {}
+
+
+def get_search_index(model):
+    """
+    Returns the process-wide search index for ``model``, or ``None`` when
+    it isn't indexed (or indexing is disabled).
+    """
+    if not ACCOUNT_SEARCH_INDEX:
+        return None
+    return _indexes.get(model)
+
+
+def register_search_index(model, fields):
+    _indexes[model] = SearchIndex(model, fields)
+    return _indexes[model]
+
+
+def update_search_index(sender, instance, **kwargs):
+    index = get_search_index(sender)
+    if index is not None and index.synced_at is not None:
+        index.update(instance)
+
+
+def remove_from_search_index(sender, instance, **kwargs):
+    index = get_search_index(sender)
+    if index is not None:
+        index.remove(instance.pk)
@@ -0,0 +1,139 @@
+"""
+Session helpers tuned for auth subrequests, which must be answered without
+touching LDAP or writing the session whenever possible.
+
+The session user is cached in the shared cache and dropped whenever
+``users_changed`` fires, and sessions are validated against a fingerprint
+of the user's credentials (``userPassword`` and ``djangoActive``), so a
+password change or deactivation ends every session of that user. The
+cached user carries the fingerprint rather than the password hash, which
+is loaded from LDAP if it's ever accessed.
+
+A cached user older than ``ACCOUNT_SESSION_USER_CACHE_TIME`` is kept for
+another ``ACCOUNT_SESSION_USER_STALE_TIME`` seconds, and served while LDAP
+is unavailable (see ``account.breaker``).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.query_utils import deferred_class_factory
+from django.utils.crypto import salted_hmac
+
+import copy
+import time
+
+from .breaker import UNAVAILABLE_ERRORS, ldap_degraded, metrics, revalidate
+
+ACCOUNT_SESSION_USER_CACHE_TIME = getattr(settings, 'ACCOUNT_SESSION_USER_CACHE_TIME', 300)
+ACCOUNT_SESSION_USER_STALE_TIME = getattr(settings, 'ACCOUNT_SESSION_USER_STALE_TIME', 3600)
+ACCOUNT_SESSION_REFRESH_INTERVAL = getattr(settings, 'ACCOUNT_SESSION_REFRESH_INTERVAL', 300)
+
+SESSION_REFRESHED_KEY = '_account_refreshed'
+
+# The attributes fetched for the session user; the SSH keys, samba hashes
+# and the like are only loaded from LDAP when accessed. The password is
+# needed for the fingerprint, but isn't cached.
+SESSION_USER_FIELDS = (
+    'id', 'dn', 'username', 'first_name', 'last_name', '_full_name', 'email', 'password',
+    'is_active', 'is_staff', 'is_superuser', 'user_permissions',
+)
+
+
+def credential_fingerprint(user):
+    # A cached session user only has the fingerprint it was cached with.
+    cached = user.__dict__.get('_credential_fingerprint')
+    if cached is not None and 'password' not in user.__dict__ and cached[0] == user.is_active:
+        return cached[1]
+    key_salt = 'account.sessions.credential_fingerprint'
+    return salted_hmac(key_salt, '%s|%s' % (user.password, user.is_active)).hexdigest()
+
+
+def _without_password(user):
+    """
+    A copy of ``user`` with its credential fingerprint, whose password is
+    loaded from LDAP when accessed.
+    """
+    deferred = [field.attname for field in user._meta.concrete_fields if field.attname not in user.__dict__]
+    cached = copy.copy(user)
+    cached._credential_fingerprint = (user.is_active, credential_fingerprint(user))
+    cached.__dict__.pop('password', None)
+    cached.__class__ = deferred_class_factory(user._meta.concrete_model, deferred + ['password'])
+    return cached
+
+
+def public_session_id(session):
+    """
+    A stable identifier for the session that, unlike the session key, can't
+    be used to take the session over.
+    """
+    if not session.session_key:
+        return ''
+    return salted_hmac('account.sessions.public_session_id', session.session_key).hexdigest()
+
+
+def session_user_unavailable(request):
+    """
+    Whether the request carries a logged in session whose user couldn't be
+    loaded because LDAP is unavailable.
+    """
+    from django.contrib.auth import SESSION_KEY
+    return not request.user.is_authenticated() and SESSION_KEY in request.session and ldap_degraded()
+
+
+def _user_key(user_pk):
+    # v2: (user, cached_at) rather than the user alone.
+    return 'account_session_user_v2_%s' % user_pk
+
+
+def fetch_session_user(**lookups):
+    from .models import User
+    return User.objects.only(*SESSION_USER_FIELDS).get(**lookups)
+
+
+def get_session_user(user_pk):
+    """
+    Returns the user for ``user_pk``, from the shared cache if possible;
+    raises ``User.DoesNotExist`` like ``User.objects.get()``.
+
+    Past its cache time the user is fetched again, unless LDAP is
+    unavailable: then the stale user is served and refreshed in the
+    background.
+    """
+    if not ACCOUNT_SESSION_USER_CACHE_TIME:
+        return fetch_session_user(pk=user_pk)
+    cached = cache.get(_user_key(user_pk))
+    if cached is not None:
+        user, cached_at = cached
+        if time.time() - cached_at < ACCOUNT_SESSION_USER_CACHE_TIME:
+            return user
+        if ldap_degraded():
+            metrics['stale_users'] += 1
+            revalidate(_user_key(user_pk), refresh_session_user, user_pk)
+            return user
+    try:
+        user = fetch_session_user(pk=user_pk)
+    except UNAVAILABLE_ERRORS:
+        if cached is None:
+            raise
+        metrics['stale_users'] += 1
+        return cached[0]
+    cache_session_user(user)
+    return user
+
+
+def refresh_session_user(user_pk):
+    from .models import User
+    try:
+        cache_session_user(fetch_session_user(pk=user_pk))
+    except User.DoesNotExist:
+        cache.delete(_user_key(user_pk))
+
+
+def cache_session_user(user):
+    if ACCOUNT_SESSION_USER_CACHE_TIME:
+        cache.set(_user_key(user.pk), (_without_password(user), time.time()),
+                  ACCOUNT_SESSION_USER_CACHE_TIME + ACCOUNT_SESSION_USER_STALE_TIME)
+
+
+def invalidate_session_users(sender, pks, remote=False, **kwargs):
+    if ACCOUNT_SESSION_USER_CACHE_TIME and not remote:
+        cache.delete_many([_user_key(pk) for pk in pks])
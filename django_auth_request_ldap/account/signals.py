@@ -0,0 +1,11 @@
+from django.dispatch import Signal
+
+# Sent with the primary keys of users whose identity, permissions or group
+# memberships may have changed, and of groups that changed, regardless of
+# whether the change was made through the models or directly in LDAP.
+# ``remote`` is set when the change was made in another process and
+# arrived through the invalidation bus. That process has already cleared
+# the shared cache, so receivers that only clear the shared cache ignore
+# remote changes; caches of each process need them.
+users_changed = Signal(providing_args=['pks'])
+groups_changed = Signal(providing_args=['pks'])
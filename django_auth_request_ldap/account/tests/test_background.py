@@ -0,0 +1,52 @@
+from django.test import SimpleTestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import threading
+
+from account.background import BackgroundThread
+
+
+class BackgroundThreadTests(SimpleTestCase):
+    def test_started_once_per_process(self):
+        on_start = mock.Mock()
+        thread = BackgroundThread('test', mock.Mock(), 60, on_start=on_start)
+        with mock.patch('account.background.threading.Thread') as Thread, \
+                mock.patch('account.background.os.getpid', return_value=1):
+            self.assertTrue(thread.start())
+            self.assertFalse(thread.start())
+            self.assertEqual(Thread.call_count, 1)
+            self.assertTrue(Thread.return_value.daemon)
+        # A thread started before a fork doesn't exist in the child.
+        with mock.patch('account.background.threading.Thread') as Thread, \
+                mock.patch('account.background.os.getpid', return_value=2):
+            self.assertTrue(thread.start())
+            self.assertEqual(Thread.call_count, 1)
+        self.assertEqual(on_start.call_count, 2)
+
+    def test_wake_runs_before_the_interval(self):
+        called = threading.Event()
+        thread = BackgroundThread('test', called.set, 60)
+        thread.start()
+        self.assertFalse(called.wait(0.1))
+        thread.wake()
+        self.assertTrue(called.wait(5))
+
+    def test_errors_are_logged_and_the_thread_goes_on(self):
+        called = threading.Event()
+        calls = []
+
+        def func():
+            calls.append(None)
+            if len(calls) == 1:
+                raise ValueError
+            called.set()
+
+        thread = BackgroundThread('test', func, 0.01, error="Could not test")
+        with mock.patch('account.background.logger') as logger:
+            thread.start()
+            self.assertTrue(called.wait(5))
+        logger.exception.assert_called_once_with("Could not test")
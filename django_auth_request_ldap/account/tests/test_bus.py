@@ -0,0 +1,72 @@
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from datetime import timedelta
+
+from account.bus import DatabaseTransport, InvalidationBus, LocalTransport
+from account.models import InvalidationEvent
+from account.permissions import invalidate_changed_groups
+from account.sessions import invalidate_session_users
+from auth_request.models import invalidate_user_decisions
+
+
+class DatabaseTransportTests(TestCase):
+    def event(self, pk, created, keys='[1]'):
+        return InvalidationEvent.objects.create(id=pk, origin='other', kind='user', keys=keys, created=created)
+
+    def test_rows_committed_out_of_order_are_received_once(self):
+        transport = DatabaseTransport()
+        self.assertEqual(transport.receive(), [])
+        now = timezone.now()
+        self.event(10, now)
+        self.assertEqual([invalidation.keys for invalidation in transport.receive()], [[1]])
+        # A row with a lower id that committed after the poll.
+        self.event(5, now - timedelta(seconds=1), keys='[2]')
+        self.assertEqual([invalidation.keys for invalidation in transport.receive()], [[2]])
+        self.assertEqual(transport.receive(), [])
+
+    def test_rows_before_the_overlap_are_not_reread(self):
+        transport = DatabaseTransport()
+        transport.receive()
+        self.event(1, timezone.now() - timedelta(seconds=transport.overlap + 5))
+        self.assertEqual(transport.receive(), [])
+
+
+class RemoteInvalidationTests(SimpleTestCase):
+    def test_local_bus_delivers_to_other_processes_only(self):
+        first, second = InvalidationBus(LocalTransport()), InvalidationBus(LocalTransport())
+        self.addCleanup(first.transport.close)
+        self.addCleanup(second.transport.close)
+        received = []
+        first.subscribe('user', received.append)
+        second.subscribe('user', received.append)
+        first.publish('user', [1])
+        first.poll(force=True)
+        second.poll(force=True)
+        self.assertEqual(received, [[1]])
+
+    @mock.patch('account.permissions.bump_permission_epoch')
+    def test_remote_changes_skip_the_permission_epoch(self, bump):
+        invalidate_changed_groups(InvalidationBus, [1], remote=True)
+        self.assertFalse(bump.called)
+        invalidate_changed_groups(None, [1])
+        self.assertTrue(bump.called)
+
+    @mock.patch('account.sessions.ACCOUNT_SESSION_USER_CACHE_TIME', 60)
+    @mock.patch('account.sessions.cache')
+    def test_remote_changes_skip_the_session_cache(self, cache):
+        invalidate_session_users(InvalidationBus, [1], remote=True)
+        self.assertFalse(cache.delete_many.called)
+
+    @mock.patch('auth_request.models.ZONE_ACCESS_CACHE_TIME', 60)
+    @mock.patch('auth_request.models.Zone')
+    @mock.patch('auth_request.models.cache')
+    def test_remote_changes_skip_the_decision_cache(self, cache, zone):
+        invalidate_user_decisions(InvalidationBus, [1], remote=True)
+        self.assertFalse(zone.objects.values_list.called)
+        self.assertFalse(cache.delete_many.called)
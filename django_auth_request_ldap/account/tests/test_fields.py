@@ -0,0 +1,41 @@
+from django.db import connections
+from django.db.models.query import prefetch_related_objects
+from django.test import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from account.models import User
+from account.utils import LDAP_DN_SUFFIX
+
+
+def user_dn(username):
+    return 'uid=%s,ou=people,%s' % (username, LDAP_DN_SUFFIX)
+
+
+def group_entry(gid, name, members):
+    return ('cn=%s,ou=groups,%s' % (name, LDAP_DN_SUFFIX), {
+        'gidNumber': [str(gid).encode('ascii')],
+        'cn': [name.encode('ascii')],
+        'member': [user_dn(member).encode('ascii') for member in members],
+    })
+
+
+class GroupPrefetchTests(TestCase):
+    def test_groups_of_many_users_take_one_query(self):
+        users = [User(id=1000 + i, username=name, dn=user_dn(name)) for i, name in enumerate(['alice', 'bob', 'carol'])]
+        groups = [group_entry(100, 'staff', ['alice', 'bob']), group_entry(200, 'admins', ['ALICE'])]
+        with mock.patch.object(connections['ldap'], 'search_s', return_value=groups) as search_s:
+            prefetch_related_objects(users, ['groups'])
+            searches = search_s.call_count
+            # ldapdb searches once for the DNs and once for the entries.
+            filters = set(call[1]['filterstr'] for call in search_s.call_args_list)
+            self.assertEqual(len(filters), 1)
+            for user in users:
+                self.assertIn('(member=%s)' % user.dn, list(filters)[0])
+            self.assertEqual(sorted(group.name for group in users[0].groups.all()), ['admins', 'staff'])
+            self.assertEqual([group.name for group in users[1].groups.all()], ['staff'])
+            self.assertEqual(list(users[2].groups.all()), [])
+            self.assertEqual(search_s.call_count, searches)
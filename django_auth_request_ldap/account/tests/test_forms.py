@@ -0,0 +1,25 @@
+from django import forms
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from account import forms as account_forms
+from account.utils import permission_catalog
+
+
+class PermissionsFieldTests(TestCase):
+    @mock.patch.object(account_forms, 'ACCOUNT_PERMISSION_SEARCH', False)
+    def test_plain_field_uses_the_shared_catalog(self):
+        field = account_forms.permissions_field()
+        self.assertIsInstance(field, forms.MultipleChoiceField)
+        self.assertEqual(list(field.choices), list(permission_catalog))
+
+    @mock.patch.object(account_forms, 'ACCOUNT_PERMISSION_SEARCH', True)
+    @mock.patch.object(account_forms, 'SELECT2_ENABLED', False)
+    def test_search_without_select2_is_a_configuration_error(self):
+        with self.assertRaises(ImproperlyConfigured):
+            account_forms.permissions_field()
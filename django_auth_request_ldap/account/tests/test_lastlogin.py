@@ -0,0 +1,55 @@
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from datetime import timedelta
+import calendar
+
+import ldap
+
+from account.lastlogin import LastLoginWriter
+
+
+class LastLoginWriterTests(SimpleTestCase):
+    def setUp(self):
+        self.writer = LastLoginWriter(interval=10, batch_size=2)
+        # Flushed by hand rather than from the thread.
+        self.writer.start = mock.Mock()
+        patcher = mock.patch('account.lastlogin.connections')
+        self.connection = patcher.start()['ldap']
+        self.addCleanup(patcher.stop)
+        self.alice = mock.Mock(pk=1000, dn='uid=alice,ou=people')
+        self.bob = mock.Mock(pk=1001, dn='uid=bob,ou=people')
+
+    def test_logins_are_coalesced_per_user(self):
+        first = timezone.now()
+        self.writer.queue(self.alice, first)
+        self.writer.queue(self.alice, first + timedelta(seconds=5))
+        self.assertFalse(self.writer.thread.wakeup.is_set())
+        self.writer.queue(self.bob, first)
+        # A full batch wakes the writer up early.
+        self.assertTrue(self.writer.thread.wakeup.is_set())
+
+        self.assertEqual(self.writer.flush(), 2)
+        self.assertEqual(self.connection.modify_s.call_count, 2)
+        dn, modlist = self.connection.modify_s.call_args_list[0][0]
+        self.assertEqual(dn, 'uid=alice,ou=people')
+        self.assertEqual(modlist[0][:2], (ldap.MOD_REPLACE, 'djangoLastLogon'))
+        self.assertEqual(modlist[0][2], [str(calendar.timegm((first + timedelta(seconds=5)).utctimetuple()))])
+        self.assertEqual(self.writer.pending, {})
+
+    def test_failed_writes_are_retried_unless_replaced(self):
+        first = timezone.now()
+        self.writer.queue(self.alice, first)
+        self.connection.modify_s.side_effect = ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+        self.assertEqual(self.writer.flush(), 0)
+        self.assertEqual(self.writer.pending, {1000: ('uid=alice,ou=people', first)})
+
+        later = first + timedelta(seconds=5)
+        self.writer.queue(self.alice, later)
+        self.writer.requeue([(1000, ('uid=alice,ou=people', first))])
+        self.assertEqual(self.writer.pending, {1000: ('uid=alice,ou=people', later)})
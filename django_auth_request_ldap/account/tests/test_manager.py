@@ -0,0 +1,61 @@
+from django.db import connections
+from django.test import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from account.models import User
+from account.utils import LDAP_DN_SUFFIX
+
+
+def entry(uid, username, **attrs):
+    attrs.update({'uidNumber': [str(uid).encode('ascii')], 'uid': [username.encode('ascii')]})
+    return ('uid=%s,ou=people,%s' % (username, LDAP_DN_SUFFIX), attrs)
+
+
+class SelectiveGetTests(TestCase):
+    def setUp(self):
+        self.connection = connections['ldap']
+
+    def test_only_requests_the_loaded_attributes(self):
+        alice = entry(1000, 'alice', givenName=[b'Alice'], sshPublicKey=[b'ssh-ed25519 AAAA alice@example.org'])
+        with mock.patch.object(self.connection, 'search_s', return_value=[alice]) as search_s:
+            user = User.objects.from_ldap().only('username', 'first_name').get(pk=1000)
+            self.assertEqual(search_s.call_count, 1)
+            base, scope, filterstr, attrlist = search_s.call_args[0]
+            self.assertIn('(uidNumber=1000)', filterstr)
+            self.assertEqual(set(attrlist), set(['uidNumber', 'uid', 'givenName']))
+            self.assertEqual((user.pk, user.username, user.first_name), (1000, 'alice', 'Alice'))
+            self.assertIn('ssh_public_keys', user.get_deferred_fields())
+
+            # Deferred attributes are loaded on first access.
+            self.assertEqual(user.ssh_public_keys, ['ssh-ed25519 AAAA alice@example.org'])
+            self.assertEqual(search_s.call_count, 2)
+
+    def test_missing_entry(self):
+        with mock.patch.object(self.connection, 'search_s', return_value=[]):
+            with self.assertRaises(User.DoesNotExist):
+                User.objects.from_ldap().only('username').get(username='nobody')
+
+
+class PkInSearchTests(TestCase):
+    def setUp(self):
+        self.connection = connections['ldap']
+        self.entries = [entry(1000, 'alice'), entry(1001, 'bob')]
+
+    def test_in_bulk_takes_one_search(self):
+        with mock.patch.object(self.connection, 'search_s', return_value=self.entries) as search_s:
+            users = User.objects.from_ldap().in_bulk([1000, 1001, 1000])
+        self.assertEqual(search_s.call_count, 1)
+        self.assertIn('(|(uidNumber=1000)(uidNumber=1001)', search_s.call_args[0][2])
+        self.assertEqual(dict((pk, user.username) for pk, user in users.items()), {1000: 'alice', 1001: 'bob'})
+
+    @mock.patch('account.manager.LOOKUP_CHUNK_SIZE', 1)
+    def test_keys_are_searched_in_chunks(self):
+        with mock.patch.object(self.connection, 'search_s', side_effect=[self.entries[:1], self.entries[1:]]) \
+                as search_s:
+            users = list(User.objects.from_ldap().filter(pk__in=[1000, 1001]))
+        self.assertEqual(search_s.call_count, 2)
+        self.assertEqual(sorted(user.pk for user in users), [1000, 1001])
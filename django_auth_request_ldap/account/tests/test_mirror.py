@@ -0,0 +1,85 @@
+from django.db import DatabaseError, connections
+from django.test import TestCase
+
+import ldap
+import ldapdb.models
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from account.mirror import MirrorSync, mirror_get, mirrored_attnames
+from account.models import MirrorState, User
+from account.sessions import SESSION_USER_FIELDS
+from account.utils import LDAP_DN_SUFFIX
+
+
+class FakeFeed(object):
+    model = User
+
+    def __init__(self, last_seen):
+        self.last_seen = last_seen
+
+    def poll(self):
+        self.last_seen = '20261019120000Z'
+        return set([1000])
+
+    def fetch(self, keys):
+        return [User(id=key, username='alice') for key in keys]
+
+
+class MirrorSaveTests(TestCase):
+    entry = ('uid=alice,ou=people,%s' % LDAP_DN_SUFFIX, {
+        'uidNumber': [b'1000'],
+        'uid': [b'alice'],
+        'givenName': [b'Alice'],
+        'sn': [b'Liddell'],
+        'cn': [b'Alice Liddell'],
+        'sshPublicKey': [b'ssh-ed25519 AAAA alice@example.org'],
+        'sambaNTPassword': [b'0123456789ABCDEF0123456789ABCDEF'],
+    })
+
+    def setUp(self):
+        self.connection = connections['ldap']
+
+    @mock.patch('account.manager.mirror_get')
+    def test_save_diffs_against_ldap(self, mirror_get):
+        # A mirror that doesn't know the user's keys and hashes.
+        mirror_get.return_value = User(id=1000, username='alice', first_name='Alice', last_name='Liddell')
+        with mock.patch.object(self.connection, 'search_s', return_value=[self.entry]):
+            user = User.objects.from_ldap().get(pk=1000)
+            user.ssh_public_keys = []
+            with mock.patch.object(self.connection, 'modify_s') as modify_s:
+                # ldapdb's save, without the samba bookkeeping of User.save().
+                ldapdb.models.Model.save(user)
+        self.assertFalse(mirror_get.called)
+        dn, modlist = modify_s.call_args[0]
+        self.assertEqual(modlist, [(ldap.MOD_DELETE, 'sshPublicKey', None)])
+
+
+class MirrorSyncTests(TestCase):
+    def test_failed_sync_is_retried(self):
+        sync = MirrorSync()
+        feed = FakeFeed('20261019110000Z')
+        sync.feeds = [feed]
+        with mock.patch.object(sync, 'store_user', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                sync.sync()
+        self.assertEqual(feed.last_seen, '20261019110000Z')
+        self.assertFalse(MirrorState.objects.exists())
+
+        with mock.patch.object(sync, 'store_user') as store_user:
+            self.assertEqual(sync.sync(), (1, 0))
+        self.assertEqual(store_user.call_count, 1)
+        self.assertEqual(MirrorState.objects.get().last_seen, '20261019120000Z')
+
+
+class MirrorPasswordTests(TestCase):
+    def test_password_hashes_are_not_mirrored(self):
+        self.assertNotIn('password', mirrored_attnames(User))
+
+    @mock.patch('account.mirror.mirror_available', return_value=True)
+    def test_session_users_come_from_ldap(self, mirror_available):
+        fields = [User._meta.get_field(name) for name in SESSION_USER_FIELDS]
+        self.assertIsNone(mirror_get(User, {'pk': 1000}, fields))
@@ -0,0 +1,66 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from account.permissions import (PERMISSION_EPOCH_KEY, bump_permission_epoch, get_compiled_permissions,
+                                 get_permission_epoch, invalidate_changed_groups)
+
+
+class FakeGroup(object):
+    def __init__(self, permissions):
+        self.permissions = permissions
+
+
+class FakeUser(object):
+    def __init__(self, pk, user_permissions=None, groups=()):
+        self.pk = pk
+        self.user_permissions = user_permissions
+        self.groups = list(groups)
+
+    def get_groups(self):
+        return self.groups
+
+
+class CompiledPermissionsTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_until_groups_change(self):
+        group = FakeGroup(['auth_request.change_zone'])
+        user = FakeUser(1, ['account.change_user'], [group])
+        self.assertTrue(get_compiled_permissions(user).has_perm('auth_request.change_zone'))
+
+        group.permissions = []
+        # Served from the cache until the group epoch moves.
+        self.assertTrue(get_compiled_permissions(user).has_perm('auth_request.change_zone'))
+        invalidate_changed_groups(sender=None, pks=[1])
+        compiled = get_compiled_permissions(user)
+        self.assertFalse(compiled.has_perm('auth_request.change_zone'))
+        self.assertTrue(compiled.has_perm('account.change_user'))
+        self.assertTrue(compiled.has_module_perms('account'))
+
+    @mock.patch('account.permissions.time')
+    def test_evicted_epoch_is_not_reused(self, time):
+        time.time.side_effect = [1000.0, 1001.0]
+        user = FakeUser(1, groups=[FakeGroup(['auth_request.change_zone'])])
+        first = get_permission_epoch()
+        get_compiled_permissions(user)
+
+        cache.delete(PERMISSION_EPOCH_KEY)
+        second = bump_permission_epoch()
+        self.assertNotEqual(first, second)
+
+        user.groups = []
+        self.assertFalse(get_compiled_permissions(user).has_perm('auth_request.change_zone'))
+
+    @mock.patch('account.permissions.time')
+    def test_evicted_epoch_is_not_reused_on_read(self, time):
+        time.time.side_effect = [1000.0, 1001.0]
+        first = get_permission_epoch()
+        bump_permission_epoch()
+        cache.delete(PERMISSION_EPOCH_KEY)
+        self.assertNotIn(get_permission_epoch(), (first, first + 1))
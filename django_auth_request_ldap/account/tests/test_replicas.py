@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.test import SimpleTestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import ldap
+
+from account.breaker import _guarded
+from account.replicas import LDAP_REPLICA_PROBE_TIMEOUT, Replica, ReplicaSet
+
+REPLICA = {
+    'ENGINE': 'ldapdb.backends.ldap',
+    'NAME': 'ldap://replica.example.org/',
+    'USER': 'cn=admin,dc=example,dc=org',
+    'PASSWORD': 'secret',
+}
+
+
+class ReplicaProbeTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(settings.DATABASES, {'replica': REPLICA})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch('account.replicas.ldap.initialize')
+    def test_probe_is_bounded_by_a_timeout(self, initialize):
+        replica = Replica('replica')
+        self.assertTrue(replica.probe())
+        connection = initialize.return_value
+        connection.set_option.assert_any_call(ldap.OPT_NETWORK_TIMEOUT, LDAP_REPLICA_PROBE_TIMEOUT)
+        connection.set_option.assert_any_call(ldap.OPT_TIMEOUT, LDAP_REPLICA_PROBE_TIMEOUT)
+        self.assertTrue(connection.unbind_s.called)
+        self.assertIsNotNone(replica.latency)
+
+    @mock.patch('account.replicas.ldap.initialize')
+    def test_unreachable_replica_is_marked_down(self, initialize):
+        initialize.return_value.simple_bind_s.side_effect = ldap.TIMEOUT({'desc': "Timed out"})
+        replica = Replica('replica')
+        self.assertFalse(replica.probe())
+        self.assertFalse(replica.healthy)
+
+
+class ReplicaFailoverTests(SimpleTestCase):
+    def setUp(self):
+        self.replicas = ReplicaSet(['replica'])
+        self.replicas.read_alias = mock.Mock(return_value='ldap')
+        for patcher in (mock.patch('account.replicas.replica_set', self.replicas),
+                        mock.patch('account.breaker._breakers', {})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_failed_search_is_retried_elsewhere(self):
+        def search_s(self, base, scope, filterstr='(objectClass=*)', attrlist=None):
+            raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+
+        replica = mock.Mock(alias='replica')
+        with mock.patch('account.breaker.connections') as connections:
+            connections.__getitem__.return_value.search_s.return_value = [('uid=alice', {})]
+            results = _guarded(search_s)(replica, 'dc=example,dc=org', ldap.SCOPE_SUBTREE, '(uid=alice)')
+        self.assertEqual(results, [('uid=alice', {})])
+        connections.__getitem__.assert_called_with('ldap')
+        self.assertFalse(self.replicas.replicas[0].healthy)
+        self.assertIsNone(replica.connection)
+
+    def test_primary_failures_are_raised(self):
+        def search_s(self, base, scope, filterstr='(objectClass=*)', attrlist=None):
+            raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+
+        with self.assertRaises(ldap.SERVER_DOWN):
+            _guarded(search_s)(mock.Mock(alias='ldap'), 'dc=example,dc=org', ldap.SCOPE_SUBTREE)
+        self.assertFalse(self.replicas.read_alias.called)
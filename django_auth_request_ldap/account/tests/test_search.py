@@ -0,0 +1,52 @@
+from django.test import SimpleTestCase
+
+import time
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from account.models import User
+from account.search import SearchIndex
+
+
+class Entry(object):
+    def __init__(self, pk, username, email):
+        self.pk = pk
+        self.username = username
+        self.email = email
+
+    def __str__(self):
+        return self.username
+
+
+class SearchIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = SearchIndex(User, ['username', 'email'])
+        # Keep sync() from asking LDAP.
+        self.index.synced_at = time.time()
+        for entry in [Entry(1, 'malice', 'malice@example.org'), Entry(2, 'alice', 'alice@example.org'),
+                      Entry(3, 'bob', 'bob.alice@example.org'), Entry(4, 'alicea', 'a@example.org'),
+                      Entry(5, 'carol', 'carol@example.org')]:
+            self.index.update(entry)
+
+    def test_ranked_best_first(self):
+        self.assertEqual([pk for pk, label in self.index.ranked('alice')], [2, 4, 3, 1])
+
+    @mock.patch('account.search.ACCOUNT_SEARCH_INDEX_MAX_RESULTS', 2)
+    def test_search_pages_but_ranked_returns_everything(self):
+        page, has_more = self.index.search('alice')
+        self.assertEqual([pk for pk, label in page], [2, 4])
+        self.assertTrue(has_more)
+        self.assertEqual(len(self.index.ranked('alice')), 4)
+
+    def test_removed_entries_no_longer_match(self):
+        self.index.remove(2)
+        self.assertEqual([pk for pk, label in self.index.ranked('alice')], [4, 3, 1])
+
+    def test_refresh_reloads_changed_entries(self):
+        with mock.patch.object(self.index.feed, 'fetch', return_value=[Entry(2, 'alice', 'alice@example.net')]):
+            self.index.refresh([2, 3])
+        self.assertEqual([pk for pk, label in self.index.ranked('example.net')], [2])
+        self.assertEqual([pk for pk, label in self.index.ranked('bob')], [])
@@ -0,0 +1,92 @@
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import pickle
+
+from account.middleware import SessionRefreshMiddleware
+from account.models import User
+from account.sessions import SESSION_REFRESHED_KEY, credential_fingerprint, get_session_user, public_session_id
+
+
+class CredentialFingerprintTests(SimpleTestCase):
+    def test_changes_with_password_and_active(self):
+        user = User(id=1000, username='alice', password='{SSHA}abc', is_active=True)
+        fingerprint = credential_fingerprint(user)
+        self.assertEqual(fingerprint, user.get_session_auth_hash())
+        user.first_name = 'Alice'
+        self.assertEqual(credential_fingerprint(user), fingerprint)
+        user.password = '{SSHA}def'
+        self.assertNotEqual(credential_fingerprint(user), fingerprint)
+        user.password, user.is_active = '{SSHA}abc', False
+        self.assertNotEqual(credential_fingerprint(user), fingerprint)
+
+    def test_public_session_id(self):
+        session = SessionStore()
+        self.assertEqual(public_session_id(session), '')
+        session.create()
+        self.assertTrue(public_session_id(session))
+        self.assertNotIn(session.session_key, public_session_id(session))
+
+
+class SessionUserTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch('account.sessions.fetch_session_user')
+    def test_user_is_fetched_once(self, fetch_session_user):
+        fetch_session_user.return_value = User(id=1000, username='alice')
+        self.assertEqual(get_session_user(1000).username, 'alice')
+        self.assertEqual(get_session_user(1000).username, 'alice')
+        fetch_session_user.assert_called_once_with(pk=1000)
+
+    @mock.patch('account.sessions.fetch_session_user')
+    def test_users_cached_in_the_old_format_are_ignored(self, fetch_session_user):
+        fetch_session_user.return_value = User(id=1000, username='alice')
+        cache.set('account_session_user_1000', User(id=1000, username='mallory'))
+        self.assertEqual(get_session_user(1000).username, 'alice')
+
+    @mock.patch('account.sessions.fetch_session_user')
+    def test_password_hashes_are_not_cached(self, fetch_session_user):
+        user = User(id=1000, username='alice', password='{SSHA}abc', is_active=True)
+        fetch_session_user.return_value = user
+        self.assertEqual(get_session_user(1000).password, '{SSHA}abc')
+        cached = get_session_user(1000)
+        self.assertNotIn('password', cached.__dict__)
+        self.assertNotIn('{SSHA}abc', repr(pickle.dumps(cached)))
+        self.assertEqual(cached.get_session_auth_hash(), user.get_session_auth_hash())
+
+        def load(instance, fields=None):
+            instance.__dict__['password'] = '{SSHA}def'
+        with mock.patch.object(type(cached), 'refresh_from_db', autospec=True, side_effect=load):
+            self.assertEqual(cached.password, '{SSHA}def')
+        self.assertNotEqual(cached.get_session_auth_hash(), user.get_session_auth_hash())
+
+
+class SessionRefreshMiddlewareTests(SimpleTestCase):
+    def request(self, **data):
+        request = RequestFactory().get('/auth_request/')
+        request.session = SessionStore()
+        request.session.update(data)
+        request.session.modified = False
+        return request
+
+    def test_refreshes_at_most_once_per_interval(self):
+        request = self.request(**{SESSION_KEY: '1000'})
+        SessionRefreshMiddleware().process_request(request)
+        self.assertTrue(request.session.modified)
+
+        request = self.request(**{SESSION_KEY: '1000', SESSION_REFRESHED_KEY: request.session[SESSION_REFRESHED_KEY]})
+        SessionRefreshMiddleware().process_request(request)
+        self.assertFalse(request.session.modified)
+
+    def test_anonymous_sessions_are_left_alone(self):
+        request = self.request()
+        SessionRefreshMiddleware().process_request(request)
+        self.assertFalse(request.session.modified)
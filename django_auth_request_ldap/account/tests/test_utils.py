@@ -0,0 +1,18 @@
+from django.test import SimpleTestCase
+
+from account.utils import LazyChoices
+
+
+class LazyChoicesTests(SimpleTestCase):
+    def test_computed_once_on_first_use(self):
+        calls = []
+
+        def shells(*items):
+            calls.append(items)
+            return [(item, item.rsplit('/')[-1]) for item in items]
+
+        choices = LazyChoices(shells, '/bin/bash', '/bin/zsh')
+        self.assertEqual(calls, [])
+        self.assertEqual(list(choices), [('/bin/bash', 'bash'), ('/bin/zsh', 'zsh')])
+        self.assertEqual(choices[1], ('/bin/zsh', 'zsh'))
+        self.assertEqual(len(calls), 1)
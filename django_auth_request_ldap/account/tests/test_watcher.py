@@ -0,0 +1,60 @@
+from django.test import SimpleTestCase, TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from account.changes import ChangeFeed
+from account.models import User
+from account.signals import users_changed, groups_changed
+from account.watcher import ChangeWatcher
+
+
+class ChangeFeedTests(SimpleTestCase):
+    def test_polls_from_the_latest_timestamp(self):
+        feed = ChangeFeed(User)
+        results = [
+            ('uid=alice', {'uidNumber': [b'1000'], 'modifyTimestamp': [b'20261019100000Z']}),
+            ('uid=bob', {'uidNumber': [b'1001'], 'modifyTimestamp': [b'20261019110000Z']}),
+        ]
+        with mock.patch.object(ChangeFeed, 'search', return_value=results) as search:
+            self.assertEqual(feed.poll(), set([1000, 1001]))
+            self.assertEqual(feed.last_seen, '20261019110000Z')
+            feed.poll()
+        self.assertIn('(modifyTimestamp>=20261019110000Z)', search.call_args[0][0])
+
+
+class ChangeWatcherTests(TestCase):
+    def setUp(self):
+        self.watcher = ChangeWatcher()
+        self.watcher.uids = {'alice': 1000, 'bob': 1001}
+        self.watcher.members = {10: set(['alice', 'bob'])}
+        self.users = []
+        self.groups = []
+        users_changed.connect(self.users_changed, dispatch_uid='test_watcher_users')
+        groups_changed.connect(self.groups_changed, dispatch_uid='test_watcher_groups')
+
+    def tearDown(self):
+        users_changed.disconnect(dispatch_uid='test_watcher_users')
+        groups_changed.disconnect(dispatch_uid='test_watcher_groups')
+
+    def users_changed(self, sender, pks, **kwargs):
+        self.users.append(set(pks))
+
+    def groups_changed(self, sender, pks, **kwargs):
+        self.groups.append(set(pks))
+
+    def test_removed_members_are_invalidated(self):
+        self.watcher.user_feed = mock.Mock(**{'poll.return_value': set()})
+        self.watcher.group_feed = mock.Mock(**{'poll_entries.return_value': [(10, {'memberUid': [b'alice']})]})
+        self.assertEqual(self.watcher.check(), (set([1000, 1001]), set([10])))
+        self.assertEqual(self.groups, [set([10])])
+        self.assertEqual(self.users, [set([1000, 1001])])
+        self.assertEqual(self.watcher.members[10], set(['alice']))
+
+    def test_quiet_poll_sends_nothing(self):
+        self.watcher.user_feed = mock.Mock(**{'poll.return_value': set()})
+        self.watcher.group_feed = mock.Mock(**{'poll_entries.return_value': []})
+        self.assertEqual(self.watcher.check(), (set(), set()))
+        self.assertEqual(self.users + self.groups, [])
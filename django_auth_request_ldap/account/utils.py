@@ -1,14 +1,21 @@
 from os import access, X_OK
 from django.conf import settings
 from django.contrib import auth
-from django.db import DEFAULT_DB_ALIAS
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+
+import threading
 
 import ldapdb
 from ldapdb.router import Router as LDAPDBRouter, is_ldap_model
 
+from .replicas import replica_set
+
 LDAP_DN_SUFFIX = getattr(settings, 'LDAP_DN_SUFFIX', '')
 ALLOWED_LDAP_RELATIONS = getattr(settings, 'ALLOWED_LDAP_RELATIONS', [])
 
+PERMISSION_CATALOG_VERSION_KEY = 'account_permission_catalog_version'
+
 
 class Router(LDAPDBRouter):
     def allow_relation(self, obj, to):
@@ -18,9 +25,16 @@ class Router(LDAPDBRouter):
             obj._state.db == to._state.db or \
             (obj_name, to_name) in ALLOWED_LDAP_RELATIONS
 
+    def db_for_read(self, model, **hints):
+        "Spread searches of LDAP models over the healthy replicas"
+        if is_ldap_model(model):
+            return replica_set.choose(self.ldap_alias)
+        return None
+
     def db_for_write(self, model, **hints):
         "Point all operations on LDAP models to the LDAP database"
         if is_ldap_model(model):
+            replica_set.written()
             return self.ldap_alias
         instance = hints.get('instance')
         if instance is not None and instance._state.db:
@@ -33,6 +47,31 @@ def process_shells(items):
     return [(x, x.rsplit('/')[-1]) for x in items if access(x, X_OK)]
 
 
+class LazyChoices(object):
+    """
+    Field choices that are only computed the first time they are iterated,
+    so building them doesn't happen at import time.
+
+    This deliberately doesn't implement ``__len__``; Django evaluates
+    ``choices or []`` when a field is constructed.
+    """
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+        self.cached = None
+
+    def load(self):
+        if self.cached is None:
+            self.cached = list(self.func(*self.args))
+        return self.cached
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __getitem__(self, index):
+        return self.load()[index]
+
+
 class classproperty(object):
     def __init__(self, getter):
         self.getter = getter
@@ -51,36 +90,114 @@ class CustomRDNModel(ldapdb.models.Model):
         parts = [cls.dn_prefix, suf]
         return ','.join([x for x in parts if x])
 
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        """
+        Reloads ``fields`` (all by default) with a single search; this is
+        also how attributes deferred with ``only()``/``defer()`` are loaded.
+        """
+        model = self._meta.concrete_model
+        if fields is None:
+            fields = [field.attname for field in model._meta.concrete_fields]
+        fresh = model._default_manager.from_ldap().only(*fields).get(pk=self.pk)
+        for attname in fields:
+            setattr(self, attname, getattr(fresh, attname))
+
+    def load_deferred(self):
+        """
+        Loads every deferred attribute at once, rather than one search per
+        attribute as saving would.
+        """
+        deferred = self.get_deferred_fields()
+        if deferred:
+            self.refresh_from_db(fields=deferred)
+
     class Meta:
         abstract = True
 
 
-class PermissionsIterator(object):
+class PermissionCatalog(object):
+    """
+    Process-wide, lazily loaded list of permission choices, shared by all
+    forms that edit permissions.
+
+    The catalog checks a version key in the shared cache before it is used,
+    so a ``migrate`` run in another process (which is when new permissions
+    show up) invalidates the catalog in every worker.
+    """
+    def __init__(self):
+        self.cached = None
+        self.labels = {}
+        self.version = None
+        self.lock = threading.Lock()
+
     def get_all_permissions(self):
         from django.contrib.auth.models import Permission
         items = []
-        try:
-            for perm in Permission.objects.all().select_related('content_type'):
-                app_label = perm.content_type.app_label
-                items.append(('%s.%s' % (app_label, perm.codename), '%s | %s' % (app_label, perm.name)))
-        except:
-            pass
+        for perm in Permission.objects.all().select_related('content_type').order_by('content_type__app_label',
+                                                                                      'codename'):
+            app_label = perm.content_type.app_label
+            items.append(('%s.%s' % (app_label, perm.codename), '%s | %s' % (app_label, perm.name)))
         return items
 
-    def __init__(self):
-        self.cached = None
-
     def load(self):
-        if not self.cached:
-            self.cached = self.get_all_permissions()
+        version = cache.get(PERMISSION_CATALOG_VERSION_KEY, 0)
+        if self.cached is not None and self.version == version:
+            return self.cached
+        with self.lock:
+            if self.cached is None or self.version != version:
+                try:
+                    items = self.get_all_permissions()
+                except DatabaseError:
+                    # Don't remember failures; the permission table may not exist yet.
+                    return []
+                self.labels = dict(items)
+                self.cached = items
+                self.version = version
         return self.cached
 
+    def invalidate(self):
+        self.cached = None
+        try:
+            cache.incr(PERMISSION_CATALOG_VERSION_KEY)
+        except ValueError:
+            cache.set(PERMISSION_CATALOG_VERSION_KEY, 1, None)
+
+    def search(self, term, offset=0, limit=25):
+        """
+        Returns a page of ``(value, label)`` pairs matching ``term``, and
+        whether more results are available.
+        """
+        term = term.lower()
+        matches = [item for item in self.load() if term in item[1].lower() or term in item[0].lower()]
+        return matches[offset:offset + limit], len(matches) > offset + limit
+
+    def get_label(self, value):
+        self.load()
+        return self.labels.get(value)
+
+    def __contains__(self, value):
+        self.load()
+        return value in self.labels
+
+    def __call__(self):
+        return self.load()
+
+    def __deepcopy__(self, memo):
+        # Form fields are deep-copied per form instance; they all share us.
+        return self
+
     def __iter__(self):
         return iter(self.load())
 
     def __getitem__(self, index):
         return self.load()[index]
 
+permission_catalog = PermissionCatalog()
+
+
+def invalidate_permission_catalog(**kwargs):
+    permission_catalog.invalidate()
+
 
 # A few helper functions for common logic between User and AnonymousUser.
 def _user_get_all_permissions(user, obj):
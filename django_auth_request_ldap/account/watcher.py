@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.utils.encoding import force_text
+from ldapdb import escape_ldap_filter
+
+import logging
+import time
+
+from .changes import ChangeFeed
+from .signals import users_changed, groups_changed
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_CHANGE_WATCHER_INTERVAL = getattr(settings, 'ACCOUNT_CHANGE_WATCHER_INTERVAL', 5)
+ACCOUNT_CHANGE_WATCHER_RECONCILE = getattr(settings, 'ACCOUNT_CHANGE_WATCHER_RECONCILE', 60)
+
+
+class ChangeWatcher(object):
+    """
+    Watches ``ou=people`` and ``ou=groups`` for modified entries and sends
+    ``users_changed``/``groups_changed`` for them, so caches can be
+    invalidated precisely even when LDAP is edited with other tools.
+
+    A changed group affects everyone who is or was a member of it, so the
+    watcher keeps the ``memberUid`` lists of all groups to work out who
+    was removed.
+    """
+    def __init__(self):
+        from .models import User, Group
+        self.user_feed = ChangeFeed(User)
+        self.group_feed = ChangeFeed(Group)
+        self.uids = {}
+        self.members = {}
+        self.polls = 0
+
+    def prime(self):
+        """
+        Loads the current state; nothing before this point is reported.
+        """
+        self.user_feed.poll()
+        self.uids = self.user_feed.attribute_map('uid')
+        self.members = {}
+        for gid, attrs in self.group_feed.poll_entries(['memberUid']):
+            self.members[gid] = set(force_text(x) for x in attrs.get('memberUid', []))
+
+    def user_pks(self, uids):
+        unknown = [x for x in uids if x not in self.uids]
+        if unknown:
+            self.uids.update(self.user_feed.attribute_map(
+                'uid', '(|%s)' % ''.join('(uid=%s)' % escape_ldap_filter(x) for x in unknown)))
+        return set(self.uids[x] for x in uids if x in self.uids)
+
+    def check(self):
+        """
+        Polls once and sends the signals; returns the changed user and group
+        primary keys.
+        """
+        user_pks = self.user_feed.poll()
+        group_pks = set()
+        affected_uids = set()
+        for gid, attrs in self.group_feed.poll_entries(['memberUid']):
+            members = set(force_text(x) for x in attrs.get('memberUid', []))
+            affected_uids |= members | self.members.get(gid, set())
+            self.members[gid] = members
+            group_pks.add(gid)
+        self.polls += 1
+        if self.polls % ACCOUNT_CHANGE_WATCHER_RECONCILE == 0:
+            for gid in set(self.members) - self.group_feed.keys():
+                affected_uids |= self.members.pop(gid)
+                group_pks.add(gid)
+        user_pks |= self.user_pks(affected_uids)
+
+        if group_pks:
+            groups_changed.send(sender=self.group_feed.model, pks=group_pks)
+        if user_pks:
+            users_changed.send(sender=self.user_feed.model, pks=user_pks)
+        return user_pks, group_pks
+
+    def run(self, interval=ACCOUNT_CHANGE_WATCHER_INTERVAL):
+        self.prime()
+        while True:
+            started = time.time()
+            try:
+                user_pks, group_pks = self.check()
+                if user_pks or group_pks:
+                    logger.info("invalidated %d users and %d groups changed in LDAP", len(user_pks), len(group_pks))
+            except Exception:
+                logger.exception("polling LDAP for changes failed")
+            time.sleep(max(0, interval - (time.time() - started)))
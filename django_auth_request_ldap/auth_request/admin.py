@@ -1,20 +1,46 @@
 from django import forms
 from django.conf import settings
-from django.contrib import admin
+from django.conf.urls import url
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
 from django.apps import apps as django_apps
-from .models import Zone, ZoneUser, ZoneGroup
-from django_select2 import AutoModelSelect2Field, AutoHeavySelect2Widget
+from django.core.exceptions import ValidationError
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse, HttpResponseRedirect
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.utils.encoding import force_text
+from django.utils.html import format_html
+from django.utils.translation import ugettext_lazy as _
+from .models import Zone, ZoneUser, ZoneGroup, ZoneNetwork, ZoneSchedule
+from .rules import export_rules, import_rules, names_for, renumber_rules
+from django_select2 import AutoModelSelect2Field, AutoHeavySelect2Widget, NO_ERR_RESP
+from account.search import get_search_index
 
 User = django_apps.get_model(settings.AUTH_USER_MODEL)
 Group = django_apps.get_model(settings.AUTH_GROUP_MODEL)
 
 
-class UserChoices(AutoModelSelect2Field):
+class IndexedChoicesMixin(object):
+    """
+    Serves typeahead results from the local search index when there is one,
+    instead of running a substring search against LDAP for every keystroke.
+    """
+    def get_results(self, request, term, page, context):
+        index = get_search_index(self.queryset.model)
+        if index is None:
+            return super(IndexedChoicesMixin, self).get_results(request, term, page, context)
+        size = self.max_results or 25
+        results, has_more = index.search(term, (page - 1) * size, size)
+        return NO_ERR_RESP, has_more, [(pk, label, {}) for pk, label in results]
+
+
+class UserChoices(IndexedChoicesMixin, AutoModelSelect2Field):
     queryset = User.objects
     search_fields = ['username__icontains']
 
 
-class GroupChoices(AutoModelSelect2Field):
+class GroupChoices(IndexedChoicesMixin, AutoModelSelect2Field):
     queryset = Group.objects
     search_fields = ['name__icontains']
 
@@ -63,25 +89,162 @@ class ZoneGroupForm(forms.ModelForm):
         }
 
 
-class ZoneGroupAdmin(admin.TabularInline):
-    model = ZoneGroup
+class RuleChangeList(ChangeList):
+    """
+    Resolves the names of the users or groups on a page with a single
+    LDAP search, instead of one per row.
+    """
+    def get_results(self, request):
+        super(RuleChangeList, self).get_results(request)
+        field = self.model_admin.rule_field
+        names = names_for(self.model, field, [getattr(obj, '%s_id' % field) for obj in self.result_list])
+        for obj in self.result_list:
+            obj._object_name = names.get(getattr(obj, '%s_id' % field))
+
+
+class RuleAdmin(admin.ModelAdmin):
+    """
+    Paginated management of a single kind of rule, for zones with more
+    rules than fit on the zone's change page.
+    """
+    rule_field = None
+    list_display = ('rule_object', 'zone', 'access', 'order')
+    list_editable = ('access', 'order')
+    list_filter = ('zone', 'access')
+    list_select_related = ('zone',)
+    list_per_page = 100
+    ordering = ('zone', 'order', 'pk')
+    search_fields = ('zone__name',)
+    actions = ['renumber_zones']
+
+    def get_changelist(self, request, **kwargs):
+        return RuleChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        target = self.model._meta.get_field(self.rule_field).rel.to
+        index = get_search_index(target)
+        if index is None or not search_term:
+            return super(RuleAdmin, self).get_search_results(request, queryset, search_term)
+        # The changelist orders rules by zone, so the ranking wouldn't
+        # survive anyway; the cap keeps the pk list within what the
+        # database takes in one query.
+        results, has_more = index.search(search_term)
+        return queryset.filter(**{'%s_id__in' % self.rule_field: [pk for pk, label in results]}), False
+
+    def rule_object(self, obj):
+        name = getattr(obj, '_object_name', None)
+        return name if name is not None else '#%s' % getattr(obj, '%s_id' % self.rule_field)
+    rule_object.short_description = _("name")
+
+    def renumber_zones(self, request, queryset):
+        zones = Zone.objects.filter(pk__in=set(queryset.values_list('zone_id', flat=True)))
+        renumber_rules(zones)
+        self.message_user(request, _("Renumbered the rules of %d zone(s).") % len(zones))
+    renumber_zones.short_description = _("Renumber all rules of the selected rules' zones")
+
+
+class ZoneGroupAdmin(RuleAdmin):
     form = ZoneGroupForm
-    min_num = 0
-    extra = 3
+    rule_field = 'group'
 
 
-class ZoneUserAdmin(admin.TabularInline):
-    model = ZoneUser
+class ZoneUserAdmin(RuleAdmin):
     form = ZoneUserForm
+    rule_field = 'user'
+
+
+class ZoneNetworkAdmin(admin.TabularInline):
+    model = ZoneNetwork
+    min_num = 0
+    extra = 1
+
+
+class ZoneScheduleAdmin(admin.TabularInline):
+    model = ZoneSchedule
     min_num = 0
-    extra = 3
+    extra = 1
+
+
+class RuleImportForm(forms.Form):
+    rules = forms.FileField(label=_("CSV file"),
+                            help_text=_("Columns: kind (user or group), name, access (default, allowed or "
+                                        "denied) and order, as written by the export."))
+    replace = forms.BooleanField(label=_("Replace"), required=False,
+                                 help_text=_("Remove the user and group rules that aren't in the file."))
 
 
 class ZoneAdmin(admin.ModelAdmin):
     prepopulated_fields = {'code': ("name",)}
+    readonly_fields = ('rules',)
+    actions = ['renumber_zones']
+    import_template = 'admin/auth_request/zone/import_rules.html'
+    # User and group rules are managed on their own, paginated, pages; see
+    # rules().
     inlines = [
-        ZoneGroupAdmin,
-        ZoneUserAdmin,
+        ZoneNetworkAdmin,
+        ZoneScheduleAdmin,
     ]
 
+    def get_urls(self):
+        return [
+            url(r'^(\d+)/rules/export/$', self.admin_site.admin_view(self.export_rules_view)),
+            url(r'^(\d+)/rules/import/$', self.admin_site.admin_view(self.import_rules_view)),
+        ] + super(ZoneAdmin, self).get_urls()
+
+    def rules(self, obj):
+        if obj is None or obj.pk is None:
+            return ""
+        return format_html(
+            '<a href="{0}?zone__id__exact={1}">{2}</a> &middot; <a href="{3}?zone__id__exact={1}">{4}</a>'
+            ' &middot; <a href="{5}/rules/export/">{6}</a> &middot; <a href="{5}/rules/import/">{7}</a>',
+            reverse('admin:auth_request_zonegroup_changelist'), obj.pk,
+            _("%d group rules") % obj.groups.count(),
+            reverse('admin:auth_request_zoneuser_changelist'),
+            _("%d user rules") % obj.users.count(),
+            reverse('admin:auth_request_zone_change', args=(obj.pk,)).rstrip('/'),
+            _("Export CSV"), _("Import CSV"))
+    rules.short_description = _("rules")
+
+    def renumber_zones(self, request, queryset):
+        renumber_rules(queryset)
+        self.message_user(request, _("Renumbered the rules of %d zone(s).") % len(queryset))
+    renumber_zones.short_description = _("Renumber the rules of the selected zones")
+
+    def export_rules_view(self, request, object_id):
+        zone = get_object_or_404(Zone, pk=object_id)
+        if not self.has_change_permission(request, zone):
+            return HttpResponseRedirect(reverse('admin:index'))
+        response = HttpResponse(content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="%s-rules.csv"' % zone.code
+        export_rules(zone, response)
+        return response
+
+    def import_rules_view(self, request, object_id):
+        zone = get_object_or_404(Zone, pk=object_id)
+        if not self.has_change_permission(request, zone):
+            return HttpResponseRedirect(reverse('admin:index'))
+        form = RuleImportForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            lines = force_text(form.cleaned_data['rules'].read()).splitlines()
+            try:
+                created, updated, deleted = import_rules(zone, lines, form.cleaned_data['replace'])
+            except ValidationError as e:
+                for message in e.messages:
+                    form.add_error('rules', message)
+            else:
+                self.message_user(request, _("Imported rules: %(created)d created, %(updated)d updated, "
+                                             "%(deleted)d deleted.") % {
+                    'created': created, 'updated': updated, 'deleted': deleted}, messages.SUCCESS)
+                return HttpResponseRedirect(reverse('admin:auth_request_zone_change', args=(zone.pk,)))
+        context = dict(
+            self.admin_site.each_context(request),
+            title=_("Import rules into %s") % zone,
+            opts=self.model._meta,
+            original=zone,
+            form=form,
+        )
+        return TemplateResponse(request, self.import_template, context)
+
 admin.site.register(Zone, ZoneAdmin)
+admin.site.register(ZoneGroup, ZoneGroupAdmin)
+admin.site.register(ZoneUser, ZoneUserAdmin)
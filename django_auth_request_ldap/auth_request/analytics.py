@@ -0,0 +1,284 @@
+"""
+Streaming traffic analytics per zone, in bounded memory.
+
+Every decision ``do_log`` sees is counted into the current time bucket of
+its zone: a HyperLogLog of the users (distinct users), a count-min sketch
+with the ``ZONE_ANALYTICS_TOP`` users it ranks highest (heavy hitters), and
+a count per action (outcomes). Each zone keeps a ring of
+``ZONE_ANALYTICS_BUCKETS`` buckets of ``ZONE_ANALYTICS_BUCKET_TIME``
+seconds, so memory doesn't depend on traffic, only on the number of zones.
+
+With ``ZONE_ANALYTICS`` enabled, a background thread of every worker
+publishes its buckets to the shared cache every
+``ZONE_ANALYTICS_PUBLISH_INTERVAL`` seconds, a key per zone and only for
+the zones that saw decisions since; ``summarize`` merges the buckets of all
+workers within a window. Distinct users merge exactly (as
+far as HyperLogLog is exact); top users merge the per-bucket estimates of
+each worker's candidates, which can miss users that are frequent overall
+but never made a top list.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from collections import Counter
+import base64
+import hashlib
+import heapq
+import math
+import struct
+import threading
+import time
+import uuid
+
+from account.background import BackgroundThread
+
+ZONE_ANALYTICS = getattr(settings, 'ZONE_ANALYTICS', False)
+ZONE_ANALYTICS_BUCKET_TIME = getattr(settings, 'ZONE_ANALYTICS_BUCKET_TIME', 300)
+ZONE_ANALYTICS_BUCKETS = getattr(settings, 'ZONE_ANALYTICS_BUCKETS', 12)
+ZONE_ANALYTICS_TOP = getattr(settings, 'ZONE_ANALYTICS_TOP', 20)
+ZONE_ANALYTICS_PUBLISH_INTERVAL = getattr(settings, 'ZONE_ANALYTICS_PUBLISH_INTERVAL', 10)
+
+# 2 ** 10 registers: about 3% error, 1KB per bucket.
+HLL_PRECISION = 10
+SKETCH_WIDTH = 512
+SKETCH_DEPTH = 4
+
+WORKERS_KEY = 'zone_analytics_workers'
+# The zones a worker has buckets for, and its buckets of one zone.
+ZONES_KEY = 'zone_analytics_zones_%s'
+BUCKETS_KEY = 'zone_analytics_buckets_%s_%s'
+
+
+def _hash(value):
+    return struct.unpack('>Q', hashlib.sha1(value.encode('utf-8')).digest()[:8])[0]
+
+
+class HyperLogLog(object):
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    def add(self, value):
+        hashed = _hash(value)
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        # Position of the first set bit in the remaining bits.
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        for index, rank in enumerate(other.registers):
+            if rank > self.registers[index]:
+                self.registers[index] = rank
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(b'\x00')
+        if estimate <= 2.5 * self.size and zeros:
+            # Linear counting is more accurate for small cardinalities.
+            estimate = self.size * math.log(float(self.size) / zeros)
+        return int(round(estimate))
+
+    def dump(self):
+        return base64.b64encode(bytes(self.registers)).decode('ascii')
+
+    @classmethod
+    def load(cls, data, precision=HLL_PRECISION):
+        return cls(precision, base64.b64decode(data))
+
+
+class CountMinSketch(object):
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for i in range(depth)]
+
+    def indexes(self, key):
+        hashed = _hash(key)
+        # Double hashing gives depth independent enough indexes.
+        first, second = hashed & 0xffffffff, hashed >> 32
+        return [(first + row * second) % self.width for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        estimate = None
+        for row, index in zip(self.rows, self.indexes(key)):
+            row[index] += count
+            estimate = row[index] if estimate is None else min(estimate, row[index])
+        return estimate
+
+    def estimate(self, key):
+        return min(row[index] for row, index in zip(self.rows, self.indexes(key)))
+
+
+class HeavyHitters(object):
+    """
+    The ``size`` keys with the highest count-min estimates, in a min-heap
+    with lazily dropped stale entries.
+    """
+    def __init__(self, size=ZONE_ANALYTICS_TOP):
+        self.size = size
+        self.sketch = CountMinSketch()
+        self.top = {}
+        self.heap = []
+
+    def add(self, key, count=1):
+        estimate = self.sketch.add(key, count)
+        if key in self.top or len(self.top) < self.size:
+            self.top[key] = estimate
+            heapq.heappush(self.heap, (estimate, key))
+        elif estimate > self.minimum():
+            smallest = heapq.heappop(self.heap)[1]
+            del self.top[smallest]
+            self.top[key] = estimate
+            heapq.heappush(self.heap, (estimate, key))
+        if len(self.heap) > self.size * 4:
+            self.heap = [(estimate, key) for key, estimate in self.top.items()]
+            heapq.heapify(self.heap)
+
+    def minimum(self):
+        # Drop entries superseded by a later push for the same key.
+        while self.heap and self.top.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0]
+
+
+class Bucket(object):
+    def __init__(self, number):
+        self.number = number
+        self.users = HyperLogLog()
+        self.hitters = HeavyHitters()
+        self.outcomes = Counter()
+
+    def add(self, user_key, action):
+        # Anonymous requests only count towards the outcomes.
+        if user_key:
+            self.users.add(user_key)
+            self.hitters.add(user_key)
+        self.outcomes[action] += 1
+
+    def dump(self):
+        return {
+            'number': self.number,
+            'users': self.users.dump(),
+            'top': dict(self.hitters.top),
+            'outcomes': dict(self.outcomes),
+        }
+
+
+class ZoneAnalytics(object):
+    def __init__(self, bucket_time=ZONE_ANALYTICS_BUCKET_TIME, buckets=ZONE_ANALYTICS_BUCKETS):
+        self.bucket_time = bucket_time
+        self.buckets = buckets
+        self.rings = {}
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self.thread = BackgroundThread('auth-request-analytics', self.publish, ZONE_ANALYTICS_PUBLISH_INTERVAL,
+                                       on_start=self.reset, error="Could not publish zone analytics")
+        self.worker = None
+
+    def bucket(self, zone_code, number):
+        ring = self.rings.get(zone_code)
+        if ring is None:
+            ring = self.rings[zone_code] = [None] * self.buckets
+        bucket = ring[number % self.buckets]
+        if bucket is None or bucket.number != number:
+            # Reuses the slot of a bucket that left the window.
+            bucket = ring[number % self.buckets] = Bucket(number)
+        return bucket
+
+    def record(self, zone_code, user_key, action, now=None):
+        now = now or time.time()
+        self.start()
+        with self.lock:
+            self.bucket(zone_code, int(now // self.bucket_time)).add(user_key, action)
+            self.dirty.add(zone_code)
+
+    def start(self):
+        self.thread.start()
+
+    def reset(self):
+        # Forked workers must neither overwrite each other's buckets nor
+        # count the decisions of their parent again.
+        with self.lock:
+            self.worker = uuid.uuid4().hex
+            self.rings = {}
+            self.dirty = set()
+
+    def dump(self, now=None, zone_codes=None):
+        first = int((now or time.time()) // self.bucket_time) - self.buckets + 1
+        with self.lock:
+            return dict((zone_code, [bucket.dump() for bucket in ring if bucket is not None and bucket.number >= first])
+                        for zone_code, ring in self.rings.items() if zone_codes is None or zone_code in zone_codes)
+
+    def publish(self, now=None):
+        now = now or time.time()
+        self.start()
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+            zone_codes = sorted(self.rings)
+        timeout = self.bucket_time * self.buckets
+        # A key per zone keeps every value far below memcached's 1MB limit.
+        # The zones without new decisions keep their key, which expires
+        # when its newest bucket leaves the window.
+        dumps = self.dump(now, dirty)
+        if dumps:
+            cache.set_many(dict((BUCKETS_KEY % (self.worker, zone_code), buckets)
+                                for zone_code, buckets in dumps.items()), timeout)
+        cache.set(ZONES_KEY % self.worker, zone_codes, timeout)
+        # Racing workers may drop each other from the list; they add
+        # themselves back at their next publish.
+        workers = cache.get(WORKERS_KEY) or {}
+        workers = dict((worker, seen) for worker, seen in workers.items() if now - seen < timeout)
+        workers[self.worker] = now
+        cache.set(WORKERS_KEY, workers, timeout)
+
+analytics = ZoneAnalytics()
+
+
+def record_decision(zone, matrix, action):
+    user = matrix.user
+    analytics.record(zone.code, user.get_username() if user.is_authenticated() else '', action)
+
+
+def summarize(zone_code=None, window=None, now=None):
+    """
+    Merges the buckets of every worker within the last ``window`` seconds
+    (all buckets by default) into, per zone: the number of requests and
+    distinct users, the top users and the count per action.
+    """
+    now = now or time.time()
+    analytics.publish(now)
+    workers = cache.get(WORKERS_KEY) or {}
+    zone_lists = cache.get_many([ZONES_KEY % worker for worker in workers])
+    keys = {}
+    for worker in workers:
+        for code in zone_lists.get(ZONES_KEY % worker, ()):
+            if zone_code is None or code == zone_code:
+                keys[BUCKETS_KEY % (worker, code)] = code
+    dumps = cache.get_many(list(keys))
+    current = int(now // analytics.bucket_time)
+    first = current - analytics.buckets + 1
+    if window:
+        first = max(first, current - int(math.ceil(float(window) / analytics.bucket_time)) + 1)
+    zones = {}
+    for key, buckets in dumps.items():
+        merged = zones.setdefault(keys[key], {'users': HyperLogLog(), 'top': Counter(), 'outcomes': Counter()})
+        for bucket in buckets:
+            if bucket['number'] < first:
+                continue
+            merged['users'].merge(HyperLogLog.load(bucket['users']))
+            merged['top'].update(bucket['top'])
+            merged['outcomes'].update(bucket['outcomes'])
+    return {
+        'window': (current - first + 1) * analytics.bucket_time,
+        'workers': len(zone_lists),
+        'zones': dict((code, {
+            'requests': sum(merged['outcomes'].values()),
+            'unique_users': merged['users'].count(),
+            'top_users': merged['top'].most_common(ZONE_ANALYTICS_TOP),
+            'outcomes': dict(merged['outcomes']),
+        }) for code, merged in zones.items()),
+    }
@@ -1,7 +1,21 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_save, post_delete
 from django.utils.translation import ugettext_lazy as _
 
 
 class AuthRequestConfig(AppConfig):
     name = 'auth_request'
     verbose_name = _("Auth Request")
+
+    def ready(self):
+        from account.bus import get_bus
+        from account.signals import users_changed
+        from .decisions import invalidate_zone_index, zone_index
+        from .models import invalidate_user_decisions
+
+        users_changed.connect(invalidate_user_decisions, dispatch_uid='auth_request_invalidate_user_decisions')
+        get_bus().subscribe('zone', zone_index.invalidate_zones)
+        for name in ('Zone', 'ZoneUser', 'ZoneGroup', 'ZoneNetwork', 'ZoneSchedule'):
+            model = self.get_model(name)
+            post_save.connect(invalidate_zone_index, sender=model, dispatch_uid='auth_request_zone_index_save')
+            post_delete.connect(invalidate_zone_index, sender=model, dispatch_uid='auth_request_zone_index_delete')
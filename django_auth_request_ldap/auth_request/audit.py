@@ -0,0 +1,271 @@
+"""
+Audit trail of access decisions, kept apart from the log.
+
+With ``ZONE_AUDIT`` enabled every decision ``do_log`` sees is stored in
+``ZONE_AUDIT_DATABASE``, in a table per (UTC) day, named
+``auth_request_access_YYYYMMDD`` and indexed on (zone, time) and (user,
+time). Queries over a time range only touch the days in the range, and
+expiring a day is a ``DROP TABLE`` rather than a huge ``DELETE``.
+Decisions are buffered per process and written by a background thread,
+with a single insert per day table, every ``ZONE_AUDIT_FLUSH_INTERVAL``
+seconds or as soon as ``ZONE_AUDIT_FLUSH_SIZE`` decisions are waiting, so
+neither the insert nor creating the day's table holds up a request.
+Whatever is still buffered when the process exits is written then.
+
+``manage.py rollup_audit`` sums the decisions per hour, zone, user and
+action into ``AccessRollup``, which is what dashboards and "who accessed
+zone X last week" should query; ``manage.py prune_audit`` drops the day
+tables older than ``ZONE_AUDIT_RETENTION_DAYS`` and the rollups older than
+``ZONE_AUDIT_ROLLUP_RETENTION_DAYS``, a bounded batch at a time.
+"""
+from django.apps.registry import Apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, models, transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from datetime import datetime, timedelta
+import atexit
+import logging
+import threading
+
+from account.background import BackgroundThread
+
+from .models import AccessRollup
+
+logger = logging.getLogger(__name__)
+
+ZONE_AUDIT = getattr(settings, 'ZONE_AUDIT', False)
+ZONE_AUDIT_DATABASE = getattr(settings, 'ZONE_AUDIT_DATABASE', DEFAULT_DB_ALIAS)
+ZONE_AUDIT_FLUSH_INTERVAL = getattr(settings, 'ZONE_AUDIT_FLUSH_INTERVAL', 1)
+ZONE_AUDIT_FLUSH_SIZE = getattr(settings, 'ZONE_AUDIT_FLUSH_SIZE', 200)
+ZONE_AUDIT_RETENTION_DAYS = getattr(settings, 'ZONE_AUDIT_RETENTION_DAYS', 90)
+ZONE_AUDIT_ROLLUP_RETENTION_DAYS = getattr(settings, 'ZONE_AUDIT_ROLLUP_RETENTION_DAYS', 730)
+
+PARTITION_PREFIX = 'auth_request_access_'
+
+# Day tables are created at runtime, so their models live outside the
+# project's app registry, where migrations don't see them.
+audit_apps = Apps()
+
+
+class AccessRecord(models.Model):
+    created = models.DateTimeField()
+    zone_code = models.CharField(max_length=128)
+    user_pk = models.IntegerField()
+    username = models.CharField(max_length=200)
+    access = models.SmallIntegerField()
+    action = models.CharField(max_length=32)
+    client_address = models.GenericIPAddressField(null=True)
+
+    class Meta:
+        abstract = True
+        app_label = 'auth_request'
+        index_together = [('zone_code', 'created'), ('username', 'created')]
+
+_partition_models = {}
+_partitions = None
+_partitions_lock = threading.Lock()
+
+
+def utc_day(value):
+    return timezone.localtime(value, timezone.utc).date() if timezone.is_aware(value) else value.date()
+
+
+def day_start(day):
+    start = datetime(day.year, day.month, day.day)
+    return timezone.make_aware(start, timezone.utc) if settings.USE_TZ else start
+
+
+def partition_model(day):
+    """
+    The model of the day table for ``day``.
+    """
+    name = '%s%s' % (PARTITION_PREFIX, day.strftime('%Y%m%d'))
+    model = _partition_models.get(name)
+    if model is None:
+        # A class statement, since the Meta of a model is an old-style
+        # class on Python 2, which type() can't derive from.
+        class Meta(AccessRecord.Meta):
+            apps = audit_apps
+            db_table = name
+        model = type(str('AccessRecord%s' % day.strftime('%Y%m%d')), (AccessRecord,),
+                     {'__module__': __name__, 'Meta': Meta})
+        _partition_models[name] = model
+    return model
+
+
+def existing_partitions(refresh=False):
+    """
+    The days that have a table, oldest first.
+    """
+    global _partitions
+    if _partitions is None or refresh:
+        with connections[ZONE_AUDIT_DATABASE].cursor() as cursor:
+            names = connections[ZONE_AUDIT_DATABASE].introspection.table_names(cursor)
+        _partitions = set(datetime.strptime(name[len(PARTITION_PREFIX):], '%Y%m%d').date()
+                          for name in names if name.startswith(PARTITION_PREFIX))
+    return sorted(_partitions)
+
+
+def ensure_partition(day):
+    if day in existing_partitions():
+        return partition_model(day)
+    with _partitions_lock:
+        if day not in existing_partitions(refresh=True):
+            try:
+                with connections[ZONE_AUDIT_DATABASE].schema_editor() as editor:
+                    editor.create_model(partition_model(day))
+            except DatabaseError:
+                # Another process may have beaten us to it.
+                if day not in existing_partitions(refresh=True):
+                    raise
+            _partitions.add(day)
+    return partition_model(day)
+
+
+class AuditBuffer(object):
+    def __init__(self, interval=ZONE_AUDIT_FLUSH_INTERVAL, size=ZONE_AUDIT_FLUSH_SIZE):
+        self.size = size
+        self.records = []
+        self.lock = threading.Lock()
+        self.thread = BackgroundThread('auth-request-audit', self.flush, interval,
+                                       error="Could not write audit records")
+
+    def add(self, record):
+        with self.lock:
+            self.records.append(record)
+            full = len(self.records) >= self.size
+        self.start()
+        if full:
+            self.thread.wake()
+
+    def start(self):
+        self.thread.start()
+
+    def flush(self):
+        """
+        Writes every buffered decision; returns the number of decisions.
+        """
+        with self.lock:
+            records, self.records = self.records, []
+        by_day = {}
+        for record in records:
+            by_day.setdefault(utc_day(record['created']), []).append(record)
+        for day, day_records in by_day.items():
+            try:
+                model = ensure_partition(day)
+                model.objects.using(ZONE_AUDIT_DATABASE).bulk_create([model(**record) for record in day_records])
+            except DatabaseError:
+                logger.exception("Could not write %d audit records", len(day_records))
+        return len(records)
+
+audit_buffer = AuditBuffer()
+atexit.register(audit_buffer.flush)
+
+
+def record_decision(zone, matrix, action):
+    user = matrix.user
+    audit_buffer.add({
+        'created': timezone.now(),
+        'zone_code': zone.code,
+        'user_pk': matrix.user_pk,
+        'username': user.get_username() if user.is_authenticated() else '',
+        'access': matrix.allowed[0],
+        'action': action,
+        'client_address': matrix.client_address or None,
+    })
+
+
+def records(since, until, zone_code=None, username=None):
+    """
+    The audited decisions from ``since`` up to ``until``, oldest first;
+    only the tables of the days in between are queried.
+    """
+    filters = {'created__gte': since, 'created__lt': until}
+    if zone_code is not None:
+        filters['zone_code'] = zone_code
+    if username is not None:
+        filters['username'] = username
+    first, last = utc_day(since), utc_day(until)
+    # Other processes create the day tables.
+    for day in existing_partitions(refresh=True):
+        if first <= day <= last:
+            model = partition_model(day)
+            for record in model.objects.using(ZONE_AUDIT_DATABASE).filter(**filters).order_by('created').iterator():
+                yield record
+
+
+def who_accessed(zone_code, since, until, action=None):
+    """
+    Users with decisions on ``zone_code`` from ``since`` up to ``until``
+    (whole hours), as ``(username, count)``, most active first.
+    """
+    qs = AccessRollup.objects.using(ZONE_AUDIT_DATABASE).filter(zone_code=zone_code, hour__gte=since, hour__lt=until)
+    if action is not None:
+        qs = qs.filter(action=action)
+    return list(qs.values_list('username').annotate(total=Sum('count')).order_by('-total'))
+
+
+def rollup_hour(hour, partitions=None):
+    """
+    (Re)computes the rollups of the hour starting at ``hour``; returns
+    the number of rollup rows. ``partitions`` are the days that have a
+    table, looked up again when not given.
+    """
+    day = utc_day(hour)
+    if partitions is None:
+        partitions = existing_partitions(refresh=True)
+    if day not in partitions:
+        return 0
+    model = partition_model(day)
+    rows = model.objects.using(ZONE_AUDIT_DATABASE).filter(
+        created__gte=hour, created__lt=hour + timedelta(hours=1)).values(
+        'zone_code', 'user_pk', 'action').annotate(count=Count('id'), username=Max('username')).order_by()
+    with transaction.atomic(using=ZONE_AUDIT_DATABASE):
+        AccessRollup.objects.using(ZONE_AUDIT_DATABASE).filter(hour=hour).delete()
+        AccessRollup.objects.using(ZONE_AUDIT_DATABASE).bulk_create([AccessRollup(hour=hour, **row) for row in rows])
+    return len(rows)
+
+
+def rollup(hours=2, now=None):
+    """
+    Rolls up the current and the ``hours - 1`` preceding hours; returns the
+    number of rollup rows.
+    """
+    now = now or timezone.now()
+    current = now.replace(minute=0, second=0, microsecond=0)
+    # The web workers create a table every (UTC) day, so a long-running
+    # rollup can't rely on the tables it saw before.
+    partitions = existing_partitions(refresh=True)
+    return sum(rollup_hour(current - timedelta(hours=offset), partitions) for offset in range(hours))
+
+
+def prune(retention_days=ZONE_AUDIT_RETENTION_DAYS, rollup_retention_days=ZONE_AUDIT_ROLLUP_RETENTION_DAYS,
+          tables=7, batch_size=10000, now=None):
+    """
+    Drops up to ``tables`` day tables past retention, oldest first, and
+    deletes expired rollups ``batch_size`` rows per query. Returns the
+    number of dropped tables and deleted rollups.
+    """
+    now = now or timezone.now()
+    cutoff = utc_day(now) - timedelta(days=retention_days)
+    dropped = 0
+    for day in existing_partitions(refresh=True):
+        if day >= cutoff or dropped >= tables:
+            break
+        with connections[ZONE_AUDIT_DATABASE].schema_editor() as editor:
+            editor.delete_model(partition_model(day))
+        _partitions.discard(day)
+        dropped += 1
+
+    rollups = AccessRollup.objects.using(ZONE_AUDIT_DATABASE)
+    expired = day_start(utc_day(now) - timedelta(days=rollup_retention_days))
+    deleted = 0
+    while True:
+        pks = list(rollups.filter(hour__lt=expired).values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        rollups.filter(pk__in=pks).delete()
+        deleted += len(pks)
+    return dropped, deleted
@@ -0,0 +1,352 @@
+from django.conf import settings
+from django.utils import timezone
+
+from collections import defaultdict
+import logging
+import math
+import threading
+import time
+
+from .enums import ZONE_ACCESS_DEFAULT, ACTION_ACCESS, ACTION_DENIED
+from .networks import PrefixTrie, network_contains
+
+logger = logging.getLogger(__name__)
+
+ZONE_COMPILED_CACHE_TIME = getattr(settings, "ZONE_COMPILED_CACHE_TIME", 30)
+
+RULE_GROUP = 0
+RULE_USER = 1
+RULE_NETWORK = 2
+RULE_SCHEDULE = 3
+
+RULE_KIND_NAMES = {
+    RULE_GROUP: 'group',
+    RULE_USER: 'user',
+    RULE_NETWORK: 'network',
+    RULE_SCHEDULE: 'schedule',
+}
+
+
+def best_rule(*rules):
+    """
+    The highest ranked of the given ``(rank, access)`` rules, ignoring
+    ``None``.
+    """
+    best = None
+    for rule in rules:
+        if rule is not None and (best is None or rule[0] > best[0]):
+            best = rule
+    return best
+
+
+def token_bucket(per_minute, burst):
+    """
+    The (tokens per second, burst) of a rate limit in requests per minute.
+    """
+    if per_minute is None:
+        return None
+    rate = per_minute / 60.0
+    return rate, burst or max(1, int(math.ceil(rate * 10)))
+
+
+def local_now():
+    now = timezone.now()
+    return timezone.localtime(now) if timezone.is_aware(now) else now
+
+
+def parse_weekdays(weekdays):
+    """
+    The set of weekdays in a schedule rule's ``weekdays``, or ``None`` when
+    it isn't made of the digits 0 to 6.
+    """
+    if not weekdays or not all(x in '0123456' for x in weekdays):
+        return None
+    return frozenset(int(x) for x in weekdays)
+
+
+def in_window(now, weekdays, start, end):
+    """
+    Whether the local time ``now`` lies in the window from ``start`` to
+    ``end`` on one of ``weekdays``; windows may span midnight, in which case
+    the part after midnight belongs to the day the window started on.
+    """
+    current = now.time()
+    if start <= end:
+        return now.weekday() in weekdays and start <= current < end
+    if current >= start:
+        return now.weekday() in weekdays
+    return current < end and (now.weekday() - 1) % 7 in weekdays
+
+
+class CompiledZone(object):
+    """
+    A zone with its rules compiled into lookup tables.
+
+    Rules are applied in order of importance and every rule that isn't
+    "default" overrides the access decided so far, so the outcome is simply
+    the applicable non-default rule with the highest rank. Each user and
+    group therefore only needs its single highest ranked rule, and
+    evaluation costs a dict lookup per group the user is in.
+
+    Ranks follow ``(order, kind, id)`` with group rules before user rules
+    before network and schedule rules, matching the stable sort of group
+    rules followed by user rules that was used before.
+
+    Network rules are kept in a prefix trie holding the best rule per
+    network, so thousands of them are matched in O(address length).
+    Schedule rules are kept best first, so evaluation stops at the first
+    window that matches.
+    """
+    def __init__(self, pk, code, name, access, enabled, rules, cache_times=None, rate_limit=None,
+                 user_rate_limit=None, fail_open=False):
+        self.pk = pk
+        self.code = code
+        self.name = name
+        self.access = access
+        self.enabled = enabled
+        self.cache_times = cache_times or {}
+        # (tokens per second, burst), or None.
+        self.rate_limit = rate_limit
+        self.user_rate_limit = user_rate_limit
+        # Whether to grant access when LDAP is unavailable.
+        self.fail_open = fail_open
+        self.group_rules = {}
+        self.user_rules = {}
+        self.network_rules = PrefixTrie()
+        self.schedule_rules = []
+        # Kept in rank order for explain().
+        self.rules = sorted(rules)
+        self.rule_count = len(self.rules)
+        for rank, (order, kind, rule_pk, key, rule_access) in enumerate(self.rules):
+            if rule_access == ZONE_ACCESS_DEFAULT:
+                continue
+            if kind == RULE_GROUP:
+                self.group_rules[key] = (rank, rule_access)
+            elif kind == RULE_USER:
+                self.user_rules[key] = (rank, rule_access)
+            elif kind == RULE_NETWORK:
+                self.network_rules.insert(key, (rank, rule_access))
+            else:
+                weekdays, start, end = key
+                days = parse_weekdays(weekdays)
+                if days is None:
+                    # Rows from before weekdays were validated.
+                    logger.warning("Skipping schedule rule %s of zone '%s': invalid weekdays %r",
+                                   rule_pk, code, weekdays)
+                    continue
+                self.schedule_rules.append((rank, rule_access, days, start, end))
+        self.schedule_rules.sort(reverse=True)
+
+    @property
+    def contextual(self):
+        """
+        Whether decisions depend on more than the user, so they can't be
+        cached per user alone.
+        """
+        return bool(self.schedule_rules) or bool(self.network_rules)
+
+    @staticmethod
+    def load_rules(**filters):
+        """
+        Loads the rules of the zones matching ``filters`` as ``{zone pk:
+        rules}``, with a single query per kind of rule.
+        """
+        from .models import ZoneGroup, ZoneUser, ZoneNetwork, ZoneSchedule
+        rules = defaultdict(list)
+        for zone_pk, pk, group_pk, access, order in ZoneGroup.objects.filter(**filters).values_list(
+                'zone_id', 'pk', 'group_id', 'access', 'order'):
+            rules[zone_pk].append((order, RULE_GROUP, pk, group_pk, access))
+        for zone_pk, pk, user_pk, access, order in ZoneUser.objects.filter(**filters).values_list(
+                'zone_id', 'pk', 'user_id', 'access', 'order'):
+            rules[zone_pk].append((order, RULE_USER, pk, user_pk, access))
+        for zone_pk, pk, network, access, order in ZoneNetwork.objects.filter(**filters).values_list(
+                'zone_id', 'pk', 'network', 'access', 'order'):
+            rules[zone_pk].append((order, RULE_NETWORK, pk, network, access))
+        for zone_pk, pk, weekdays, start, end, access, order in ZoneSchedule.objects.filter(**filters).values_list(
+                'zone_id', 'pk', 'weekdays', 'start_time', 'end_time', 'access', 'order'):
+            rules[zone_pk].append((order, RULE_SCHEDULE, pk, (weekdays, start, end), access))
+        return rules
+
+    @classmethod
+    def from_zone(cls, zone, rules=None):
+        if rules is None:
+            rules = cls.load_rules(zone=zone).get(zone.pk, [])
+        cache_times = {}
+        if zone.cache_granted is not None:
+            cache_times[ACTION_ACCESS] = zone.cache_granted
+        if zone.cache_denied is not None:
+            cache_times[ACTION_DENIED] = zone.cache_denied
+        return cls(zone.pk, zone.code, zone.name, zone.access, zone.enabled, rules, cache_times,
+                   token_bucket(zone.rate_limit, zone.rate_burst),
+                   token_bucket(zone.user_rate_limit, zone.user_rate_burst), zone.fail_open)
+
+    def best_group_rule(self, group_pks):
+        best = None
+        group_rules = self.group_rules
+        if group_rules:
+            for group_pk in group_pks:
+                rule = group_rules.get(group_pk)
+                if rule is not None and (best is None or rule[0] > best[0]):
+                    best = rule
+        return best
+
+    def best_schedule_rule(self, now):
+        if now is None:
+            return None
+        for rule in self.schedule_rules:
+            if in_window(now, rule[2], rule[3], rule[4]):
+                return rule[:2]
+        return None
+
+    def evaluate(self, user_pk, group_pks, client_address=None, now=None):
+        """
+        Returns the access for all rules, for group rules only and for user
+        rules only, each falling back to the zone's own access. ``now`` is
+        the local time, used for schedule rules.
+        """
+        by_group = self.best_group_rule(group_pks)
+        by_user = self.user_rules.get(user_pk)
+        best = best_rule(by_group, by_user)
+        if self.network_rules:
+            best = best_rule(best, self.network_rules.lookup(client_address))
+        if self.schedule_rules:
+            best = best_rule(best, self.best_schedule_rule(now))
+        return tuple(self.access if rule is None else rule[1] for rule in (best, by_group, by_user))
+
+    def rule_matches(self, kind, key, user_pk, group_pks, client_address, now):
+        if kind == RULE_GROUP:
+            return key in group_pks
+        if kind == RULE_USER:
+            return user_pk is not None and key == user_pk
+        if kind == RULE_NETWORK:
+            return network_contains(key, client_address)
+        weekdays, start, end = key
+        days = parse_weekdays(weekdays)
+        return now is not None and days is not None and in_window(now, days, start, end)
+
+    def explain(self, user_pk, group_pks, client_address=None, now=None):
+        """
+        Walks every rule in rank order, like evaluation did before rules were
+        compiled. Returns the resulting access and, for every rule that
+        applies, ``(order, kind, rule pk, key, rule access, access after
+        the rule)``. Much slower than evaluate(), but gives the same access.
+        """
+        group_pks = set(group_pks)
+        access = self.access
+        steps = []
+        for order, kind, rule_pk, key, rule_access in self.rules:
+            if not self.rule_matches(kind, key, user_pk, group_pks, client_address, now):
+                continue
+            if rule_access != ZONE_ACCESS_DEFAULT:
+                access = rule_access
+            steps.append((order, kind, rule_pk, key, rule_access, access))
+        return access, steps
+
+    def __repr__(self):
+        return "<CompiledZone: %s (%d rules)>" % (self.code, self.rule_count)
+
+
+class ZoneIndex(object):
+    """
+    Process-wide cache of compiled zones by code. Entries are dropped when
+    a zone or its rules are saved (in any process, through the invalidation
+    bus), and expire after ``ZONE_COMPILED_CACHE_TIME`` seconds.
+
+    The index also keeps the set of all zone codes, loaded with a single
+    query and refreshed just as often, so codes of zones that don't exist
+    are turned away without a query each.
+    """
+    def __init__(self):
+        self.zones = {}
+        self.known = None
+        self.lock = threading.Lock()
+
+    def known_codes(self):
+        known = self.known
+        now = time.time()
+        if known is None or now - known[0] >= ZONE_COMPILED_CACHE_TIME:
+            from .models import Zone
+            known = (now, frozenset(Zone.objects.values_list('code', flat=True)))
+            self.known = known
+        return known[1]
+
+    def load(self, code):
+        from .models import Zone
+        try:
+            zone = Zone.objects.get(code=code)
+        except Zone.DoesNotExist:
+            return None
+        return CompiledZone.from_zone(zone)
+
+    def lookup(self, code):
+        """
+        Returns the compiled zone (or ``None``) and whether it was served
+        from the index.
+        """
+        entry = self.zones.get(code)
+        now = time.time()
+        if entry is not None and now - entry[0] < ZONE_COMPILED_CACHE_TIME:
+            return entry[1], True
+        if ZONE_COMPILED_CACHE_TIME and code not in self.known_codes():
+            return None, False
+        compiled = self.load(code)
+        if compiled is not None and ZONE_COMPILED_CACHE_TIME:
+            with self.lock:
+                self.zones[code] = (now, compiled)
+        return compiled, False
+
+    def get(self, code):
+        return self.lookup(code)[0]
+
+    def preload(self):
+        """
+        Compiles every zone, with a query for the zones and one per kind of
+        rule. Returns the number of zones.
+        """
+        from .models import Zone
+        zones = list(Zone.objects.all())
+        rules = CompiledZone.load_rules()
+        now = time.time()
+        compiled = dict((zone.code, (now, CompiledZone.from_zone(zone, rules.get(zone.pk, []))))
+                        for zone in zones)
+        with self.lock:
+            self.zones.update(compiled)
+            self.known = (now, frozenset(compiled))
+        return len(compiled)
+
+    def invalidate(self, code=None):
+        with self.lock:
+            # Zones may have been added, removed or renamed.
+            self.known = None
+            if code is None:
+                self.zones.clear()
+            else:
+                self.zones.pop(code, None)
+
+    def invalidate_zones(self, pks=None):
+        """
+        Drops the zones with the given pks (all when ``None``), whatever
+        their code is by now.
+        """
+        if pks is None:
+            return self.invalidate()
+        pks = set(pks)
+        with self.lock:
+            self.known = None
+            for code, (loaded_at, compiled) in list(self.zones.items()):
+                if compiled.pk in pks:
+                    del self.zones[code]
+
+zone_index = ZoneIndex()
+
+
+def invalidate_zone_index(sender, instance=None, **kwargs):
+    """
+    Drops the compiled zone of a saved or deleted zone or rule in this and,
+    through the invalidation bus, every other process; without an instance
+    all zones are dropped.
+    """
+    from account.bus import get_bus
+    pks = None if instance is None else [getattr(instance, 'zone_id', instance.pk)]
+    zone_index.invalidate_zones(pks)
+    get_bus().publish('zone', pks)
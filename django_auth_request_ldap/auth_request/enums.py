@@ -10,6 +10,12 @@ ZONE_ACCESS = [
     (ZONE_ACCESS_DENIED, _("Denied")),
 ]
 ZONE_ACCESS_DISPLAY = dict(ZONE_ACCESS)
+# Untranslated names, for CSV files and APIs.
+ZONE_ACCESS_NAMES = {
+    ZONE_ACCESS_DEFAULT: 'default',
+    ZONE_ACCESS_ALLOWED: 'allowed',
+    ZONE_ACCESS_DENIED: 'denied',
+}
 
 ACTION_ACCESS = "access"
 ACTION_LOGIN = "login"
@@ -17,6 +23,12 @@ ACTION_LOGOUT = "logout"
 ACTION_DENIED = "access_denied"
 ACTION_DISABLED = "zone_disabled"
 ACTION_UNKNOWN = "zone_unknown"
+ACTION_RATE_LIMITED = "rate_limited"
+# Logged, never returned: decisions made while LDAP is unavailable, which
+# check_auth answers like ACTION_ACCESS or ACTION_DENIED/ACTION_LOGIN.
+ACTION_STALE = "stale_decision"
+ACTION_FAILED_OPEN = "failed_open"
+ACTION_FAILED_CLOSED = "failed_closed"
 
 ACCESS_DISPLAY = {
     ACTION_ACCESS: _("Access Granted"),
@@ -24,4 +36,8 @@ ACCESS_DISPLAY = {
     ACTION_DENIED: _("Access Denied"),
     ACTION_DISABLED: _("Zone Disabled"),
     ACTION_UNKNOWN: _("Zone Unknown"),
+    ACTION_RATE_LIMITED: _("Rate Limited"),
+    ACTION_STALE: _("Stale Decision"),
+    ACTION_FAILED_OPEN: _("Failed Open"),
+    ACTION_FAILED_CLOSED: _("Failed Closed"),
 }
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from auth_request.audit import prune, ZONE_AUDIT_RETENTION_DAYS, ZONE_AUDIT_ROLLUP_RETENTION_DAYS
+
+
+class Command(BaseCommand):
+    help = "Drops audit day tables and rollups past their retention."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=ZONE_AUDIT_RETENTION_DAYS,
+                            help="Days of audited decisions to keep.")
+        parser.add_argument('--rollup-days', type=int, default=ZONE_AUDIT_ROLLUP_RETENTION_DAYS,
+                            help="Days of rollups to keep.")
+        parser.add_argument('--tables', type=int, default=7,
+                            help="Maximum number of day tables to drop in this run.")
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help="Rollups deleted per query.")
+
+    def handle(self, *args, **options):
+        dropped, deleted = prune(options['days'], options['rollup_days'], options['tables'], options['batch_size'])
+        self.stdout.write("dropped %d day tables, deleted %d rollups" % (dropped, deleted))
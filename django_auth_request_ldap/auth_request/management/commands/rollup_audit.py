@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+import time
+
+from auth_request.audit import rollup
+
+
+class Command(BaseCommand):
+    help = "Sums audited decisions per hour, zone, user and action into the rollup table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', default=False,
+                            help="Roll up once and exit.")
+        parser.add_argument('--hours', type=int, default=2,
+                            help="Number of hours, up to the current one, to (re)compute.")
+        parser.add_argument('--interval', type=float, default=300,
+                            help="Seconds between rollups.")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.time()
+            rows = rollup(hours=options['hours'])
+            if int(options['verbosity']) > 1:
+                self.stdout.write("rolled up %d rows in %.2fs" % (rows, time.time() - started))
+            if options['once']:
+                return
+            time.sleep(max(0, options['interval'] - (time.time() - started)))
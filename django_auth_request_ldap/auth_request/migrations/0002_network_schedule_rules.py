@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import auth_request.networks
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('auth_request', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ZoneNetwork',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('network', models.CharField(help_text='An IPv4 or IPv6 network in CIDR notation, e.g. 10.0.0.0/8.', max_length=64, verbose_name='network', validators=[auth_request.networks.validate_network])),
+                ('access', models.IntegerField(default=0, verbose_name='access', choices=[(0, 'Default'), (1, 'Allowed'), (2, 'Denied')])),
+                ('order', models.IntegerField(default=10, verbose_name='order of importance')),
+                ('zone', models.ForeignKey(related_name='networks', to='auth_request.Zone')),
+            ],
+            options={
+                'ordering': ['order'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ZoneSchedule',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('weekdays', models.CharField(default='0123456', help_text='Days the window applies to, 0 (Monday) through 6 (Sunday).', max_length=7, verbose_name='weekdays')),
+                ('start_time', models.TimeField(verbose_name='start time')),
+                ('end_time', models.TimeField(help_text='May be before the start time for windows spanning midnight.', verbose_name='end time')),
+                ('access', models.IntegerField(default=0, verbose_name='access', choices=[(0, 'Default'), (1, 'Allowed'), (2, 'Denied')])),
+                ('order', models.IntegerField(default=10, verbose_name='order of importance')),
+                ('zone', models.ForeignKey(related_name='schedules', to='auth_request.Zone')),
+            ],
+            options={
+                'ordering': ['order'],
+            },
+        ),
+    ]
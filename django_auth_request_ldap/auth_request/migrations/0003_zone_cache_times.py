@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('auth_request', '0002_network_schedule_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zone',
+            name='cache_granted',
+            field=models.PositiveIntegerField(help_text='Seconds nginx may cache a granted decision; leave empty for the default.', null=True, verbose_name='cache granted for', blank=True),
+        ),
+        migrations.AddField(
+            model_name='zone',
+            name='cache_denied',
+            field=models.PositiveIntegerField(help_text='Seconds nginx may cache a denied decision; leave empty for the default.', null=True, verbose_name='cache denied for', blank=True),
+        ),
+    ]
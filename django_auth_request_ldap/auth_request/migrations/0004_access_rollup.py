@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('auth_request', '0003_zone_cache_times'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessRollup',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('hour', models.DateTimeField()),
+                ('zone_code', models.CharField(max_length=128)),
+                ('user_pk', models.IntegerField()),
+                ('username', models.CharField(max_length=200)),
+                ('action', models.CharField(max_length=32)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='accessrollup',
+            unique_together=set([('hour', 'zone_code', 'user_pk', 'action')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='accessrollup',
+            index_together=set([('zone_code', 'hour'), ('username', 'hour')]),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('auth_request', '0004_access_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zone',
+            name='rate_limit',
+            field=models.PositiveIntegerField(help_text='Granted requests per minute for all users together; leave empty for no limit.', null=True, verbose_name='rate limit', blank=True),
+        ),
+        migrations.AddField(
+            model_name='zone',
+            name='rate_burst',
+            field=models.PositiveIntegerField(help_text="Requests allowed in a burst; defaults to ten seconds' worth.", null=True, verbose_name='rate burst', blank=True),
+        ),
+        migrations.AddField(
+            model_name='zone',
+            name='user_rate_limit',
+            field=models.PositiveIntegerField(help_text='Granted requests per minute for each user; leave empty for no limit.', null=True, verbose_name='user rate limit', blank=True),
+        ),
+        migrations.AddField(
+            model_name='zone',
+            name='user_rate_burst',
+            field=models.PositiveIntegerField(help_text="Requests allowed in a burst per user; defaults to ten seconds' worth.", null=True, verbose_name='user rate burst', blank=True),
+        ),
+    ]
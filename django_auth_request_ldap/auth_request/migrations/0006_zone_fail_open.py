@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('auth_request', '0005_zone_rate_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zone',
+            name='fail_open',
+            field=models.BooleanField(default=False, help_text='Grant access when LDAP is unavailable and there is no earlier decision for the user.', verbose_name='fail open'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.core.validators
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('auth_request', '0006_zone_fail_open'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='zoneschedule',
+            name='weekdays',
+            field=models.CharField(default='0123456', help_text='Days the window applies to, 0 (Monday) through 6 (Sunday).', max_length=7, verbose_name='weekdays', validators=[django.core.validators.RegexValidator('^[0-6]+$', 'Enter the days as digits from 0 (Monday) through 6 (Sunday), e.g. 01234.', 'invalid')]),
+        ),
+    ]
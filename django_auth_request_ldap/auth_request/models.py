@@ -1,177 +1,444 @@
 from django.conf import settings
+from django.core import validators
 from django.core.cache import cache
 from django.db import models
 from django.utils import timezone
 from django.utils.encoding import python_2_unicode_compatible, force_text
 from django.utils.translation import ugettext_lazy as _
 
-from operator import attrgetter
-
 from .enums import (ZONE_ACCESS_DEFAULT, ZONE_ACCESS_ALLOWED, ZONE_ACCESS_DENIED, ZONE_ACCESS, ZONE_ACCESS_DISPLAY,
-                    ACTION_ACCESS, ACTION_DENIED, ACTION_LOGIN, ACTION_LOGOUT, ACTION_DISABLED, ACTION_UNKNOWN,
-                    ACCESS_DISPLAY)
-
+                    ZONE_ACCESS_NAMES, ACTION_ACCESS, ACTION_DENIED, ACTION_LOGIN, ACTION_LOGOUT, ACTION_DISABLED,
+                    ACTION_UNKNOWN, ACTION_RATE_LIMITED, ACTION_STALE, ACTION_FAILED_OPEN,
+                    ACTION_FAILED_CLOSED, ACCESS_DISPLAY)
+from .decisions import CompiledZone, zone_index, local_now, RULE_GROUP, RULE_USER, RULE_SCHEDULE, RULE_KIND_NAMES
+from .networks import validate_network
+from .prewarm import record_access
+from .ratelimit import check_rate_limits
+from .analytics import record_decision as count_decision
+from account.breaker import UNAVAILABLE_ERRORS, ldap_degraded, metrics, revalidate
+
+import copy
 import time
 
 import logging
 logger = logging.getLogger(__name__)
 
 ZONE_ACCESS_CACHE_TIME = getattr(settings, "ZONE_ACCESS_CACHE_TIME", 0)
+# How long past ZONE_ACCESS_CACHE_TIME a decision may be served while LDAP
+# is unavailable.
+ZONE_ACCESS_STALE_TIME = getattr(settings, "ZONE_ACCESS_STALE_TIME", 3600)
 ZONE_ACCESS_LOG_CACHED = getattr(settings, "ZONE_ACCESS_LOG_CACHED", 0)
 ZONE_ACCESS_DEFAULT_RESPONSE = getattr(settings, "ZONE_ACCESS_DEFAULT_RESPONSE", ZONE_ACCESS_DENIED)
+ZONE_AUDIT = getattr(settings, "ZONE_AUDIT", False)
+ZONE_ANALYTICS = getattr(settings, "ZONE_ANALYTICS", False)
+
+
+def invalidate_user_decisions(sender, pks, remote=False, **kwargs):
+    """
+    Drops the cached decisions of the given users for every zone.
+    """
+    if not ZONE_ACCESS_CACHE_TIME or not pks or remote:
+        return
+    keys = []
+    for zone_code in Zone.objects.values_list('code', flat=True):
+        keys.extend('process_%s_%s' % (zone_code, user_pk) for user_pk in pks)
+    cache.delete_many(keys)
 
 
 class AccessMatrix(object):
-    def __init__(self, zone, user, group_rules, user_rules):
+    def __init__(self, zone, user, client_address=None, now=None, access=None):
         self.zone = zone
         self.user = user
-        self.group_rules = group_rules
-        self.user_rules = user_rules
+        self.client_address = client_address
+        self.now = now
+        self.groups = None
+        # A known ``access`` isn't evaluated, e.g. while LDAP is unavailable.
+        self._result = (access, access, access) if access is not None else None
 
     @property
     def user_pk(self):
         return self.user.pk if self.user.is_authenticated() else 0
 
-    def _cache_matrix(self, key, rules):
-        key = '_cache_matrix_%d_%d_%s' % (self.zone.pk, self.user_pk, key)
-        if ZONE_ACCESS_CACHE_TIME:
-            data = cache.get(key, None)
-            if data is not None:
-                setattr(self, key, data[0])
-                return data
-        data = getattr(self, key, None)
-        if data is not None:
-            return data, None
-        data = self.process_rules(rules)
-        setattr(self, key, data)
-        if ZONE_ACCESS_CACHE_TIME:
-            cache.set(key, (data, time.time()), ZONE_ACCESS_CACHE_TIME)
-        return data, None
-
-    @property
-    def rules(self):
-        return self.group_rules + self.user_rules
-
-    def process_rules(self, rules):
-        print("process_rules")
-        rules = sorted(rules, key=attrgetter("order"))
-        access = self.zone.access
-        logger.debug("Default access for matrix: %s", ZONE_ACCESS_DISPLAY[access])
-        for rule in rules:
-            if rule.access != ZONE_ACCESS_DEFAULT:
-                access = rule.access
-            logger.debug(
-                "%d: Applied rule for %s %s: %s, new active access: %s",
-                rule.order,
-                rule.object.__class__.__name__,
-                rule.object,
-                ZONE_ACCESS_DISPLAY[rule.access],
-                ZONE_ACCESS_DISPLAY[access]
-            )
-        logger.debug("Done processing access: %s", ZONE_ACCESS_DISPLAY[access])
-        return access
+    def arguments(self, all_groups=False):
+        """
+        Returns the arguments for evaluating the zone's rules: the user's pk,
+        the pks of their groups, the client address and the local time.
+        With ``all_groups`` the groups are loaded even when no group rule
+        can change the access, so explanations list default group rules.
+        """
+        now = self.now
+        if now is None and self.zone.schedule_rules:
+            now = local_now()
+        if not self.user.is_authenticated():
+            self.groups = []
+            return None, [], self.client_address, now
+        # Only ask for the groups when there are group rules at all.
+        self.groups = self.user.get_groups() if all_groups or self.zone.group_rules else []
+        return self.user.pk, [g.pk for g in self.groups], self.client_address, now
+
+    def evaluate(self):
+        """
+        Evaluates the zone's compiled rules for the user once, giving the
+        access by all rules, by group rules and by user rules.
+        """
+        if self._result is None:
+            self._result = self.zone.evaluate(*self.arguments())
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Access for %r: %s (group rules: %s, user rules: %s)", self,
+                             *[ZONE_ACCESS_DISPLAY[x] for x in self._result])
+        return self._result
 
     @property
     def allowed(self):
-        return self._cache_matrix('all', self.rules)
+        return self.evaluate()[0], None
 
     @property
     def allowed_by_group(self):
-        return self._cache_matrix('group', self.group_rules)
+        return self.evaluate()[1], None
 
     @property
     def allowed_by_user(self):
-        return self._cache_matrix('user', self.user_rules)
+        return self.evaluate()[2], None
 
     def __bool__(self):
-        return self.allowed
+        return self.allowed[0] == ZONE_ACCESS_ALLOWED
     __nonzero__ = __bool__
 
     def __repr__(self):
         return "<AccessMatrix: %r: %r>" % (self.zone, self.user)
 
 
+def do_log(zone, matrix, action):
+    allowed, cached_at = matrix.allowed
+    user_pk = matrix.user_pk
+    key = 'do_log_%s_%s_%s' % (user_pk, zone.pk, allowed)
+    username = "<ANONYMOUS>" if user_pk == 0 else getattr(matrix.user, matrix.user.USERNAME_FIELD)
+    if ZONE_AUDIT:
+        from .audit import record_decision
+        record_decision(zone, matrix, action)
+    if ZONE_ANALYTICS:
+        count_decision(zone, matrix, action)
+    if ZONE_ACCESS_LOG_CACHED:
+        if cache.get(key, None):
+            return
+        cache.set(key, True, ZONE_ACCESS_LOG_CACHED)
+    logger.info("request to zone '%s' resulted in '%s'(%s) / '%s'(%s) for user '%s'(%d)",
+                zone.code,
+                ZONE_ACCESS_DISPLAY[allowed],
+                allowed,
+                ACCESS_DISPLAY[action],
+                action,
+                username,
+                user_pk,
+                )
+
+
+def decide(zone, user, access):
+    """
+    Turns the access given by a zone's rules into the action for ``user``.
+    """
+    if not zone.enabled:
+        return ACTION_DISABLED
+    if access == ZONE_ACCESS_DEFAULT:
+        access = ZONE_ACCESS_DEFAULT_RESPONSE
+    if access == ZONE_ACCESS_DENIED:
+        if not user.is_authenticated():
+            return ACTION_LOGIN
+        return ACTION_DENIED
+    return ACTION_ACCESS
+
+
+def limit_zone(zone, user, action):
+    """
+    ``ACTION_RATE_LIMITED`` when ``action`` grants ``user`` a request over
+    the rate limits of the compiled ``zone``, otherwise ``action``.
+    """
+    if action == ACTION_ACCESS and not check_rate_limits(zone, user):
+        return ACTION_RATE_LIMITED
+    return action
+
+
+def process_zone(zone, user, client_address=None, log=True, rate_limit=False):
+    """
+    Decides the action for ``user`` on the compiled ``zone``; with
+    ``rate_limit`` the zone's rate limits apply before the action is logged.
+    """
+    if not zone.enabled:
+        return ACTION_DISABLED
+
+    matrix = AccessMatrix(zone, user, client_address)
+    action = decide(zone, user, matrix.allowed[0])
+    if rate_limit:
+        action = limit_zone(zone, user, action)
+    if log:
+        do_log(zone, matrix, action)
+    return action
+
+
+def log_unavailable(zone, user, client_address, action, logged_action):
+    """
+    Logs ``action`` for ``user`` on the compiled ``zone`` as
+    ``logged_action`` without evaluating the rules, for decisions made
+    while LDAP is unavailable.
+    """
+    access = ZONE_ACCESS_ALLOWED if action in (ACTION_ACCESS, ACTION_RATE_LIMITED) else ZONE_ACCESS_DENIED
+    if action == ACTION_RATE_LIMITED:
+        logged_action = action
+    do_log(zone, AccessMatrix(zone, user, client_address, access=access), logged_action)
+
+
+def fail_zone(zone, user, rate_limit=False, client_address=None, log=True):
+    """
+    The action for ``user`` on the compiled ``zone`` when LDAP is
+    unavailable and there is no earlier decision to fall back on: access
+    for fail-open zones, denied (or login) for the others. It is logged as
+    ``ACTION_FAILED_OPEN`` or ``ACTION_FAILED_CLOSED``.
+    """
+    if not zone.enabled:
+        return ACTION_DISABLED
+    logger.warning("LDAP is unavailable, zone '%s' fails %s", zone.code, 'open' if zone.fail_open else 'closed')
+    if zone.fail_open:
+        metrics['failed_open'] += 1
+        action = limit_zone(zone, user, ACTION_ACCESS) if rate_limit else ACTION_ACCESS
+        logged_action = ACTION_FAILED_OPEN
+    else:
+        metrics['failed_closed'] += 1
+        action = decide(zone, user, ZONE_ACCESS_DENIED)
+        logged_action = ACTION_FAILED_CLOSED
+    if log:
+        log_unavailable(zone, user, client_address, action, logged_action)
+    return action
+
+
+def refresh_decision(zone_key, user, client_address=None):
+    """
+    Decides again for a stale cached decision, in the background.
+    """
+    zone = zone_index.get(zone_key)
+    if zone is None:
+        return
+    # Don't reuse the groups the stale decision was based on.
+    user = copy.copy(user)
+    user.__dict__.pop('_groups_cache', None)
+    user_pk = user.pk if user.is_authenticated() else 0
+    cache.set('process_%s_%s' % (zone_key, user_pk), (process_zone(zone, user, client_address, False), time.time()),
+              ZONE_ACCESS_CACHE_TIME + ZONE_ACCESS_STALE_TIME)
+
+
+class DecisionTrace(object):
+    """
+    How a decision came about: the rules that applied to the user in rank
+    order with the access after each, the tier that served the decision
+    and the time spent in each phase.
+    """
+    TIER_UNKNOWN = 'unknown zone'
+    TIER_DECISION_CACHE = 'decision cache'
+    TIER_ZONE_INDEX = 'zone index'
+    TIER_DATABASE = 'database'
+
+    def __init__(self, zone_code, user):
+        self.zone_code = zone_code
+        self.user = user
+        self.zone = None
+        self.action = None
+        # The action the rules give now, which differs from ``action`` when
+        # a cached decision was served that the rules no longer give.
+        self.fresh_action = None
+        self.access = None
+        self.tier = None
+        self.steps = []
+        self.timings = []
+
+    def timed(self, phase, func, *args):
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            self.timings.append((phase, (time.time() - start) * 1000.0))
+
+    def label(self, kind, key, groups):
+        if kind == RULE_GROUP:
+            for group in groups:
+                if group.pk == key:
+                    return force_text(group.name)
+        elif kind == RULE_USER:
+            return force_text(self.user.get_username())
+        elif kind == RULE_SCHEDULE:
+            weekdays, start, end = key
+            return "%s %s-%s" % (weekdays, start.strftime("%H:%M"), end.strftime("%H:%M"))
+        return force_text(key)
+
+    @property
+    def stale(self):
+        return self.fresh_action is not None and self.action != self.fresh_action
+
+    @property
+    def total_time(self):
+        return sum(duration for phase, duration in self.timings)
+
+    def as_dict(self):
+        return {
+            'zone': self.zone_code,
+            'zone_name': self.zone.name if self.zone is not None else None,
+            'enabled': self.zone.enabled if self.zone is not None else None,
+            'default_access': ZONE_ACCESS_NAMES.get(self.zone.access) if self.zone is not None else None,
+            'action': self.action,
+            'fresh_action': self.fresh_action,
+            'stale': self.stale,
+            'access': ZONE_ACCESS_NAMES.get(self.access),
+            'tier': self.tier,
+            'rules': [dict(step, access=ZONE_ACCESS_NAMES[step['access']],
+                           result=ZONE_ACCESS_NAMES[step['result']]) for step in self.steps],
+            'timings': dict(self.timings),
+            'total_time': self.total_time,
+        }
+
+    def __repr__(self):
+        return "<DecisionTrace: %s: %s (%s)>" % (self.zone_code, self.action, self.tier)
+
+
+def explain_zone(zone_key, user, client_address=None):
+    """
+    Decides the action for ``user`` on the zone ``zone_key`` the way
+    ``Zone.process_request`` does, in a single pass that also records why.
+    Nothing is logged or cached.
+    """
+    trace = DecisionTrace(zone_key, user)
+    zone, indexed = trace.timed('zone', zone_index.lookup, zone_key)
+    trace.zone = zone
+    if zone is None:
+        trace.action, trace.tier = ACTION_UNKNOWN, trace.TIER_UNKNOWN
+        return trace
+
+    if ZONE_ACCESS_CACHE_TIME and not zone.contextual:
+        user_pk = user.pk if user.is_authenticated() else 0
+        cached = trace.timed('cache', cache.get, 'process_%s_%s' % (zone_key, user_pk))
+        if cached is not None and (time.time() - cached[1] < ZONE_ACCESS_CACHE_TIME or ldap_degraded()):
+            trace.action, trace.tier = cached[0], trace.TIER_DECISION_CACHE
+
+    matrix = AccessMatrix(zone, user, client_address)
+    arguments = trace.timed('groups', matrix.arguments, True)
+    trace.access, steps = trace.timed('rules', zone.explain, *arguments)
+    for order, kind, rule_pk, key, rule_access, result in steps:
+        trace.steps.append({
+            'order': order,
+            'kind': RULE_KIND_NAMES[kind],
+            'id': rule_pk,
+            'name': trace.label(kind, key, matrix.groups),
+            'access': rule_access,
+            'result': result,
+        })
+    trace.fresh_action = decide(zone, user, trace.access)
+    if trace.action is None:
+        trace.action = trace.fresh_action
+        trace.tier = trace.TIER_ZONE_INDEX if indexed else trace.TIER_DATABASE
+    return trace
+
+
 @python_2_unicode_compatible
 class Zone(models.Model):
     name = models.CharField(max_length=128)
     code = models.SlugField(max_length=128)
     access = models.IntegerField(_("access"), choices=ZONE_ACCESS, default=ZONE_ACCESS_DEFAULT)
     enabled = models.BooleanField(default=True)
-
-    def for_user(self, user):
-        if not user.is_authenticated():
-            return AccessMatrix(self, user, [], [])
-        groups = user.groups.all()
-        group_rules = list(self.groups.filter(group_id__in=[g.pk for g in groups]))
-        user_rules = list(self.users.filter(user=user))
-        return AccessMatrix(self, user, group_rules, user_rules)
+    cache_granted = models.PositiveIntegerField(
+        _("cache granted for"), null=True, blank=True,
+        help_text=_("Seconds nginx may cache a granted decision; leave empty for the default."))
+    cache_denied = models.PositiveIntegerField(
+        _("cache denied for"), null=True, blank=True,
+        help_text=_("Seconds nginx may cache a denied decision; leave empty for the default."))
+    rate_limit = models.PositiveIntegerField(
+        _("rate limit"), null=True, blank=True,
+        help_text=_("Granted requests per minute for all users together; leave empty for no limit."))
+    rate_burst = models.PositiveIntegerField(
+        _("rate burst"), null=True, blank=True,
+        help_text=_("Requests allowed in a burst; defaults to ten seconds' worth."))
+    user_rate_limit = models.PositiveIntegerField(
+        _("user rate limit"), null=True, blank=True,
+        help_text=_("Granted requests per minute for each user; leave empty for no limit."))
+    user_rate_burst = models.PositiveIntegerField(
+        _("user rate burst"), null=True, blank=True,
+        help_text=_("Requests allowed in a burst per user; defaults to ten seconds' worth."))
+    fail_open = models.BooleanField(
+        _("fail open"), default=False,
+        help_text=_("Grant access when LDAP is unavailable and there is no earlier decision for the user."))
+
+    def compile(self):
+        return CompiledZone.from_zone(self)
+
+    def for_user(self, user, client_address=None):
+        return AccessMatrix(self.compile(), user, client_address)
 
     @classmethod
-    def process_request(self, user, zone_key):
+    def process_request(self, user, zone_key, client_address=None, log=True, user_unavailable=False,
+                        rate_limit=False):
+        """
+        Decides the action for ``user`` on the zone ``zone_key``, as
+        ``(action, cached_at)``; ``cached_at`` is None unless the decision
+        came from the cache. With ``rate_limit`` granted requests over the
+        zone's rate limits are ``ACTION_RATE_LIMITED``; the cache keeps the
+        decision of the rules.
+
+        While LDAP is unavailable cached decisions are served past their
+        cache time, logged as ``ACTION_STALE``, and refreshed in the
+        background; without one, or when the user itself couldn't be loaded
+        (``user_unavailable``), the zone's ``fail_open`` decides.
+        """
+        zone = zone_index.get(zone_key)
+        if zone is None:
+            return ACTION_UNKNOWN, None
+        if user_unavailable:
+            return fail_zone(zone, user, rate_limit, client_address, log), None
+        if log:
+            record_access(user, zone_key)
+
         if not user.is_authenticated():
             user_pk = 0
         else:
             user_pk = user.pk
         key = 'process_%s_%s' % (zone_key, user_pk)
-
-        if ZONE_ACCESS_CACHE_TIME:
+        # Decisions that depend on the client address or time of day are
+        # cheap to evaluate but can't be shared per user.
+        cacheable = ZONE_ACCESS_CACHE_TIME and not zone.contextual
+
+        def served(data, stale=False):
+            action = limit_zone(zone, user, data[0]) if rate_limit else data[0]
+            if stale and log:
+                log_unavailable(zone, user, client_address, action, ACTION_STALE)
+            return action, data[1]
+
+        stale = None
+        if cacheable:
             data = cache.get(key, None)
             if data is not None:
-                return data
+                if time.time() - data[1] < ZONE_ACCESS_CACHE_TIME:
+                    return served(data)
+                if ldap_degraded():
+                    metrics['stale_decisions'] += 1
+                    revalidate(key, refresh_decision, zone_key, user, client_address)
+                    return served(data, True)
+                stale = data
 
         try:
-            zone = Zone.objects.get(code=zone_key)
-        except Zone.DoesNotExist:
-            return ACTION_UNKNOWN, None
-
-        data = zone.process(user)
-
-        if ZONE_ACCESS_CACHE_TIME:
-            cache.set(key, (data, time.time()), ZONE_ACCESS_CACHE_TIME)
+            data = process_zone(zone, user, client_address, log, rate_limit)
+        except UNAVAILABLE_ERRORS:
+            if stale is not None:
+                metrics['stale_decisions'] += 1
+                return served(stale, True)
+            return fail_zone(zone, user, rate_limit, client_address, log), None
+
+        if cacheable:
+            # Only granted requests are rate limited.
+            decision = ACTION_ACCESS if data == ACTION_RATE_LIMITED else data
+            cache.set(key, (decision, time.time()), ZONE_ACCESS_CACHE_TIME + ZONE_ACCESS_STALE_TIME)
         return data, None
 
-    def do_log(self, matrix, action):
-        allowed, cached_at = matrix.allowed
-        user_pk = matrix.user_pk
-        key = 'do_log_%s_%s_%s' % (user_pk, matrix.zone.pk, allowed)
-        username = "<ANONYMOUS>" if user_pk == 0 else getattr(matrix.user, matrix.user.USERNAME_FIELD)
-        if ZONE_ACCESS_LOG_CACHED:
-            if cache.get(key, None):
-                return
-            cache.set(key, True, ZONE_ACCESS_LOG_CACHED)
-        logger.info("request to zone '%s' resulted in '%s'(%s) / '%s'(%s) for user '%s'(%d)",
-                    self.code,
-                    ZONE_ACCESS_DISPLAY[allowed],
-                    allowed,
-                    ACCESS_DISPLAY[action],
-                    action,
-                    username,
-                    user_pk,
-                    )
-
-    def process(self, user):
-        if not self.enabled:
-            return ACTION_DISABLED
-
-        matrix = self.for_user(user)
-
-        def _log(action):
-            self.do_log(matrix, action)
-            return action
-
-        access, cached_at = matrix.allowed
-        if access == ZONE_ACCESS_DEFAULT:
-            access = ZONE_ACCESS_DEFAULT_RESPONSE
-
-        if access == ZONE_ACCESS_DENIED:
-            if not user.is_authenticated():
-                return _log(ACTION_LOGIN)
-            return _log(ACTION_DENIED)
-
-        if access == ZONE_ACCESS_DENIED:
-            return _log(ACTION_DENIED)
-
-        return _log(ACTION_ACCESS)
+    def process(self, user, client_address=None):
+        return process_zone(self.compile(), user, client_address)
+
+    @classmethod
+    def explain_request(cls, user, zone_key, client_address=None):
+        return explain_zone(zone_key, user, client_address)
 
     def __str__(self):
         return self.name
@@ -217,3 +484,75 @@ class ZoneGroup(models.Model):
 
     def __str__(self):
         return force_text(self.group)
+
+
+@python_2_unicode_compatible
+class ZoneNetwork(models.Model):
+    zone = models.ForeignKey(Zone, related_name="networks")
+    network = models.CharField(_("network"), max_length=64, validators=[validate_network],
+                               help_text=_("An IPv4 or IPv6 network in CIDR notation, e.g. 10.0.0.0/8."))
+    access = models.IntegerField(_("access"), choices=ZONE_ACCESS, default=ZONE_ACCESS_DEFAULT)
+    order = models.IntegerField(_("order of importance"), default=10)
+
+    @property
+    def object(self):
+        return self.network
+
+    class Meta:
+        ordering = ['order']
+
+    def __repr__(self):
+        return "<%s: %s (%s)>" % (self.__class__.__name__, self.network, ZONE_ACCESS_DISPLAY.get(self.access))
+
+    def __str__(self):
+        return self.network
+
+
+weekdays_validator = validators.RegexValidator(r'^[0-6]+$', _("Enter the days as digits from 0 (Monday) through "
+                                                                "6 (Sunday), e.g. 01234."), 'invalid')
+
+
+@python_2_unicode_compatible
+class ZoneSchedule(models.Model):
+    zone = models.ForeignKey(Zone, related_name="schedules")
+    weekdays = models.CharField(_("weekdays"), max_length=7, default="0123456", validators=[weekdays_validator],
+                                help_text=_("Days the window applies to, 0 (Monday) through 6 (Sunday)."))
+    start_time = models.TimeField(_("start time"))
+    end_time = models.TimeField(_("end time"),
+                                help_text=_("May be before the start time for windows spanning midnight."))
+    access = models.IntegerField(_("access"), choices=ZONE_ACCESS, default=ZONE_ACCESS_DEFAULT)
+    order = models.IntegerField(_("order of importance"), default=10)
+
+    @property
+    def object(self):
+        return force_text(self)
+
+    class Meta:
+        ordering = ['order']
+
+    def __repr__(self):
+        return "<%s: %s (%s)>" % (self.__class__.__name__, self, ZONE_ACCESS_DISPLAY.get(self.access))
+
+    def __str__(self):
+        return "%s %s-%s" % (self.weekdays, self.start_time.strftime("%H:%M"), self.end_time.strftime("%H:%M"))
+
+
+class AccessRollup(models.Model):
+    """
+    Hourly counts of audited decisions per zone, user and action; see
+    ``auth_request.audit``.
+    """
+    hour = models.DateTimeField()
+    zone_code = models.CharField(max_length=128)
+    user_pk = models.IntegerField()
+    username = models.CharField(max_length=200)
+    action = models.CharField(max_length=32)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [('hour', 'zone_code', 'user_pk', 'action')]
+        index_together = [('zone_code', 'hour'), ('username', 'hour')]
+
+    def __repr__(self):
+        return "<%s: %s %s %s %s x%d>" % (self.__class__.__name__, self.hour, self.zone_code, self.username,
+                                          ACCESS_DISPLAY.get(self.action), self.count)
@@ -0,0 +1,116 @@
+from django.core.exceptions import ValidationError
+from django.utils.translation import ugettext_lazy as _
+
+import binascii
+import socket
+
+FAMILIES = {4: (socket.AF_INET, 32), 6: (socket.AF_INET6, 128)}
+
+
+def parse_address(text):
+    """
+    Returns ``(version, address as int)`` for an IPv4 or IPv6 address, or
+    ``None`` if it isn't one.
+    """
+    text = text.strip()
+    version = 6 if ':' in text else 4
+    try:
+        packed = socket.inet_pton(FAMILIES[version][0], text)
+    except (socket.error, ValueError, UnicodeEncodeError):
+        return None
+    return version, int(binascii.hexlify(packed), 16)
+
+
+def parse_network(text):
+    """
+    Returns ``(version, network as int, prefix length)`` for CIDR notation
+    (a bare address is a host network); raises ValueError otherwise.
+    """
+    address, _sep, prefix = text.strip().partition('/')
+    parsed = parse_address(address)
+    if parsed is None:
+        raise ValueError("invalid network address: %r" % text)
+    version, value = parsed
+    bits = FAMILIES[version][1]
+    prefix = int(prefix) if prefix else bits
+    if not 0 <= prefix <= bits:
+        raise ValueError("invalid prefix length: %r" % text)
+    # Ignore host bits, like most network configuration does.
+    value &= ((1 << bits) - 1) ^ ((1 << (bits - prefix)) - 1)
+    return version, value, prefix
+
+
+def network_contains(network, address):
+    """
+    Whether ``address`` lies in ``network``, both given as text.
+    """
+    parsed = parse_address(address) if address else None
+    if parsed is None:
+        return False
+    version, value, prefix = parse_network(network)
+    bits = FAMILIES[version][1]
+    return parsed[0] == version and (parsed[1] ^ value) >> (bits - prefix) == 0
+
+
+def validate_network(value):
+    try:
+        parse_network(value)
+    except ValueError:
+        raise ValidationError(_("Enter a valid IPv4 or IPv6 network, like 10.0.0.0/8 or 2001:db8::/32."),
+                              code='invalid')
+
+
+class PrefixTrie(object):
+    """
+    Binary trie of IPv4 and IPv6 networks. Every network carries a value;
+    a lookup returns the greatest value of all networks that contain the
+    address, in time proportional to the address length rather than the
+    number of networks.
+    """
+    def __init__(self):
+        # Nodes are [zero child, one child, value].
+        self.roots = {4: [None, None, None], 6: [None, None, None]}
+        self.size = 0
+
+    def insert(self, network, value):
+        version, address, prefix = parse_network(network)
+        bits = FAMILIES[version][1]
+        node = self.roots[version]
+        for depth in range(prefix):
+            bit = (address >> (bits - 1 - depth)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[2] is None or value > node[2]:
+            node[2] = value
+        self.size += 1
+
+    def lookup(self, address):
+        parsed = parse_address(address) if address else None
+        if parsed is None:
+            return None
+        version, address = parsed
+        bits = FAMILIES[version][1]
+        node = self.roots[version]
+        best = node[2]
+        for depth in range(bits):
+            node = node[(address >> (bits - 1 - depth)) & 1]
+            if node is None:
+                break
+            if node[2] is not None and (best is None or node[2] > best):
+                best = node[2]
+        return best
+
+    def __len__(self):
+        return self.size
+
+
+def client_address(request):
+    """
+    The client address as set by nginx in ``X-Forwarded-For`` (see
+    nginx/auth_request_params), falling back to the peer address.
+    """
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    if forwarded:
+        return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
@@ -0,0 +1,240 @@
+"""
+Prewarming of a fresh worker's caches, so it doesn't meet its first burst
+of traffic with nothing but LDAP and database round trips.
+
+Prewarming compiles every zone into the zone index, then loads the most
+active users and decides their most used zones, which fills the session
+user and decision caches. The active users come from the hot-set snapshot
+that workers write to ``ZONE_PREWARM_SNAPSHOT`` as they serve requests or,
+failing that, from the nginx access log at ``ZONE_PREWARM_ACCESS_LOG``.
+Counts in the hot set halve every ``ZONE_PREWARM_HALF_LIFE`` seconds, so
+it follows who is active now rather than who ever was.
+At most ``ZONE_PREWARM_CONCURRENCY`` users are loaded at a time, to keep
+LDAP from a spike when a whole fleet restarts.
+
+The WSGI module prewarms before it returns the application, so a worker
+only serves requests once it is warm; ``ready/`` answers 503 until then,
+for load balancer health checks.
+"""
+from django.conf import settings
+from django.db import connections
+from django.utils.six.moves import queue
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ZONE_PREWARM = getattr(settings, "ZONE_PREWARM", True)
+ZONE_PREWARM_USERS = getattr(settings, "ZONE_PREWARM_USERS", 200)
+ZONE_PREWARM_CONCURRENCY = getattr(settings, "ZONE_PREWARM_CONCURRENCY", 4)
+ZONE_PREWARM_TIMEOUT = getattr(settings, "ZONE_PREWARM_TIMEOUT", 30)
+ZONE_PREWARM_SNAPSHOT = getattr(settings, "ZONE_PREWARM_SNAPSHOT", None)
+ZONE_PREWARM_SNAPSHOT_INTERVAL = getattr(settings, "ZONE_PREWARM_SNAPSHOT_INTERVAL", 60)
+ZONE_PREWARM_HALF_LIFE = getattr(settings, "ZONE_PREWARM_HALF_LIFE", 3600)
+ZONE_PREWARM_ACCESS_LOG = getattr(settings, "ZONE_PREWARM_ACCESS_LOG", None)
+# The combined log format followed by the zone, see benchmarks/replay.py.
+ZONE_PREWARM_ACCESS_LOG_PATTERN = getattr(
+    settings, "ZONE_PREWARM_ACCESS_LOG_PATTERN",
+    r'\S+ \S+ (?P<user>\S+) \[[^\]]+\] "[^"]*" \d+ \S+ "[^"]*" "[^"]*" (?P<zone>\S+)')
+
+_ready = threading.Event()
+
+
+class HotSet(object):
+    """
+    Counts requests per user and zone, keeping roughly the ``size`` most
+    active users. Counts decay by half every ``half_life`` seconds.
+    """
+    # Decayed counts below this are forgotten.
+    min_count = 0.1
+
+    def __init__(self, size, half_life=ZONE_PREWARM_HALF_LIFE):
+        self.size = size
+        self.half_life = half_life
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.saved_at = self.decayed_at = time.time()
+
+    def record(self, username, zone_code, count=1):
+        with self.lock:
+            zones = self.counts.setdefault(username, {})
+            zones[zone_code] = zones.get(zone_code, 0) + count
+            if len(self.counts) > self.size * 10:
+                self.counts = dict(self.top_items(self.size))
+
+    def decay(self):
+        now = time.time()
+        with self.lock:
+            if not self.half_life:
+                return
+            factor = 0.5 ** ((now - self.decayed_at) / float(self.half_life))
+            self.decayed_at = now
+            counts = {}
+            for username, zones in self.counts.items():
+                zones = dict((code, count * factor) for code, count in zones.items()
+                             if count * factor >= self.min_count)
+                if zones:
+                    counts[username] = zones
+            self.counts = counts
+
+    def top_items(self, count):
+        return sorted(self.counts.items(), key=lambda item: -sum(item[1].values()))[:count]
+
+    def top(self, count):
+        """
+        Returns the ``count`` most active users, with the zones they use most
+        first.
+        """
+        with self.lock:
+            items = self.top_items(count)
+        return [(username, sorted(zones, key=lambda code: -zones[code])) for username, zones in items]
+
+    def save(self, path):
+        self.decay()
+        with self.lock:
+            data = json.dumps(dict(self.top_items(self.size)))
+            self.saved_at = time.time()
+        # Written aside and renamed, as other workers read and write it too.
+        temp = '%s.%d' % (path, os.getpid())
+        with open(temp, 'w') as f:
+            f.write(data)
+        os.rename(temp, path)
+
+    def load(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        for username, zones in data.items():
+            for zone_code, count in zones.items():
+                self.record(username, zone_code, count)
+
+    def merge(self, other):
+        with other.lock:
+            items = [(username, dict(zones)) for username, zones in other.counts.items()]
+        for username, zones in items:
+            for zone_code, count in zones.items():
+                self.record(username, zone_code, count)
+
+hot_set = HotSet(ZONE_PREWARM_USERS)
+
+
+def record_access(user, zone_code):
+    """
+    Counts a request towards the hot set, saving a snapshot every
+    ``ZONE_PREWARM_SNAPSHOT_INTERVAL`` seconds.
+    """
+    if not ZONE_PREWARM_SNAPSHOT or not user.is_authenticated():
+        return
+    hot_set.record(user.get_username(), zone_code)
+    if time.time() - hot_set.saved_at >= ZONE_PREWARM_SNAPSHOT_INTERVAL:
+        try:
+            hot_set.save(ZONE_PREWARM_SNAPSHOT)
+        except (IOError, OSError):
+            logger.exception("Could not save the hot set to %s", ZONE_PREWARM_SNAPSHOT)
+
+
+def read_access_log(path, pattern=ZONE_PREWARM_ACCESS_LOG_PATTERN):
+    pattern = re.compile(pattern)
+    found = HotSet(ZONE_PREWARM_USERS)
+    with open(path) as f:
+        for line in f:
+            match = pattern.match(line)
+            if match is not None and match.group('user') != '-':
+                found.record(match.group('user'), match.group('zone'))
+    return found
+
+
+def load_hot_set():
+    if ZONE_PREWARM_SNAPSHOT and os.path.exists(ZONE_PREWARM_SNAPSHOT):
+        found = HotSet(ZONE_PREWARM_USERS)
+        found.load(ZONE_PREWARM_SNAPSHOT)
+        # Keep counting on top of the previous snapshot.
+        hot_set.merge(found)
+        return found
+    if ZONE_PREWARM_ACCESS_LOG and os.path.exists(ZONE_PREWARM_ACCESS_LOG):
+        return read_access_log(ZONE_PREWARM_ACCESS_LOG)
+    return None
+
+
+def close_connections():
+    for connection in connections.all():
+        connection.close()
+
+
+def warm_user(username, zone_codes):
+    from django.contrib.auth import get_user_model
+    from account.sessions import cache_session_user, fetch_session_user
+    from .models import Zone
+    User = get_user_model()
+    try:
+        user = fetch_session_user(**{User.USERNAME_FIELD: username})
+    except User.DoesNotExist:
+        return
+    cache_session_user(user)
+    for zone_code in zone_codes:
+        Zone.process_request(user, zone_code, log=False)
+
+
+def prewarm(users=ZONE_PREWARM_USERS, concurrency=ZONE_PREWARM_CONCURRENCY, timeout=ZONE_PREWARM_TIMEOUT):
+    """
+    Warms this process's caches and marks it ready; gives up on the users
+    after ``timeout`` seconds, leaving the ones being warmed to finish in
+    the background. Returns the number of warmed users.
+    """
+    from .decisions import zone_index
+    start = time.time()
+    stop = threading.Event()
+    try:
+        zones = zone_index.preload()
+        found = load_hot_set()
+        work = queue.Queue()
+        for item in (found.top(users) if found is not None else []):
+            work.put(item)
+        total = work.qsize()
+
+        def worker():
+            try:
+                while not stop.is_set():
+                    try:
+                        username, zone_codes = work.get_nowait()
+                    except queue.Empty:
+                        return
+                    try:
+                        warm_user(username, zone_codes)
+                    except Exception:
+                        logger.exception("Could not prewarm %s", username)
+            finally:
+                close_connections()
+
+        threads = [threading.Thread(target=worker, name='prewarm-%d' % i) for i in range(min(concurrency, total))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join(max(0, timeout - (time.time() - start)))
+        stop.set()
+        logger.info("Prewarmed %d zones and %d users in %.1fs", zones, total - work.qsize(),
+                    time.time() - start)
+        return total - work.qsize()
+    except Exception:
+        logger.exception("Prewarming failed")
+        return 0
+    finally:
+        # Don't hand connections opened here to processes forked from us.
+        close_connections()
+        _ready.set()
+
+
+def prewarm_on_start():
+    if ZONE_PREWARM:
+        prewarm()
+    else:
+        _ready.set()
+
+
+def is_ready():
+    return _ready.is_set()
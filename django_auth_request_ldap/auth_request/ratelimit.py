@@ -0,0 +1,119 @@
+"""
+Token-bucket rate limits per zone and per (user, zone).
+
+Buckets live in the worker, so a check is a dict lookup and some
+arithmetic. A background thread reconciles them with the other workers
+every ``ZONE_RATE_LIMIT_SYNC_INTERVAL`` seconds: it adds the requests this
+worker let through to a counter per bucket in the shared cache and takes
+whatever the other workers added since the previous sync out of the local
+bucket. Between syncs the fleet can overshoot a limit by what the other
+workers let through in one interval.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+import threading
+import time
+
+from account.background import BackgroundThread
+
+ZONE_RATE_LIMIT_SYNC_INTERVAL = getattr(settings, 'ZONE_RATE_LIMIT_SYNC_INTERVAL', 1)
+# Buckets unused for this long are forgotten, and their counters expire.
+ZONE_RATE_LIMIT_IDLE_TIME = getattr(settings, 'ZONE_RATE_LIMIT_IDLE_TIME', 600)
+
+
+class TokenBucket(object):
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = now
+        # Requests let through since the last sync.
+        self.pending = 0
+        # The shared counter as of the last sync.
+        self.seen = None
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def take(self, now):
+        self.refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        self.pending += 1
+        return True
+
+
+class RateLimiter(object):
+    def __init__(self, interval=ZONE_RATE_LIMIT_SYNC_INTERVAL):
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.thread = BackgroundThread('zone-rate-limits', self.sync, interval, on_start=self.reset,
+                                       error="Could not sync rate limits")
+
+    def start(self):
+        self.thread.start()
+
+    def reset(self):
+        # The parent's pending counts are its own to sync.
+        with self.lock:
+            self.buckets = {}
+
+    def allow(self, key, rate, burst, now=None):
+        """
+        Takes a token from the bucket ``key``, filling at ``rate`` tokens a
+        second up to ``burst``; returns whether there was one.
+        """
+        now = now or time.time()
+        self.start()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None or (bucket.rate, bucket.burst) != (rate, burst):
+                bucket = self.buckets[key] = TokenBucket(rate, burst, now)
+            return bucket.take(now)
+
+    def sync(self, now=None):
+        now = now or time.time()
+        with self.lock:
+            for key, bucket in list(self.buckets.items()):
+                if now - bucket.updated_at >= ZONE_RATE_LIMIT_IDLE_TIME:
+                    del self.buckets[key]
+            work = [(key, bucket, bucket.pending) for key, bucket in self.buckets.items()]
+            for key, bucket, pending in work:
+                bucket.pending = 0
+        for key, bucket, pending in work:
+            cache_key = 'ratelimit_%s' % key
+            total = self.add(cache_key, pending)
+            with self.lock:
+                if bucket.seen is not None and total >= bucket.seen + pending:
+                    # What the other workers let through since the last sync.
+                    bucket.tokens -= total - bucket.seen - pending
+                bucket.seen = total
+
+    def add(self, cache_key, count):
+        if cache.add(cache_key, count, ZONE_RATE_LIMIT_IDLE_TIME):
+            return count
+        try:
+            return cache.incr(cache_key, count) if count else cache.get(cache_key, 0)
+        except ValueError:
+            # Expired between add() and incr().
+            cache.add(cache_key, count, ZONE_RATE_LIMIT_IDLE_TIME)
+            return count
+
+limiter = RateLimiter()
+
+
+def check_rate_limits(zone, user):
+    """
+    Whether a granted request of ``user`` to the compiled ``zone`` is
+    within the zone's limits.
+    """
+    # Users over their own limit don't use up the zone's budget.
+    if zone.user_rate_limit is not None and user.is_authenticated():
+        if not limiter.allow('user_%s_%s' % (zone.pk, user.pk), *zone.user_rate_limit):
+            return False
+    if zone.rate_limit is not None:
+        return limiter.allow('zone_%s' % zone.pk, *zone.rate_limit)
+    return True
@@ -0,0 +1,211 @@
+"""
+Bulk management of zone rules: CSV import and export, and renumbering,
+without a query per rule.
+
+User and group rules are exported by username and group name; those are
+resolved with one LDAP search per ``LOOKUP_CHUNK_SIZE`` names instead of a
+lookup per row. Rules for entries that no longer exist in LDAP are
+exported as ``#<id>``, which the import accepts as well.
+"""
+from django.core.exceptions import ValidationError
+from django.db import router, transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.utils.encoding import force_text
+from django.utils.translation import ugettext as _
+
+import csv
+
+from .decisions import invalidate_zone_index
+from .enums import ZONE_ACCESS_NAMES
+from .models import Zone, ZoneUser, ZoneGroup, ZoneNetwork, ZoneSchedule
+
+LOOKUP_CHUNK_SIZE = 100
+
+CSV_COLUMNS = ['kind', 'name', 'access', 'order']
+
+ACCESS_VALUES = dict((name, value) for value, name in ZONE_ACCESS_NAMES.items())
+
+# Rule kinds that refer to LDAP entries, in the order they rank at equal
+# order: (rule model, foreign key field).
+NAMED_RULES = [
+    ('group', ZoneGroup, 'group'),
+    ('user', ZoneUser, 'user'),
+]
+# All rule models, in the order they rank at equal order.
+RULE_MODELS = [ZoneGroup, ZoneUser, ZoneNetwork, ZoneSchedule]
+
+
+def _chunks(values, size=LOOKUP_CHUNK_SIZE):
+    values = list(values)
+    for offset in range(0, len(values), size):
+        yield values[offset:offset + size]
+
+
+def _target(rule_model, field):
+    """
+    Returns the LDAP model a rule refers to and the attribute naming it.
+    """
+    model = rule_model._meta.get_field(field).rel.to
+    return model, getattr(model, 'USERNAME_FIELD', 'name')
+
+
+def names_for(rule_model, field, pks):
+    """
+    Maps the primary keys of the entries referred to by ``field`` of
+    ``rule_model`` to their names.
+    """
+    model, name_field = _target(rule_model, field)
+    names = {}
+    for chunk in _chunks(set(pks)):
+        for obj in model.objects.filter(pk__in=chunk):
+            names[obj.pk] = getattr(obj, name_field)
+    return names
+
+
+def pks_for(rule_model, field, names):
+    """
+    Maps names of the entries referred to by ``field`` of ``rule_model`` to
+    their primary keys; names that don't exist are left out.
+    """
+    model, name_field = _target(rule_model, field)
+    pks = {}
+    for chunk in _chunks(set(names)):
+        for obj in model.objects.filter(**{'%s__in' % name_field: chunk}):
+            pks[getattr(obj, name_field)] = obj.pk
+    return pks
+
+
+def export_rules(zone, out):
+    """
+    Writes the user and group rules of ``zone`` to the file-like ``out``
+    as CSV.
+    """
+    writer = csv.writer(out)
+    writer.writerow(CSV_COLUMNS)
+    for kind, rule_model, field in NAMED_RULES:
+        rows = list(rule_model.objects.filter(zone=zone).values_list('%s_id' % field, 'access', 'order'))
+        names = names_for(rule_model, field, [row[0] for row in rows])
+        for pk, access, order in rows:
+            name = names.get(pk, '#%s' % pk)
+            writer.writerow([kind, name, ZONE_ACCESS_NAMES.get(access, access), order])
+
+
+def parse_rules(lines):
+    """
+    Parses CSV rules as written by ``export_rules``. Returns a mapping of
+    kind to ``{name: (access, order)}``; raises ValidationError listing
+    every invalid line.
+    """
+    parsed = dict((kind, {}) for kind, rule_model, field in NAMED_RULES)
+    errors = []
+    for line, row in enumerate(csv.DictReader(lines), 2):
+        kind = force_text(row.get('kind') or '').strip().lower()
+        name = force_text(row.get('name') or '').strip()
+        access = force_text(row.get('access') or '').strip().lower()
+        order = force_text(row.get('order') or '').strip()
+        if kind not in parsed:
+            errors.append(_("Line %(line)d: unknown kind %(kind)r.") % {'line': line, 'kind': kind})
+            continue
+        if not name:
+            errors.append(_("Line %(line)d: missing name.") % {'line': line})
+            continue
+        if access.isdigit() and int(access) in ZONE_ACCESS_NAMES:
+            access = int(access)
+        elif access in ACCESS_VALUES:
+            access = ACCESS_VALUES[access]
+        else:
+            errors.append(_("Line %(line)d: unknown access %(access)r.") % {'line': line, 'access': access})
+            continue
+        try:
+            order = int(order) if order else 10
+        except ValueError:
+            errors.append(_("Line %(line)d: invalid order %(order)r.") % {'line': line, 'order': order})
+            continue
+        parsed[kind][name] = (access, order)
+    if errors:
+        raise ValidationError(errors)
+    return parsed
+
+
+def update_rules(rule_model, changes, fields):
+    """
+    Updates many rules with a single query per chunk; ``changes`` maps rule
+    primary keys to a tuple of values for ``fields``.
+    """
+    for chunk in _chunks(changes.items()):
+        values = {}
+        for index, field in enumerate(fields):
+            values[field] = Case(*[When(pk=pk, then=Value(row[index])) for pk, row in chunk],
+                                 output_field=IntegerField())
+        rule_model.objects.filter(pk__in=[pk for pk, row in chunk]).update(**values)
+
+
+def import_rules(zone, lines, replace=False):
+    """
+    Creates and updates the user and group rules of ``zone`` from CSV.
+    With ``replace``, user and group rules that aren't in the CSV are
+    removed. Returns the number of created, updated and deleted rules.
+    """
+    parsed = parse_rules(lines)
+    resolved = {}
+    errors = []
+    for kind, rule_model, field in NAMED_RULES:
+        wanted = parsed[kind]
+        pks = pks_for(rule_model, field, [name for name in wanted if not name.startswith('#')])
+        resolved[kind] = {}
+        for name, values in wanted.items():
+            if name.startswith('#') and name[1:].isdigit():
+                resolved[kind][int(name[1:])] = values
+            elif name in pks:
+                resolved[kind][pks[name]] = values
+            else:
+                errors.append(_("Unknown %(kind)s %(name)r.") % {'kind': kind, 'name': name})
+    if errors:
+        raise ValidationError(errors)
+
+    created = updated = deleted = 0
+    with transaction.atomic(using=router.db_for_write(Zone)):
+        for kind, rule_model, field in NAMED_RULES:
+            wanted = resolved[kind]
+            existing = dict((obj_pk, (pk, access, order)) for pk, obj_pk, access, order
+                            in rule_model.objects.filter(zone=zone).values_list(
+                                'pk', '%s_id' % field, 'access', 'order'))
+            rule_model.objects.bulk_create([
+                rule_model(zone=zone, access=access, order=order, **{'%s_id' % field: obj_pk})
+                for obj_pk, (access, order) in wanted.items() if obj_pk not in existing])
+            created += len([obj_pk for obj_pk in wanted if obj_pk not in existing])
+            changes = dict((existing[obj_pk][0], values) for obj_pk, values in wanted.items()
+                           if obj_pk in existing and existing[obj_pk][1:] != values)
+            update_rules(rule_model, changes, ('access', 'order'))
+            updated += len(changes)
+            if replace:
+                stale = [pk for obj_pk, (pk, access, order) in existing.items() if obj_pk not in wanted]
+                for chunk in _chunks(stale):
+                    rule_model.objects.filter(pk__in=chunk).delete()
+                deleted += len(stale)
+    # Bulk operations don't send post_save.
+    invalidate_zone_index(sender=Zone)
+    return created, updated, deleted
+
+
+def renumber_rules(zones, start=10, step=10):
+    """
+    Renumbers all rules of ``zones`` to ``start``, ``start + step``, ...
+    in their current rank, which leaves room to insert rules between any
+    two. Rules of different kinds that shared an order keep their relative
+    rank, so the zone's decisions don't change.
+    """
+    with transaction.atomic(using=router.db_for_write(Zone)):
+        for zone in zones:
+            rules = []
+            for kind, rule_model in enumerate(RULE_MODELS):
+                rules.extend((order, kind, pk, rule_model) for pk, order
+                             in rule_model.objects.filter(zone=zone).values_list('pk', 'order'))
+            changes = dict((rule_model, {}) for rule_model in RULE_MODELS)
+            for position, (order, kind, pk, rule_model) in enumerate(sorted(rules)):
+                new_order = start + position * step
+                if new_order != order:
+                    changes[rule_model][pk] = (new_order,)
+            for rule_model, model_changes in changes.items():
+                update_rules(rule_model, model_changes, ('order',))
+    invalidate_zone_index(sender=Zone)
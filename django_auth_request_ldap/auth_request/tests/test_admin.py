@@ -0,0 +1,41 @@
+from django.contrib.admin.sites import AdminSite
+from django.test import RequestFactory, TestCase
+
+import time
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from account.models import User
+from account.search import SearchIndex
+from account.tests.test_search import Entry
+from auth_request.admin import ZoneUserAdmin
+from auth_request.models import Zone, ZoneUser
+
+
+class RuleSearchTests(TestCase):
+    def setUp(self):
+        zone = Zone.objects.create(name="Intranet", code='intranet')
+        self.index = SearchIndex(User, ['username', 'email'])
+        # Keep sync() from asking LDAP.
+        self.index.synced_at = time.time()
+        for user_id, username in enumerate(['anna', 'alan', 'ada', 'carl'], 1000):
+            ZoneUser.objects.create(zone=zone, user_id=user_id)
+            self.index.update(Entry(user_id, username, '%s@example.org' % username))
+        self.admin = ZoneUserAdmin(ZoneUser, AdminSite())
+        self.request = RequestFactory().get('/admin/auth_request/zoneuser/')
+
+    def search(self, term):
+        with mock.patch('auth_request.admin.get_search_index', return_value=self.index):
+            queryset, use_distinct = self.admin.get_search_results(self.request, ZoneUser.objects.all(), term)
+        return sorted(queryset.values_list('user_id', flat=True))
+
+    def test_matches_filter_the_rules(self):
+        self.assertEqual(self.search('ada'), [1002])
+
+    @mock.patch('account.search.ACCOUNT_SEARCH_INDEX_MAX_RESULTS', 2)
+    def test_short_terms_are_capped(self):
+        self.assertEqual(len(self.index.ranked('a')), 4)
+        self.assertEqual(len(self.search('a')), 2)
@@ -0,0 +1,67 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from auth_request import analytics
+from auth_request.analytics import BUCKETS_KEY, ZONES_KEY, ZoneAnalytics, summarize
+
+NOW = 1000000.0
+
+
+class ZoneAnalyticsTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        patcher = mock.patch('account.background.threading.Thread')
+        self.Thread = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def worker(self):
+        worker = ZoneAnalytics()
+        worker.start()
+        return worker
+
+    def test_record_leaves_the_cache_to_the_thread(self):
+        worker = ZoneAnalytics()
+        with mock.patch('auth_request.analytics.cache') as shared:
+            worker.record('intranet', 'alice', 'access', NOW)
+        self.assertFalse(shared.method_calls)
+        self.assertEqual(self.Thread.call_count, 1)
+        self.assertTrue(self.Thread.return_value.daemon)
+        self.Thread.return_value.start.assert_called_once_with()
+
+    def test_publish_writes_a_key_per_changed_zone(self):
+        worker = self.worker()
+        worker.record('intranet', 'alice', 'access', NOW)
+        worker.record('wiki', 'bob', 'denied', NOW)
+        worker.publish(NOW)
+        self.assertEqual(cache.get(ZONES_KEY % worker.worker), ['intranet', 'wiki'])
+        self.assertEqual(len(cache.get(BUCKETS_KEY % (worker.worker, 'wiki'))), 1)
+
+        cache.delete(BUCKETS_KEY % (worker.worker, 'wiki'))
+        worker.record('intranet', 'carol', 'access', NOW)
+        worker.publish(NOW)
+        self.assertIsNone(cache.get(BUCKETS_KEY % (worker.worker, 'wiki')))
+        self.assertEqual(cache.get(BUCKETS_KEY % (worker.worker, 'intranet'))[0]['outcomes'], {'access': 2})
+
+    def test_summarize_merges_the_workers(self):
+        other = self.worker()
+        other.record('intranet', 'alice', 'access', NOW)
+        other.record('wiki', 'bob', 'denied', NOW)
+        other.publish(NOW)
+        current = self.worker()
+        current.record('intranet', 'alice', 'access', NOW)
+        current.record('intranet', 'carol', 'denied', NOW)
+        with mock.patch.object(analytics, 'analytics', current):
+            summary = summarize('intranet', now=NOW)
+        self.assertEqual(summary['workers'], 2)
+        self.assertEqual(list(summary['zones']), ['intranet'])
+        intranet = summary['zones']['intranet']
+        self.assertEqual(intranet['requests'], 3)
+        self.assertEqual(intranet['unique_users'], 2)
+        self.assertEqual(intranet['outcomes'], {'access': 2, 'denied': 1})
+        self.assertEqual(intranet['top_users'][0], ('alice', 2))
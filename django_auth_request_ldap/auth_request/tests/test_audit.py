@@ -0,0 +1,139 @@
+from django.db import connections
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from datetime import date, datetime, timedelta
+import threading
+
+from auth_request import audit
+from auth_request.audit import (AuditBuffer, ZONE_AUDIT_DATABASE, existing_partitions, partition_model, prune,
+                                records, rollup, who_accessed)
+from auth_request.enums import ACTION_ACCESS, ACTION_DENIED, ZONE_ACCESS_ALLOWED, ZONE_ACCESS_DENIED
+from auth_request.models import AccessRollup
+
+
+def utc(*args):
+    return timezone.make_aware(datetime(*args), timezone.utc)
+
+
+def record(created, username='alice', action=ACTION_ACCESS, zone_code='intranet'):
+    return {
+        'created': created,
+        'zone_code': zone_code,
+        'user_pk': 1000 if username == 'alice' else 1001,
+        'username': username,
+        'access': ZONE_ACCESS_ALLOWED if action == ACTION_ACCESS else ZONE_ACCESS_DENIED,
+        'action': action,
+        'client_address': '192.0.2.1',
+    }
+
+
+class AuditBufferTests(SimpleTestCase):
+    def buffer(self, **kwargs):
+        audit_buffer = AuditBuffer(**kwargs)
+        patcher = mock.patch.object(audit_buffer.thread, 'func')
+        self.flush = patcher.start()
+        self.addCleanup(patcher.stop)
+        return audit_buffer
+
+    def test_add_never_writes_in_the_request(self):
+        audit_buffer = self.buffer(interval=60, size=2)
+        with mock.patch.object(audit_buffer, 'start') as start:
+            audit_buffer.add({'action': 'access'})
+            self.assertFalse(audit_buffer.thread.wakeup.is_set())
+            audit_buffer.add({'action': 'access'})
+        self.assertEqual(start.call_count, 2)
+        self.assertTrue(audit_buffer.thread.wakeup.is_set())
+        self.assertFalse(self.flush.called)
+        self.assertEqual(len(audit_buffer.records), 2)
+
+    def test_thread_writes_after_the_interval(self):
+        audit_buffer = self.buffer(interval=0.01, size=100)
+        flushed = threading.Event()
+        self.flush.side_effect = lambda: (flushed.set(), 0)[1]
+        audit_buffer.add({'action': 'access'})
+        self.assertTrue(flushed.wait(5))
+        self.assertEqual(audit_buffer.thread.thread.name, 'auth-request-audit')
+
+
+class DayTableTests(TestCase):
+    def setUp(self):
+        audit._partitions = None
+        self.addCleanup(self.drop_day_tables)
+
+    def drop_day_tables(self):
+        with connections[ZONE_AUDIT_DATABASE].schema_editor() as editor:
+            for day in existing_partitions(refresh=True):
+                editor.delete_model(partition_model(day))
+        audit._partitions = None
+
+    def create_day_table(self, day):
+        # As another process would, without this one noticing.
+        with connections[ZONE_AUDIT_DATABASE].schema_editor() as editor:
+            editor.create_model(partition_model(day))
+
+    def test_flush_writes_a_table_per_day(self):
+        audit_buffer = AuditBuffer()
+        audit_buffer.records.extend([
+            record(utc(2026, 10, 18, 23, 59)),
+            record(utc(2026, 10, 19, 0, 1)),
+            record(utc(2026, 10, 19, 8, 0), 'bob', ACTION_DENIED),
+        ])
+        self.assertEqual(audit_buffer.flush(), 3)
+        self.assertEqual(existing_partitions(refresh=True), [date(2026, 10, 18), date(2026, 10, 19)])
+        self.assertEqual(partition_model(date(2026, 10, 19)).objects.using(ZONE_AUDIT_DATABASE).count(), 2)
+        self.assertEqual(audit_buffer.records, [])
+
+    def test_records_only_queries_the_days_in_range(self):
+        audit_buffer = AuditBuffer()
+        for day in (17, 18, 19):
+            audit_buffer.records.append(record(utc(2026, 10, day, 12)))
+        audit_buffer.flush()
+        with mock.patch('auth_request.audit.partition_model', wraps=partition_model) as model:
+            found = list(records(utc(2026, 10, 18), utc(2026, 10, 19, 6)))
+        self.assertEqual([found_record.created for found_record in found], [utc(2026, 10, 18, 12)])
+        self.assertEqual([call[0][0] for call in model.call_args_list], [date(2026, 10, 18), date(2026, 10, 19)])
+
+    def test_rollup_sees_tables_created_after_midnight(self):
+        audit_buffer = AuditBuffer()
+        audit_buffer.records.append(record(utc(2026, 10, 18, 23, 30)))
+        audit_buffer.flush()
+        self.assertEqual(rollup(now=utc(2026, 10, 18, 23, 45)), 1)
+
+        self.create_day_table(date(2026, 10, 19))
+        model = partition_model(date(2026, 10, 19))
+        model.objects.using(ZONE_AUDIT_DATABASE).bulk_create([
+            model(**record(utc(2026, 10, 19, 0, 10))),
+            model(**record(utc(2026, 10, 19, 0, 20))),
+            model(**record(utc(2026, 10, 19, 0, 30), 'bob', ACTION_DENIED)),
+        ])
+        self.assertEqual(rollup(now=utc(2026, 10, 19, 0, 45)), 3)
+        self.assertEqual(AccessRollup.objects.get(hour=utc(2026, 10, 19), username='alice').count, 2)
+        self.assertEqual(who_accessed('intranet', utc(2026, 10, 18), utc(2026, 10, 20)), [('alice', 3), ('bob', 1)])
+        self.assertEqual(who_accessed('intranet', utc(2026, 10, 18), utc(2026, 10, 20), ACTION_DENIED), [('bob', 1)])
+
+    def test_prune_drops_a_bounded_number_of_tables(self):
+        for day in (1, 2, 3, 18):
+            self.create_day_table(date(2026, 10, day))
+        dropped, deleted = prune(retention_days=7, tables=2, now=utc(2026, 10, 19))
+        self.assertEqual(dropped, 2)
+        self.assertEqual(existing_partitions(refresh=True), [date(2026, 10, 3), date(2026, 10, 18)])
+
+    def test_prune_deletes_rollups_in_batches(self):
+        for hour in range(5):
+            AccessRollup.objects.create(hour=utc(2026, 1, 1, hour), zone_code='intranet', user_pk=1000,
+                                        username='alice', action=ACTION_ACCESS, count=1)
+        kept = AccessRollup.objects.create(hour=utc(2026, 10, 18), zone_code='intranet', user_pk=1000,
+                                           username='alice', action=ACTION_ACCESS, count=1)
+        with CaptureQueriesContext(connections[ZONE_AUDIT_DATABASE]) as queries:
+            dropped, deleted = prune(rollup_retention_days=30, batch_size=2, now=utc(2026, 10, 19))
+        self.assertEqual((dropped, deleted), (0, 5))
+        # Batches of 2, 2 and 1, and an empty one to finish.
+        self.assertEqual(len([query for query in queries if 'LIMIT 2' in query['sql']]), 4)
+        self.assertEqual(list(AccessRollup.objects.values_list('pk', flat=True)), [kept.pk])
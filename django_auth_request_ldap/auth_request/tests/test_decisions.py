@@ -0,0 +1,80 @@
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase
+
+from datetime import datetime, time
+
+from auth_request.decisions import CompiledZone, RULE_GROUP, RULE_USER, RULE_SCHEDULE
+from auth_request.enums import ZONE_ACCESS_DEFAULT, ZONE_ACCESS_ALLOWED, ZONE_ACCESS_DENIED
+from auth_request.models import ZoneSchedule
+
+
+class CompiledZoneTests(SimpleTestCase):
+    def zone(self, rules, access=ZONE_ACCESS_DENIED):
+        return CompiledZone(1, 'intranet', "Intranet", access, True, rules)
+
+    def test_highest_ranked_rule_wins(self):
+        zone = self.zone([
+            (10, RULE_GROUP, 1, 100, ZONE_ACCESS_ALLOWED),
+            (20, RULE_GROUP, 2, 200, ZONE_ACCESS_DENIED),
+            (20, RULE_USER, 3, 1000, ZONE_ACCESS_ALLOWED),
+        ])
+        self.assertEqual(zone.evaluate(1000, [100, 200]), (ZONE_ACCESS_ALLOWED, ZONE_ACCESS_DENIED,
+                                                           ZONE_ACCESS_ALLOWED))
+        self.assertEqual(zone.evaluate(1001, [100, 200])[0], ZONE_ACCESS_DENIED)
+        self.assertEqual(zone.evaluate(1001, [100])[0], ZONE_ACCESS_ALLOWED)
+        self.assertEqual(zone.evaluate(1001, [])[0], ZONE_ACCESS_DENIED)
+
+    def test_default_rules_keep_the_access_so_far(self):
+        zone = self.zone([
+            (10, RULE_GROUP, 1, 100, ZONE_ACCESS_ALLOWED),
+            (20, RULE_USER, 2, 1000, ZONE_ACCESS_DEFAULT),
+        ])
+        self.assertEqual(zone.evaluate(1000, [100])[0], ZONE_ACCESS_ALLOWED)
+        self.assertNotIn(1000, zone.user_rules)
+
+    def test_evaluate_agrees_with_explain(self):
+        rules = [
+            (order, kind, pk, key, access)
+            for pk, (order, kind, key, access) in enumerate([
+                (10, RULE_GROUP, 100, ZONE_ACCESS_ALLOWED),
+                (10, RULE_USER, 1000, ZONE_ACCESS_DENIED),
+                (15, RULE_GROUP, 200, ZONE_ACCESS_DEFAULT),
+                (30, RULE_GROUP, 300, ZONE_ACCESS_DENIED),
+                (30, RULE_USER, 1001, ZONE_ACCESS_ALLOWED),
+            ])
+        ]
+        zone = self.zone(rules, access=ZONE_ACCESS_DEFAULT)
+        for user_pk in (None, 1000, 1001, 1002):
+            for group_pks in ([], [100], [200], [100, 300], [300, 200, 100]):
+                self.assertEqual(zone.evaluate(user_pk, group_pks)[0], zone.explain(user_pk, group_pks)[0],
+                                 (user_pk, group_pks))
+
+
+class ScheduleRuleTests(SimpleTestCase):
+    def zone(self, weekdays):
+        return CompiledZone(1, 'office', "Office", ZONE_ACCESS_DENIED, True, [
+            (10, RULE_SCHEDULE, 1, (weekdays, time(9), time(17)), ZONE_ACCESS_ALLOWED),
+            (20, RULE_SCHEDULE, 2, ('56', time(22), time(2)), ZONE_ACCESS_ALLOWED),
+        ])
+
+    def test_windows(self):
+        zone = self.zone('01234')
+        # Monday 19 October 2026.
+        self.assertEqual(zone.evaluate(None, [], now=datetime(2026, 10, 19, 10))[0], ZONE_ACCESS_ALLOWED)
+        self.assertEqual(zone.evaluate(None, [], now=datetime(2026, 10, 19, 18))[0], ZONE_ACCESS_DENIED)
+        # Past midnight, the window belongs to the Sunday it started on.
+        self.assertEqual(zone.evaluate(None, [], now=datetime(2026, 10, 19, 1))[0], ZONE_ACCESS_ALLOWED)
+        self.assertEqual(zone.evaluate(None, [], now=datetime(2026, 10, 20, 1))[0], ZONE_ACCESS_DENIED)
+
+    def test_invalid_weekdays_are_skipped(self):
+        zone = self.zone('Mon')
+        self.assertEqual(len(zone.schedule_rules), 1)
+        self.assertEqual(zone.evaluate(None, [], now=datetime(2026, 10, 19, 10))[0], ZONE_ACCESS_DENIED)
+        self.assertEqual(zone.explain(None, [], now=datetime(2026, 10, 19, 10))[0], ZONE_ACCESS_DENIED)
+
+    def test_weekdays_validator(self):
+        field = ZoneSchedule._meta.get_field('weekdays')
+        field.run_validators('0123456')
+        for value in ('Mon', '017', ''):
+            with self.assertRaises(ValidationError):
+                field.clean(value, ZoneSchedule())
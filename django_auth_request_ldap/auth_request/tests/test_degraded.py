@@ -0,0 +1,62 @@
+from django.test import SimpleTestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import time
+
+from auth_request.decisions import CompiledZone
+from auth_request.enums import (ACTION_ACCESS, ACTION_DENIED, ACTION_STALE, ACTION_FAILED_OPEN, ACTION_FAILED_CLOSED,
+                                ZONE_ACCESS_ALLOWED, ZONE_ACCESS_DENIED)
+from auth_request.models import Zone
+
+
+@mock.patch('auth_request.models.record_access', mock.Mock())
+@mock.patch('auth_request.models.do_log')
+class UnavailableDecisionTests(SimpleTestCase):
+    def zone(self, **kwargs):
+        zone = CompiledZone(1, 'intranet', "Intranet", ZONE_ACCESS_DENIED, True, [], **kwargs)
+        patcher = mock.patch('auth_request.models.zone_index')
+        zone_index = patcher.start()
+        self.addCleanup(patcher.stop)
+        zone_index.get.return_value = zone
+        return zone
+
+    def user(self):
+        user = mock.Mock(pk=1000)
+        user.is_authenticated.return_value = True
+        return user
+
+    def logged(self, do_log):
+        self.assertEqual(do_log.call_count, 1)
+        zone, matrix, action = do_log.call_args[0]
+        return matrix.allowed[0], action
+
+    def test_fail_open_is_logged(self, do_log):
+        self.zone(fail_open=True)
+        self.assertEqual(Zone.process_request(self.user(), 'intranet', user_unavailable=True), (ACTION_ACCESS, None))
+        self.assertEqual(self.logged(do_log), (ZONE_ACCESS_ALLOWED, ACTION_FAILED_OPEN))
+
+    def test_fail_closed_is_logged(self, do_log):
+        self.zone()
+        self.assertEqual(Zone.process_request(self.user(), 'intranet', user_unavailable=True), (ACTION_DENIED, None))
+        self.assertEqual(self.logged(do_log), (ZONE_ACCESS_DENIED, ACTION_FAILED_CLOSED))
+
+    @mock.patch('auth_request.models.ZONE_ACCESS_CACHE_TIME', 60)
+    @mock.patch('auth_request.models.ldap_degraded', return_value=True)
+    @mock.patch('auth_request.models.revalidate')
+    @mock.patch('auth_request.models.cache')
+    def test_stale_decision_is_logged(self, cache, revalidate, ldap_degraded, do_log):
+        self.zone()
+        cached_at = time.time() - 120
+        cache.get.return_value = (ACTION_ACCESS, cached_at)
+        self.assertEqual(Zone.process_request(self.user(), 'intranet'), (ACTION_ACCESS, cached_at))
+        self.assertTrue(revalidate.called)
+        self.assertEqual(self.logged(do_log), (ZONE_ACCESS_ALLOWED, ACTION_STALE))
+
+    def test_nothing_is_logged_without_log(self, do_log):
+        self.zone(fail_open=True)
+        Zone.process_request(self.user(), 'intranet', log=False, user_unavailable=True)
+        self.assertFalse(do_log.called)
@@ -0,0 +1,46 @@
+from django.test import SimpleTestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import time
+
+from auth_request.decisions import CompiledZone, RULE_GROUP
+from auth_request.enums import ACTION_ACCESS, ACTION_DENIED, ZONE_ACCESS_DEFAULT, ZONE_ACCESS_DENIED
+from auth_request.models import DecisionTrace, explain_zone
+
+
+class ExplainZoneTests(SimpleTestCase):
+    def setUp(self):
+        self.zone = CompiledZone(1, 'intranet', "Intranet", ZONE_ACCESS_DENIED, True, [
+            (10, RULE_GROUP, 1, 100, ZONE_ACCESS_DEFAULT),
+        ])
+        group = mock.Mock(pk=100)
+        group.name = 'staff'
+        self.user = mock.Mock(pk=1000)
+        self.user.is_authenticated.return_value = True
+        self.user.get_groups.return_value = [group]
+        patcher = mock.patch('auth_request.models.zone_index')
+        zone_index = patcher.start()
+        self.addCleanup(patcher.stop)
+        zone_index.lookup.return_value = (self.zone, True)
+
+    def test_default_group_rules_are_listed(self):
+        self.assertEqual(self.zone.group_rules, {})
+        trace = explain_zone('intranet', self.user)
+        self.assertEqual([(step['kind'], step['name']) for step in trace.steps], [('group', 'staff')])
+        self.assertEqual(trace.action, ACTION_DENIED)
+        self.assertFalse(trace.stale)
+
+    @mock.patch('auth_request.models.ZONE_ACCESS_CACHE_TIME', 60)
+    @mock.patch('auth_request.models.cache')
+    def test_stale_cached_decision_is_flagged(self, cache):
+        cache.get.return_value = (ACTION_ACCESS, time.time())
+        trace = explain_zone('intranet', self.user)
+        self.assertEqual(trace.tier, DecisionTrace.TIER_DECISION_CACHE)
+        self.assertEqual(trace.action, ACTION_ACCESS)
+        self.assertEqual(trace.fresh_action, ACTION_DENIED)
+        self.assertTrue(trace.stale)
+        self.assertTrue(trace.as_dict()['stale'])
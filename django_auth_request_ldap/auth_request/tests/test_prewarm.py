@@ -0,0 +1,71 @@
+from django.test import SimpleTestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from auth_request import prewarm
+from auth_request.prewarm import HotSet
+
+
+class HotSetTests(SimpleTestCase):
+    @mock.patch('auth_request.prewarm.time')
+    def test_counts_decay(self, clock):
+        clock.time.return_value = 1000.0
+        hot = HotSet(10, half_life=60)
+        hot.record('alice', 'wiki', 8)
+        hot.record('bob', 'git', 1)
+        clock.time.return_value = 1120.0
+        hot.decay()
+        self.assertEqual(hot.counts, {'alice': {'wiki': 2.0}, 'bob': {'git': 0.25}})
+        hot.record('bob', 'git', 3)
+        self.assertEqual([username for username, zones in hot.top(2)], ['bob', 'alice'])
+        clock.time.return_value = 1600.0
+        hot.decay()
+        self.assertEqual(hot.counts, {})
+
+    def test_snapshot_is_read_once(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'hot.json')
+        with open(path, 'w') as f:
+            json.dump({'alice': {'wiki': 3}}, f)
+        hot = HotSet(10)
+        with mock.patch('auth_request.prewarm.ZONE_PREWARM_SNAPSHOT', path), \
+                mock.patch('auth_request.prewarm.hot_set', hot), \
+                mock.patch.object(HotSet, 'load', autospec=True, side_effect=HotSet.load) as load:
+            found = prewarm.load_hot_set()
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(found.top(1), [('alice', ['wiki'])])
+        self.assertEqual(hot.counts, {'alice': {'wiki': 3}})
+
+
+class PrewarmTests(SimpleTestCase):
+    @mock.patch('auth_request.prewarm.close_connections')
+    @mock.patch('auth_request.prewarm._ready', threading.Event())
+    def test_workers_stop_at_the_timeout(self, close_connections):
+        found = HotSet(10)
+        for i in range(5):
+            found.record('user%d' % i, 'wiki')
+        warmed = []
+
+        def warm_user(username, zone_codes):
+            warmed.append(username)
+            time.sleep(0.2)
+
+        with mock.patch('auth_request.decisions.zone_index') as zone_index, \
+                mock.patch('auth_request.prewarm.load_hot_set', return_value=found), \
+                mock.patch('auth_request.prewarm.warm_user', warm_user):
+            zone_index.preload.return_value = 1
+            prewarm.prewarm(users=5, concurrency=1, timeout=0.1)
+            self.assertTrue(prewarm.is_ready())
+            time.sleep(0.5)
+        self.assertEqual(len(warmed), 1)
@@ -0,0 +1,60 @@
+from django.test import SimpleTestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import time
+
+from auth_request.decisions import CompiledZone, RULE_USER
+from auth_request.enums import ACTION_ACCESS, ACTION_DENIED, ACTION_RATE_LIMITED, ZONE_ACCESS_ALLOWED, ZONE_ACCESS_DENIED
+from auth_request.models import Zone
+
+
+@mock.patch('auth_request.models.record_access', mock.Mock())
+@mock.patch('auth_request.models.do_log')
+@mock.patch('auth_request.models.check_rate_limits', return_value=False)
+class RateLimitedRequestTests(SimpleTestCase):
+    def setUp(self):
+        self.zone = CompiledZone(1, 'intranet', "Intranet", ZONE_ACCESS_DENIED, True, [
+            (10, RULE_USER, 1, 1000, ZONE_ACCESS_ALLOWED),
+        ], rate_limit=(1.0, 1))
+        patcher = mock.patch('auth_request.models.zone_index')
+        zone_index = patcher.start()
+        self.addCleanup(patcher.stop)
+        zone_index.get.return_value = self.zone
+
+    def user(self, pk):
+        user = mock.Mock(pk=pk)
+        user.is_authenticated.return_value = True
+        return user
+
+    def test_rate_limited_requests_are_logged_as_such(self, check_rate_limits, do_log):
+        user = self.user(1000)
+        self.assertEqual(Zone.process_request(user, 'intranet', rate_limit=True), (ACTION_RATE_LIMITED, None))
+        check_rate_limits.assert_called_once_with(self.zone, user)
+        self.assertEqual(do_log.call_count, 1)
+        self.assertEqual(do_log.call_args[0][2], ACTION_RATE_LIMITED)
+
+    def test_only_granted_requests_are_limited(self, check_rate_limits, do_log):
+        self.assertEqual(Zone.process_request(self.user(1001), 'intranet', rate_limit=True), (ACTION_DENIED, None))
+        self.assertFalse(check_rate_limits.called)
+        self.assertEqual(do_log.call_args[0][2], ACTION_DENIED)
+
+    def test_without_rate_limit_nothing_is_limited(self, check_rate_limits, do_log):
+        self.assertEqual(Zone.process_request(self.user(1000), 'intranet'), (ACTION_ACCESS, None))
+        self.assertFalse(check_rate_limits.called)
+
+    @mock.patch('auth_request.models.ZONE_ACCESS_CACHE_TIME', 60)
+    @mock.patch('auth_request.models.cache')
+    def test_cache_keeps_the_decision_of_the_rules(self, cache, check_rate_limits, do_log):
+        cache.get.return_value = None
+        Zone.process_request(self.user(1000), 'intranet', rate_limit=True)
+        self.assertEqual(cache.set.call_args[0][1][0], ACTION_ACCESS)
+
+        cached_at = time.time()
+        cache.get.return_value = (ACTION_ACCESS, cached_at)
+        self.assertEqual(Zone.process_request(self.user(1000), 'intranet', rate_limit=True),
+                         (ACTION_RATE_LIMITED, cached_at))
+        self.assertEqual(check_rate_limits.call_count, 2)
@@ -0,0 +1,68 @@
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase, TestCase
+
+from auth_request.enums import ZONE_ACCESS_DEFAULT, ZONE_ACCESS_ALLOWED, ZONE_ACCESS_DENIED
+from auth_request.models import Zone, ZoneUser, ZoneGroup, ZoneNetwork
+from auth_request.rules import parse_rules, import_rules, renumber_rules
+
+
+class ParseRulesTests(SimpleTestCase):
+    def test_rows(self):
+        parsed = parse_rules([
+            'kind,name,access,order',
+            'user,alice,allowed,20',
+            'User, bob ,DENIED,',
+            'group,admins,0,5',
+        ])
+        self.assertEqual(parsed, {
+            'user': {'alice': (ZONE_ACCESS_ALLOWED, 20), 'bob': (ZONE_ACCESS_DENIED, 10)},
+            'group': {'admins': (ZONE_ACCESS_DEFAULT, 5)},
+        })
+
+    def test_every_invalid_line_is_reported(self):
+        with self.assertRaises(ValidationError) as raised:
+            parse_rules([
+                'kind,name,access,order',
+                'host,alice,allowed,10',
+                'user,,allowed,10',
+                'user,alice,maybe,10',
+                'user,alice,allowed,first',
+                'user,bob,allowed,10',
+            ])
+        messages = raised.exception.messages
+        self.assertEqual(len(messages), 4)
+        for line, message in zip(range(2, 6), messages):
+            self.assertTrue(message.startswith("Line %d:" % line), message)
+
+
+class BulkRulesTests(TestCase):
+    def setUp(self):
+        self.zone = Zone.objects.create(name="Intranet", code='intranet')
+
+    def test_import_by_id(self):
+        kept = ZoneUser.objects.create(zone=self.zone, user_id=1000, access=ZONE_ACCESS_ALLOWED, order=10)
+        ZoneUser.objects.create(zone=self.zone, user_id=1001, access=ZONE_ACCESS_ALLOWED, order=10)
+        created, updated, deleted = import_rules(self.zone, [
+            'kind,name,access,order',
+            'user,#1000,denied,30',
+            'group,#200,allowed,10',
+        ], replace=True)
+        self.assertEqual((created, updated, deleted), (1, 1, 1))
+        self.assertEqual(list(ZoneUser.objects.filter(zone=self.zone).values_list('pk', 'access', 'order')),
+                         [(kept.pk, ZONE_ACCESS_DENIED, 30)])
+        self.assertEqual(list(ZoneGroup.objects.filter(zone=self.zone).values_list('group_id', 'access')),
+                         [(200, ZONE_ACCESS_ALLOWED)])
+
+    def test_unknown_names_abort_the_import(self):
+        with self.assertRaises(ValidationError):
+            import_rules(self.zone, ['kind,name,access,order', 'user,#alice,allowed,10'])
+        self.assertFalse(ZoneUser.objects.exists())
+
+    def test_renumber_keeps_the_rank(self):
+        group = ZoneGroup.objects.create(zone=self.zone, group_id=200, order=5)
+        user = ZoneUser.objects.create(zone=self.zone, user_id=1000, order=5)
+        network = ZoneNetwork.objects.create(zone=self.zone, network='10.0.0.0/8', order=1)
+        renumber_rules([self.zone], start=100, step=50)
+        self.assertEqual(ZoneNetwork.objects.get(pk=network.pk).order, 100)
+        self.assertEqual(ZoneGroup.objects.get(pk=group.pk).order, 150)
+        self.assertEqual(ZoneUser.objects.get(pk=user.pk).order, 200)
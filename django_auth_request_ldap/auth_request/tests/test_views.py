@@ -0,0 +1,42 @@
+from django.http import HttpResponse
+from django.test import SimpleTestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from auth_request.decisions import CompiledZone
+from auth_request.enums import ACTION_ACCESS, ACTION_DENIED, ACTION_LOGIN, ZONE_ACCESS_DENIED
+from auth_request.views import ZONE_RESPONSE_CACHE_TIMES, response_cache_time, set_cache_headers
+
+
+class CacheHeaderTests(SimpleTestCase):
+    def zone(self, **kwargs):
+        return CompiledZone(1, 'intranet', "Intranet", ZONE_ACCESS_DENIED, True, [], **kwargs)
+
+    def test_cacheable_response(self):
+        response = set_cache_headers(HttpResponse(), 60)
+        self.assertEqual(response['X-Accel-Expires'], '60')
+        self.assertIn('max-age=60', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+
+    def test_uncacheable_response(self):
+        response = set_cache_headers(HttpResponse(), 0)
+        self.assertEqual(response['X-Accel-Expires'], '0')
+        self.assertIn('max-age=0', response['Cache-Control'])
+
+    def test_zone_overrides(self):
+        zone = self.zone(cache_times={ACTION_ACCESS: 300})
+        with mock.patch('auth_request.views.zone_index') as zone_index:
+            zone_index.get.return_value = zone
+            self.assertEqual(response_cache_time('intranet', ACTION_ACCESS), 300)
+            self.assertEqual(response_cache_time('intranet', ACTION_DENIED), ZONE_RESPONSE_CACHE_TIMES[ACTION_DENIED])
+            self.assertEqual(response_cache_time('intranet', ACTION_LOGIN), 0)
+
+    def test_rate_limited_zones_are_not_cached(self):
+        zone = self.zone(rate_limit=(1.0, 10))
+        with mock.patch('auth_request.views.zone_index') as zone_index:
+            zone_index.get.return_value = zone
+            self.assertEqual(response_cache_time('intranet', ACTION_ACCESS), 0)
@@ -0,0 +1,29 @@
+from django.test import TestCase
+
+from auth_request.decisions import ZoneIndex
+from auth_request.models import Zone
+
+
+class ZoneIndexTests(TestCase):
+    def setUp(self):
+        Zone.objects.create(name="Intranet", code='intranet')
+        self.index = ZoneIndex()
+
+    def test_unknown_codes_cost_no_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.index.lookup('nope'), (None, False))
+        with self.assertNumQueries(0):
+            for code in ('random-1', 'random-2', 'random-3'):
+                self.assertEqual(self.index.lookup(code), (None, False))
+
+    def test_known_codes_are_compiled_once(self):
+        zone, indexed = self.index.lookup('intranet')
+        self.assertEqual((zone.code, indexed), ('intranet', False))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.index.lookup('intranet')[1], True)
+
+    def test_invalidation_picks_up_new_zones(self):
+        self.assertIsNone(self.index.lookup('wiki')[0])
+        Zone.objects.create(name="Wiki", code='wiki')
+        self.index.invalidate()
+        self.assertEqual(self.index.lookup('wiki')[0].code, 'wiki')
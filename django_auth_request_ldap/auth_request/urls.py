@@ -1,10 +1,17 @@
 from django.conf.urls import include, url
-from .views import check_auth, check_auth_info
+from .views import (check_auth, check_auth_info, check_auth_explain, check_auth_analytics, check_ldap_status,
+                    check_ready)
 from django.contrib.auth.views import login
 
 urlpatterns = [
     url(r'^$',                          check_auth, name='auth-check'),
     url(r'^info/$',                     check_auth_info, name='auth-info'),
     url(r'^info/(?P<zone_name>[-\w]+)/$', check_auth_info, name='named-auth-info'),
+    url(r'^explain/$',                  check_auth_explain, name='auth-explain'),
+    url(r'^explain/(?P<zone_name>[-\w]+)/$', check_auth_explain, name='named-auth-explain'),
+    url(r'^analytics/$',                check_auth_analytics, name='auth-analytics'),
+    url(r'^analytics/(?P<zone_name>[-\w]+)/$', check_auth_analytics, name='named-auth-analytics'),
+    url(r'^ldap/$',                     check_ldap_status, name='ldap-status'),
+    url(r'^ready/$',                    check_ready, name='ready'),
     url(r'^login/$',                    login, {'template_name': "auth_request/login.html"}, name='login'),
 ]
@@ -2,20 +2,43 @@
 from django.conf import settings
 from django.core.urlresolvers import reverse
 # Avoid shadowing the login() and logout() views below.
-from django.contrib.auth import REDIRECT_FIELD_NAME, login as auth_login
-from django.http import HttpResponseRedirect, HttpResponse
+from django.contrib.auth import REDIRECT_FIELD_NAME, get_user_model, login as auth_login
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404, HttpResponseForbidden, HttpResponseRedirect, HttpResponse, JsonResponse
 from django.shortcuts import resolve_url
 from django.template.response import TemplateResponse
+from django.utils.cache import add_never_cache_headers, patch_cache_control, patch_vary_headers
 from django.utils.http import is_safe_url
 from django.utils.six.moves.urllib.parse import urlencode
 from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_protect
 from django.views.decorators.debug import sensitive_post_parameters
 
+from account.breaker import ldap_degraded, status as ldap_status
+from account.replicas import replica_set
+from account.sessions import public_session_id, session_user_unavailable
+
+from .analytics import summarize
 from .models import Zone
+from .decisions import zone_index
+from .networks import client_address
+from .prewarm import is_ready
 from .forms import ZoneAuthenticationForm
 
-from .enums import ACTION_ACCESS, ACTION_DENIED, ACTION_LOGIN, ACTION_DISABLED, ACTION_UNKNOWN, ACCESS_DISPLAY
+from .enums import (ACTION_ACCESS, ACTION_DENIED, ACTION_LOGIN, ACTION_DISABLED, ACTION_UNKNOWN,
+                    ACTION_RATE_LIMITED, ACCESS_DISPLAY, ZONE_ACCESS_DISPLAY)
+
+# How long nginx may cache each outcome of check_auth, in seconds; zones can
+# override the times for granted and denied decisions.
+ZONE_RESPONSE_CACHE_TIMES = {
+    ACTION_ACCESS: 60,
+    ACTION_DENIED: 10,
+    ACTION_LOGIN: 0,
+    ACTION_DISABLED: 10,
+    ACTION_UNKNOWN: 10,
+    ACTION_RATE_LIMITED: 0,
+}
+ZONE_RESPONSE_CACHE_TIMES.update(getattr(settings, "ZONE_RESPONSE_CACHE_TIMES", {}))
 
 
 def get_response(request, response_type=HttpResponse, *args, **kwargs):
@@ -32,17 +55,54 @@ def get_response(request, response_type=HttpResponse, *args, **kwargs):
         resp['X-Zone-Email'] = ""
         resp['X-Zone-Userid'] = 0
         resp['X-Zone-First-Name'] = ""
-        resp['X-Zone-First-Name'] = ""
-    resp['X-Zone-SID'] = request.session.session_key
+        resp['X-Zone-Last-Name'] = ""
+    resp['X-Zone-SID'] = public_session_id(request.session)
     return resp
 
 
+def response_cache_time(zone_name, access):
+    zone = zone_index.get(zone_name) if access != ACTION_UNKNOWN else None
+    if zone is not None:
+        if zone.schedule_rules or zone.rate_limit or zone.user_rate_limit:
+            # The decision may flip at any moment, and rate limits only
+            # see the requests that reach us.
+            return 0
+        if access in zone.cache_times:
+            return zone.cache_times[access]
+    return ZONE_RESPONSE_CACHE_TIMES.get(access, 0)
+
+
+def set_cache_headers(response, cache_time):
+    """
+    Tells nginx how long it may answer this subrequest from its cache, see
+    nginx/auth_request_cache.
+    """
+    response['X-Accel-Expires'] = cache_time
+    if cache_time:
+        patch_cache_control(response, private=True, max_age=cache_time)
+    else:
+        add_never_cache_headers(response)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+@never_cache
+def check_ready(request):
+    """
+    Health check that fails until this worker has prewarmed its caches.
+    """
+    if not is_ready():
+        return HttpResponse("warming up", status=503, content_type='text/plain')
+    return HttpResponse("ready", content_type='text/plain')
+
+
 def check_auth(request, zone_name=None):
     redirect_to = request.META.get('HTTP_X_ORIGINAL_URI', '')
     if not zone_name:
         zone_name = request.META.get('HTTP_X_ZONE_NAME', 'default')
 
-    access, cached = Zone.process_request(request.user, zone_name)
+    access, cached = Zone.process_request(request.user, zone_name, client_address(request),
+                                          user_unavailable=session_user_unavailable(request), rate_limit=True)
 
     if access == ACTION_ACCESS:
         resp = get_response(request)
@@ -55,7 +115,30 @@ def check_auth(request, zone_name=None):
     elif access in (ACTION_DENIED, ACTION_DISABLED, ACTION_UNKNOWN):
         resp = get_response(request)
         resp.status_code = 403
-    return resp
+    elif access == ACTION_RATE_LIMITED:
+        # See nginx/auth_request_rate_limit.
+        resp = get_response(request)
+        resp.status_code = 429
+        resp['Retry-After'] = 1
+    resp['X-Zone-Cache'] = 'hit' if cached is not None else 'miss'
+    # Stale and fail-open/closed decisions shouldn't outlive the outage.
+    cache_time = 0 if ldap_degraded() else response_cache_time(zone_name, access)
+    return set_cache_headers(resp, cache_time)
+
+
+def explain_request(request, zone_name=None):
+    """
+    Explains the decision check_auth would make for this request; a
+    superuser can ask about another user with ``?user=<username>``.
+    """
+    if not zone_name:
+        zone_name = request.META.get('HTTP_X_ZONE_NAME', 'default')
+    user = request.user
+    username = request.GET.get('user')
+    if username:
+        User = get_user_model()
+        user = User.objects.get(**{User.USERNAME_FIELD: username})
+    return Zone.explain_request(user, zone_name, client_address(request))
 
 
 def check_auth_info(request, zone_name=None, template_name="auth_request/info.html"):
@@ -63,35 +146,74 @@ def check_auth_info(request, zone_name=None, template_name="auth_request/info.ht
         return check_auth(request, zone_name)
 
     redirect_to = request.META.get('HTTP_X_ORIGINAL_URI', '')
-    if not zone_name:
-        zone_name = request.META.get('HTTP_X_ZONE_NAME', 'default')
-
-    access, cached = Zone.process_request(request.user, zone_name)
-
     try:
-        zone = Zone.objects.get(code=zone_name)
-        grouprules = list(zone.groups.all().prefetch_related('group'))
-        userrules = list(zone.users.all().prefetch_related('user'))
-    except Zone.DoesNotExist:
-        zone = None
-        grouprules = []
-        userrules = []
+        trace = explain_request(request, zone_name)
+    except ObjectDoesNotExist:
+        raise Http404("No such user.")
 
     context = {
-        'access': access,
-        'access_display': ACCESS_DISPLAY[access],
-        'cached': cached,
-        'zone_name': zone_name,
-        'zone': zone,
+        'access': trace.action,
+        'access_display': ACCESS_DISPLAY[trace.action],
+        'fresh_access_display': ACCESS_DISPLAY.get(trace.fresh_action),
+        'trace': trace,
+        'zone_name': trace.zone_code,
+        'zone': trace.zone,
+        'default_access_display': ZONE_ACCESS_DISPLAY.get(trace.zone.access) if trace.zone else None,
         'redirect_to': redirect_to,
-
-        'grouprules': grouprules,
-        'userrules': userrules,
+        'steps': [dict(step, access=ZONE_ACCESS_DISPLAY[step['access']], result=ZONE_ACCESS_DISPLAY[step['result']])
+                  for step in trace.steps],
     }
 
     return TemplateResponse(request, template_name, context)
 
 
+@never_cache
+def check_auth_explain(request, zone_name=None):
+    """
+    The decision trace of check_auth_info as JSON.
+    """
+    if not request.user.is_superuser:
+        return HttpResponseForbidden()
+    try:
+        trace = explain_request(request, zone_name)
+    except ObjectDoesNotExist:
+        raise Http404("No such user.")
+    return JsonResponse(trace.as_dict())
+
+
+@never_cache
+def check_auth_analytics(request, zone_name=None):
+    """
+    Requests, distinct users, top users and outcomes per zone over the last
+    ``?window=`` seconds, merged over all workers, as JSON.
+    """
+    if not request.user.is_superuser:
+        return HttpResponseForbidden()
+    try:
+        window = int(request.GET.get('window', 0)) or None
+    except ValueError:
+        window = None
+    return JsonResponse(summarize(zone_name, window))
+
+
+@never_cache
+def check_ldap_status(request):
+    """
+    The state and counts of the LDAP circuit breakers, the replicas and the
+    stale or fail-open/closed answers served, as JSON.
+    """
+    if not request.user.is_superuser:
+        return HttpResponseForbidden()
+    data = ldap_status()
+    data['replicas'] = dict((replica.alias, {
+        'healthy': replica.healthy,
+        'latency': replica.latency,
+        'failures': replica.failures,
+        'checked_at': replica.checked_at,
+    }) for replica in replica_set.replicas)
+    return JsonResponse(data)
+
+
 @sensitive_post_parameters()
 @csrf_protect
 @never_cache
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""
+Starts a throwaway OpenLDAP server for load tests: the schema the
+application expects, the organizational units of account/schema/ou.ldif,
+a user for every line of a users file and one group holding them all.
+Nothing is shared with a system slapd; the server and its data live in a
+temporary directory that is removed when it stops.
+
+    python benchmarks/ldap_standin.py --users users.txt --port 3890
+
+Point the 'ldap' database of a local deployment at the printed URI and
+credentials, and ``replay.py --ldap-monitor`` at the same URI to report
+LDAP operations per second. Requires slapd and slapadd, and the core
+schemas of OpenLDAP with rfc2307bis (as account/schema/convert_empty.sh
+installs them).
+"""
+from __future__ import print_function
+
+import argparse
+import base64
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+
+from replay import read_users
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'account', 'schema')
+SYSTEM_SCHEMAS = ['core.ldif', 'cosine.ldif', 'inetorgperson.ldif', 'gosa/rfc2307bis.ldif']
+SCHEMAS = ['samba.ldif', 'django.ldif']
+
+USER_CLASSES = ['inetOrgPerson', 'organizationalPerson', 'person', 'djangoUser', 'posixAccount',
+                'sambaSamAccount', 'shadowAccount', 'top']
+GROUP_CLASSES = ['posixGroup', 'sambaGroupMapping', 'djangoGroup', 'groupOfNames', 'top']
+FIRST_ID = 2000
+NETSID = 'S-1-5-21-1000-2000-3000'
+
+SAFE_VALUE = re.compile(r'^[\x01-\x09\x0b-\x0c\x0e-\x1f\x21-\x39\x3b\x3d-\x7f][\x01-\x09\x0b-\x0c\x0e-\x7f]*$')
+
+
+def ldif_entry(dn, attributes):
+    """
+    Formats an LDIF entry; ``attributes`` is a list of ``(name, value)``.
+    """
+    lines = ['dn: %s' % dn]
+    for name, value in attributes:
+        if SAFE_VALUE.match(value) and not value.endswith(' '):
+            lines.append('%s: %s' % (name, value))
+        else:
+            lines.append('%s:: %s' % (name, base64.b64encode(value.encode('utf-8')).decode('ascii')))
+    return '\n'.join(lines) + '\n\n'
+
+
+def schema_ldif(path):
+    """
+    Reads a schema in cn=config LDIF, named as a child of cn=schema
+    whatever DN the file gives it.
+    """
+    with open(path) as f:
+        text = '\n'.join(line for line in f.read().splitlines() if not line.startswith('#'))
+    name = re.search(r'^cn: (?:\{\d+\})?(\S+)$', text, re.M).group(1)
+    text = re.sub(r'^dn: .*$', 'dn: cn=%s,cn=schema,cn=config' % name, text, count=1, flags=re.M)
+    return text.strip() + '\n\n'
+
+
+def config_ldif(options, directory):
+    text = ldif_entry('cn=config', [
+        ('objectClass', 'olcGlobal'),
+        ('cn', 'config'),
+        ('olcPidFile', os.path.join(directory, 'slapd.pid')),
+    ])
+    if options.module_path:
+        text += ldif_entry('cn=module{0},cn=config', [
+            ('objectClass', 'olcModuleList'),
+            ('cn', 'module{0}'),
+            ('olcModulePath', options.module_path),
+            ('olcModuleLoad', 'back_mdb'),
+            ('olcModuleLoad', 'back_monitor'),
+        ])
+    text += ldif_entry('cn=schema,cn=config', [('objectClass', 'olcSchemaConfig'), ('cn', 'schema')])
+    for path in [os.path.join(options.schema_dir, name) for name in SYSTEM_SCHEMAS] + \
+            [os.path.join(SCHEMA_DIR, name) for name in SCHEMAS]:
+        text += schema_ldif(path)
+    text += ldif_entry('olcDatabase={-1}frontend,cn=config', [
+        ('objectClass', 'olcDatabaseConfig'),
+        ('objectClass', 'olcFrontendConfig'),
+        ('olcDatabase', '{-1}frontend'),
+    ])
+    text += ldif_entry('olcDatabase={0}config,cn=config', [
+        ('objectClass', 'olcDatabaseConfig'),
+        ('olcDatabase', '{0}config'),
+        ('olcAccess', '{0}to * by * none'),
+    ])
+    text += ldif_entry('olcDatabase={1}mdb,cn=config', [
+        ('objectClass', 'olcDatabaseConfig'),
+        ('objectClass', 'olcMdbConfig'),
+        ('olcDatabase', '{1}mdb'),
+        ('olcDbDirectory', os.path.join(directory, 'data')),
+        ('olcDbMaxSize', str(1024 ** 3)),
+        ('olcSuffix', options.suffix),
+        ('olcRootDN', admin_dn(options)),
+        ('olcRootPW', options.admin_password),
+        ('olcDbIndex', 'objectClass eq'),
+        ('olcDbIndex', 'uid,cn,member,memberUid eq'),
+        ('olcDbIndex', 'uidNumber,gidNumber eq'),
+        ('olcAccess', '{0}to attrs=userPassword by self write by anonymous auth by * none'),
+        ('olcAccess', '{1}to * by * read'),
+    ])
+    text += ldif_entry('olcDatabase={2}monitor,cn=config', [
+        ('objectClass', 'olcDatabaseConfig'),
+        ('olcDatabase', '{2}monitor'),
+        ('olcAccess', '{0}to * by * read'),
+    ])
+    return text
+
+
+def admin_dn(options):
+    return 'cn=admin,%s' % options.suffix
+
+
+def data_ldif(options, users):
+    rdn_type, rdn_value = options.suffix.split(',')[0].split('=', 1)
+    text = ldif_entry(options.suffix, [
+        ('objectClass', 'top'),
+        ('objectClass', 'dcObject'),
+        ('objectClass', 'organization'),
+        (rdn_type, rdn_value),
+        ('o', rdn_value),
+    ])
+    with open(os.path.join(SCHEMA_DIR, 'ou.ldif')) as f:
+        text += f.read().replace('@DOMAIN@', options.suffix).replace('@NETSID@', NETSID).strip() + '\n\n'
+    now = str(int(time.time()))
+    members = []
+    for uid, (username, password) in enumerate(users, FIRST_ID):
+        dn = 'uid=%s,ou=people,%s' % (username, options.suffix)
+        members.append(dn)
+        text += ldif_entry(dn, [('objectClass', name) for name in USER_CLASSES] + [
+            ('uid', username),
+            ('cn', username),
+            ('sn', username),
+            ('givenName', username),
+            ('displayName', username),
+            ('mail', '%s@example.org' % username),
+            ('uidNumber', str(uid)),
+            ('gidNumber', str(FIRST_ID)),
+            ('homeDirectory', '/home/%s' % username),
+            ('loginShell', '/bin/bash'),
+            ('userPassword', password),
+            ('sambaSID', '%s-%d' % (NETSID, uid * 2)),
+            ('djangoStaff', 'FALSE'),
+            ('djangoSuper', 'FALSE'),
+            ('djangoActive', 'TRUE'),
+            ('djangoCreated', now),
+        ])
+    group = [('objectClass', name) for name in GROUP_CLASSES] + [
+        ('cn', options.group),
+        ('gidNumber', str(FIRST_ID)),
+        ('description', '.'),
+        ('sambaSID', '%s-%d' % (NETSID, FIRST_ID * 2 + 1)),
+        ('sambaGroupType', '5'),
+    ]
+    # groupOfNames needs a member, like LDAP_LIST_DEFAULT in account/fields.py.
+    group.extend(('member', dn) for dn in members or [admin_dn(options)])
+    group.extend(('memberUid', username) for username, password in users)
+    text += ldif_entry('cn=%s,ou=groups,%s' % (options.group, options.suffix), group)
+    return text
+
+
+def write(directory, name, text):
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write(text)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', required=True, help="file with username:password lines")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3890)
+    parser.add_argument('--suffix', default='dc=example,dc=org', help="the LDAP_DN_SUFFIX of the deployment")
+    parser.add_argument('--admin-password', default='secret')
+    parser.add_argument('--group', default='users', help="name of the group holding every user")
+    parser.add_argument('--schema-dir', default='/etc/ldap/schema', help="directory of OpenLDAP's schemas")
+    parser.add_argument('--module-path', default='/usr/lib/ldap',
+                        help="where slapd's backend modules are; empty if they're built in")
+    parser.add_argument('--slapd', default='slapd')
+    parser.add_argument('--slapadd', default='slapadd')
+    options = parser.parse_args()
+
+    users = read_users(options.users)
+    directory = tempfile.mkdtemp(prefix='ldap-standin-')
+    try:
+        config = os.path.join(directory, 'slapd.d')
+        os.mkdir(config)
+        os.mkdir(os.path.join(directory, 'data'))
+        subprocess.check_call([options.slapadd, '-n', '0', '-F', config,
+                               '-l', write(directory, 'config.ldif', config_ldif(options, directory))])
+        subprocess.check_call([options.slapadd, '-q', '-b', options.suffix, '-F', config,
+                               '-l', write(directory, 'data.ldif', data_ldif(options, users))])
+        uri = 'ldap://%s:%d/' % (options.host, options.port)
+        print("LDAP stand-in with %d users at %s" % (len(users), uri))
+        print("  LDAP_DN_SUFFIX = %r" % options.suffix)
+        print("  DATABASES['ldap']: NAME %r, USER %r, PASSWORD %r" % (uri, admin_dn(options),
+                                                                    options.admin_password))
+        server = subprocess.Popen([options.slapd, '-d', '0', '-h', uri, '-F', config])
+        try:
+            server.wait()
+        except KeyboardInterrupt:
+            server.terminate()
+            server.wait()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
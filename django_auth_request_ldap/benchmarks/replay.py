@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+"""
+Replays auth traffic against a running deployment for capacity planning.
+
+Traffic comes either from an nginx access log or from a synthetic
+workload: Zipf distributed users and zones, with a configurable share of
+logins and an optional login storm. Every virtual user logs in once to get
+a session; check_auth requests then carry that session.
+
+Run it against a local deployment backed by a test LDAP server, such as
+the one ``benchmarks/ldap_standin.py`` starts, never production:
+
+    python benchmarks/replay.py --url http://127.0.0.1:8000/auth_request/ \\
+        --users users.txt --zones 200 --duration 20 --saturate
+
+``users.txt`` holds one ``username:password`` per line. With ``--saturate``
+the concurrency is doubled every step until throughput stops growing or
+the p99 latency exceeds ``--max-p99``. ``--ldap-monitor`` samples the
+server's ``cn=Monitor`` backend to report LDAP operations per second.
+"""
+from __future__ import division, print_function
+
+import argparse
+import bisect
+import json
+import random
+import re
+import threading
+import time
+
+try:
+    from urllib.parse import urlencode, urljoin, urlsplit
+    from urllib.request import build_opener, HTTPCookieProcessor, Request
+    from urllib.error import HTTPError
+    from http.cookiejar import CookieJar
+except ImportError:
+    from urllib import urlencode
+    from urlparse import urljoin, urlsplit
+    from urllib2 import build_opener, HTTPCookieProcessor, Request, HTTPError
+    from cookielib import CookieJar
+
+# The combined log format, optionally followed by the zone, e.g. with
+# log_format auth '$remote_addr - $remote_user [$time_local] "$request" '
+#                 '$status $body_bytes_sent "$http_referer" '
+#                 '"$http_user_agent" $auth_request_zone';
+LOG_PATTERN = (r'(?P<address>\S+) \S+ (?P<user>\S+) \[(?P<time>[^\]]+)\] "(?P<request>[^"]*)" '
+               r'(?P<status>\d+) \S+ "[^"]*" "[^"]*"(?: (?P<zone>\S+))?')
+LOG_TIME_FORMAT = '%d/%b/%Y:%H:%M:%S'
+
+
+class Zipf(object):
+    """
+    Draws ``0 .. count - 1`` with probability proportional to
+    ``1 / (rank + 1) ** exponent``.
+    """
+    def __init__(self, count, exponent, rng):
+        self.rng = rng
+        self.cumulative = []
+        total = 0.0
+        for rank in range(count):
+            total += 1.0 / (rank + 1) ** exponent
+            self.cumulative.append(total)
+
+    def draw(self):
+        return bisect.bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1])
+
+
+class SyntheticTraffic(object):
+    def __init__(self, users, zones, options):
+        self.rng = random.Random(options.seed)
+        self.users = users
+        self.zones = zones
+        self.user_dist = Zipf(len(users), options.user_skew, self.rng)
+        self.zone_dist = Zipf(len(zones), options.zone_skew, self.rng)
+        self.options = options
+
+    def login_rate(self, elapsed):
+        storm = self.options.storm
+        if storm is not None and storm[0] <= elapsed < storm[0] + storm[1]:
+            return storm[2]
+        return self.options.login_rate
+
+    def next(self, elapsed):
+        """
+        Returns ``(delay, kind, user, zone)`` for the next request.
+        """
+        user = self.users[self.user_dist.draw()]
+        if self.rng.random() < self.login_rate(elapsed):
+            return 0, 'login', user, None
+        return 0, 'check', user, self.zones[self.zone_dist.draw()]
+
+
+def request_path(request):
+    """
+    Returns the path of a logged request line such as
+    ``POST /auth_request/login/?next=/ HTTP/1.1``.
+    """
+    parts = request.split()
+    return urlsplit(parts[1]).path if len(parts) > 1 else ''
+
+
+class LogTraffic(object):
+    """
+    Replays the check_auth requests of an access log, keeping the original
+    pacing scaled by ``--speed`` (0 replays as fast as possible).
+
+    nginx logs ``$remote_user`` as ``-`` for requests authorized through
+    auth_request, as it only knows users of HTTP basic authentication.
+    Entries of users that aren't in the users file are spread over it,
+    one user per client address (or logged name), so every client keeps a
+    session of its own.
+    """
+    def __init__(self, users, options):
+        pattern = re.compile(options.log_pattern)
+        login_path = urlsplit(urljoin(options.url, options.login_path)).path
+        by_name = dict((user[0], user) for user in users)
+        stand_ins = {}
+        self.entries = []
+        with open(options.log) as f:
+            for line in f:
+                match = pattern.match(line)
+                if match is None:
+                    continue
+                stamp = time.mktime(time.strptime(match.group('time').split()[0], LOG_TIME_FORMAT))
+                name = match.group('user')
+                user = by_name.get(name)
+                if user is None:
+                    client = match.group('address') if name == '-' else name
+                    user = stand_ins.setdefault(client, users[len(stand_ins) % len(users)])
+                kind = 'login' if request_path(match.group('request')) == login_path else 'check'
+                self.entries.append((stamp, kind, user, match.groupdict().get('zone') or 'default'))
+        if not self.entries:
+            raise SystemExit("no requests found in %s" % options.log)
+        self.speed = options.speed
+        self.position = 0
+        self.lock = threading.Lock()
+
+    def next(self, elapsed):
+        with self.lock:
+            index = self.position % len(self.entries)
+            self.position += 1
+        stamp, kind, user, zone = self.entries[index]
+        delay = 0
+        if self.speed and index:
+            delay = (stamp - self.entries[index - 1][0]) / self.speed
+        return delay, kind, user, zone
+
+
+class Client(object):
+    """
+    A virtual user with its own session.
+    """
+    def __init__(self, options, user):
+        self.options = options
+        self.user = user
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+
+    def open(self, request):
+        try:
+            response = self.opener.open(request, timeout=self.options.timeout)
+        except HTTPError as e:
+            response = e
+        response.read()
+        return response.getcode(), response.info()
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def login(self):
+        username, password = self.user
+        if password is None:
+            return 200, {}
+        url = urljoin(self.options.url, self.options.login_path)
+        self.open(Request(url))
+        data = urlencode({'username': username, 'password': password,
+                          'csrfmiddlewaretoken': self.csrf_token()}).encode('ascii')
+        return self.open(Request(url, data, {'Referer': url}))
+
+    def check(self, zone):
+        request = Request(self.options.url, headers={'X-Zone-Name': zone, 'X-Original-URI': '/'})
+        return self.open(request)
+
+
+class Step(object):
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self.latencies = []
+        self.errors = 0
+        self.hits = 0
+        self.cache_reported = 0
+        self.logins = 0
+        self.lock = threading.Lock()
+        self.elapsed = 0
+        self.ldap_ops = None
+
+    def record(self, kind, latency, status, headers):
+        with self.lock:
+            self.latencies.append(latency)
+            if status >= 500:
+                self.errors += 1
+            if kind == 'login':
+                self.logins += 1
+            # X-Zone-Cache comes from check_auth, X-Cache-Status from nginx
+            # with "add_header X-Cache-Status $upstream_cache_status".
+            cache_status = headers.get('X-Cache-Status') or headers.get('X-Zone-Cache')
+            if cache_status:
+                self.cache_reported += 1
+                if cache_status.lower() == 'hit':
+                    self.hits += 1
+
+    def percentile(self, fraction):
+        values = sorted(self.latencies)
+        if not values:
+            return 0
+        return values[min(len(values) - 1, int(len(values) * fraction))]
+
+    @property
+    def throughput(self):
+        return len(self.latencies) / self.elapsed if self.elapsed else 0
+
+    def summary(self):
+        return {
+            'concurrency': self.concurrency,
+            'requests': len(self.latencies),
+            'logins': self.logins,
+            'errors': self.errors,
+            'throughput': self.throughput,
+            'p50': self.percentile(0.5) * 1000,
+            'p95': self.percentile(0.95) * 1000,
+            'p99': self.percentile(0.99) * 1000,
+            'max': self.percentile(1) * 1000,
+            'cache_hit_ratio': self.hits / self.cache_reported if self.cache_reported else None,
+            'ldap_ops': self.ldap_ops,
+        }
+
+
+class LDAPMonitor(object):
+    """
+    Reads the number of completed operations from OpenLDAP's monitor backend.
+    """
+    def __init__(self, uri, bind_dn, password):
+        import ldap
+        self.ldap = ldap
+        self.connection = ldap.initialize(uri)
+        if bind_dn:
+            self.connection.simple_bind_s(bind_dn, password or '')
+
+    def completed(self):
+        results = self.connection.search_s('cn=Operations,cn=Monitor', self.ldap.SCOPE_BASE,
+                                           '(objectClass=*)', ['monitorOpCompleted'])
+        return int(results[0][1]['monitorOpCompleted'][0])
+
+
+def run_step(options, traffic, clients, concurrency, monitor):
+    step = Step(concurrency)
+    start = time.time()
+    deadline = start + options.duration
+    ops_before = monitor.completed() if monitor else None
+
+    def worker():
+        while True:
+            now = time.time()
+            if now >= deadline:
+                return
+            delay, kind, user, zone = traffic.next(now - start)
+            if delay:
+                time.sleep(delay)
+            client = clients.get(user[0])
+            if client is None:
+                client = clients.setdefault(user[0], Client(options, user))
+                if kind != 'login':
+                    client.login()
+            sent = time.time()
+            try:
+                if kind == 'login':
+                    status, headers = client.login()
+                else:
+                    status, headers = client.check(zone)
+            except Exception:
+                status, headers = 599, {}
+            step.record(kind, time.time() - sent, status, headers)
+
+    threads = [threading.Thread(target=worker) for i in range(concurrency)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    step.elapsed = time.time() - start
+    if monitor:
+        step.ldap_ops = (monitor.completed() - ops_before) / step.elapsed
+    return step
+
+
+def print_step(summary):
+    hits = '-' if summary['cache_hit_ratio'] is None else '%.0f%%' % (summary['cache_hit_ratio'] * 100)
+    ldap_ops = '-' if summary['ldap_ops'] is None else '%.0f' % summary['ldap_ops']
+    print("%6d %8d %8.1f %8.1f %8.1f %8.1f %8.1f %6d %6s %8s" % (
+        summary['concurrency'], summary['requests'], summary['throughput'], summary['p50'], summary['p95'],
+        summary['p99'], summary['max'], summary['errors'], hits, ldap_ops))
+
+
+def read_users(path):
+    users = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                username, _sep, password = line.partition(':')
+                users.append((username, password))
+    return users
+
+
+def parse_storm(value):
+    start, duration, rate = value.split(':')
+    return float(start), float(duration), float(rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000/auth_request/',
+                        help="check_auth URL of the deployment under test")
+    parser.add_argument('--login-path', default='login/', help="login URL, relative to --url")
+    parser.add_argument('--users', required=True, help="file with username:password lines")
+    parser.add_argument('--log', help="nginx access log to replay instead of synthetic traffic")
+    parser.add_argument('--log-pattern', default=LOG_PATTERN,
+                        help="regular expression with time, user, request and optionally zone groups")
+    parser.add_argument('--speed', type=float, default=0,
+                        help="replay speed relative to the log, 0 replays as fast as possible")
+    parser.add_argument('--zones', type=int, default=50, help="number of synthetic zones (zone-0 ...)")
+    parser.add_argument('--zone-name', action='append', default=[], help="zone code to use, may be repeated")
+    parser.add_argument('--user-skew', type=float, default=1.1, help="Zipf exponent over users")
+    parser.add_argument('--zone-skew', type=float, default=1.3, help="Zipf exponent over zones")
+    parser.add_argument('--login-rate', type=float, default=0.01, help="share of requests that are logins")
+    parser.add_argument('--storm', type=parse_storm, metavar='START:DURATION:RATE',
+                        help="login rate during a window of each step, in seconds from its start")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10, help="seconds per step")
+    parser.add_argument('--saturate', action='store_true', help="double the concurrency until saturated")
+    parser.add_argument('--max-concurrency', type=int, default=256)
+    parser.add_argument('--max-p99', type=float, default=250, help="p99 latency (ms) considered saturated")
+    parser.add_argument('--min-gain', type=float, default=0.05,
+                        help="throughput growth per doubling below which the tier is considered saturated")
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--ldap-monitor', metavar='URI', help="LDAP server to read cn=Monitor from")
+    parser.add_argument('--ldap-monitor-dn')
+    parser.add_argument('--ldap-monitor-password')
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    options = parser.parse_args()
+
+    users = read_users(options.users)
+    if not users:
+        raise SystemExit("no users found in %s" % options.users)
+    if options.log:
+        traffic = LogTraffic(users, options)
+    else:
+        zones = options.zone_name or ['zone-%d' % i for i in range(options.zones)]
+        traffic = SyntheticTraffic(users, zones, options)
+    monitor = None
+    if options.ldap_monitor:
+        monitor = LDAPMonitor(options.ldap_monitor, options.ldap_monitor_dn, options.ldap_monitor_password)
+
+    clients = {}
+    results = []
+    if not options.json:
+        print("%6s %8s %8s %8s %8s %8s %8s %6s %6s %8s" % (
+            'conc', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms', 'errors', 'hits', 'ldap/s'))
+    concurrency = options.concurrency
+    saturation = None
+    while True:
+        summary = run_step(options, traffic, clients, concurrency, monitor).summary()
+        results.append(summary)
+        if not options.json:
+            print_step(summary)
+        if not options.saturate:
+            break
+        previous = results[-2] if len(results) > 1 else None
+        if summary['p99'] > options.max_p99 or (
+                previous and summary['throughput'] < previous['throughput'] * (1 + options.min_gain)):
+            saturation = previous or summary
+            break
+        if concurrency * 2 > options.max_concurrency:
+            break
+        concurrency *= 2
+
+    if options.json:
+        print(json.dumps({'steps': results, 'saturation': saturation}, indent=2))
+    elif saturation is not None:
+        print()
+        print("saturated at concurrency %d: %.1f req/s, p99 %.1f ms" % (
+            saturation['concurrency'], saturation['throughput'], saturation['p99']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Measures the cold-start cost of an auth worker: importing and setting up
+Django, building the WSGI application and serving the first requests.
+
+Every sample runs in a fresh interpreter, since that is what a freshly
+autoscaled worker is. Run it from the project directory against a
+deployment that can reach its LDAP server and audit database:
+
+    python benchmarks/startup.py --runs 10 --path /auth_request/ --header X-Zone-Name=default
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+PHASES = ['setup', 'wsgi', 'first_response', 'second_response', 'total']
+
+
+def child(options):
+    start = time.time()
+    import django
+    django.setup()
+    setup_done = time.time()
+
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+    wsgi_done = time.time()
+
+    from wsgiref.util import setup_testing_defaults
+
+    def request():
+        environ = {
+            'PATH_INFO': options.path,
+            'REQUEST_METHOD': 'GET',
+            'HTTP_HOST': options.host,
+        }
+        for header in options.header:
+            name, value = header.split('=', 1)
+            environ['HTTP_%s' % name.upper().replace('-', '_')] = value
+        setup_testing_defaults(environ)
+        status = []
+        body = application(environ, lambda s, h, exc_info=None: status.append(s))
+        try:
+            for chunk in body:
+                pass
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        return status[0]
+
+    status = request()
+    first_done = time.time()
+    request()
+    second_done = time.time()
+
+    print(json.dumps({
+        'status': status,
+        'setup': setup_done - start,
+        'wsgi': wsgi_done - setup_done,
+        'first_response': first_done - wsgi_done,
+        'second_response': second_done - first_done,
+    }))
+
+
+def parent(options):
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', options.settings)
+    env['PYTHONPATH'] = os.pathsep.join([project_dir] + [x for x in [env.get('PYTHONPATH')] if x])
+    args = [sys.executable, os.path.abspath(__file__), '--child', '--path', options.path, '--host', options.host]
+    for header in options.header:
+        args.extend(['--header', header])
+
+    samples = []
+    for run in range(options.runs):
+        spawned = time.time()
+        output = subprocess.check_output(args, env=env, cwd=project_dir)
+        total = time.time() - spawned
+        sample = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        sample['total'] = total
+        samples.append(sample)
+        print("run %d: %s, %.1fms to first response" % (run + 1, sample['status'], total * 1000))
+
+    print()
+    print("%-16s %10s %10s %10s" % ('phase', 'min (ms)', 'median', 'max'))
+    for phase in PHASES:
+        values = sorted(sample[phase] * 1000 for sample in samples)
+        print("%-16s %10.1f %10.1f %10.1f" % (phase, values[0], values[len(values) // 2], values[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/auth_request/')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--header', action='append', default=[],
+                        help="extra request header as Name=value, may be repeated")
+    parser.add_argument('--settings', default='django_auth_request_ldap.settings')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    options = parser.parse_args()
+    if options.child:
+        child(options)
+    else:
+        parent(options)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+from django.test import SimpleTestCase
+
+import argparse
+import os
+import tempfile
+
+from benchmarks.replay import LOG_PATTERN, LogTraffic, request_path
+
+LOG = '''\
+10.0.0.1 - - [19/Oct/2026:09:00:00 +0200] "GET /auth_request/login/?next=/wiki/ HTTP/1.1" 200 512 "-" "curl" -
+10.0.0.1 - - [19/Oct/2026:09:00:01 +0200] "POST /auth_request/login/ HTTP/1.1" 302 0 "-" "curl" -
+10.0.0.1 - - [19/Oct/2026:09:00:02 +0200] "GET /wiki/ HTTP/1.1" 200 2048 "-" "curl" wiki
+10.0.0.2 - - [19/Oct/2026:09:00:03 +0200] "GET /wiki/login/ HTTP/1.1" 200 2048 "-" "curl" wiki
+10.0.0.3 - bob [19/Oct/2026:09:00:04 +0200] "GET /git/ HTTP/1.1" 200 2048 "-" "curl" git
+'''
+
+
+class LogTrafficTests(SimpleTestCase):
+    def traffic(self, users):
+        handle, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'w') as f:
+            f.write(LOG)
+        options = argparse.Namespace(log=path, log_pattern=LOG_PATTERN, url='http://127.0.0.1:8000/auth_request/',
+                                     login_path='login/', speed=0)
+        return LogTraffic(users, options)
+
+    def test_request_path(self):
+        self.assertEqual(request_path('POST /auth_request/login/?next=/ HTTP/1.1'), '/auth_request/login/')
+        self.assertEqual(request_path('-'), '')
+
+    def test_logins_are_found_by_path(self):
+        traffic = self.traffic([('alice', 'secret'), ('bob', 'hunter2')])
+        self.assertEqual([entry[1] for entry in traffic.entries], ['login', 'login', 'check', 'check', 'check'])
+        self.assertEqual([entry[3] for entry in traffic.entries][2:], ['wiki', 'wiki', 'git'])
+
+    def test_anonymous_entries_get_a_user_per_address(self):
+        alice, bob = ('alice', 'secret'), ('bob', 'hunter2')
+        traffic = self.traffic([alice, bob])
+        self.assertEqual([entry[2] for entry in traffic.entries], [alice, alice, alice, bob, bob])
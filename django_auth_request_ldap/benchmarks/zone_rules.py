@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Microbenchmark of zone rule evaluation: the compiled decision tables of
+auth_request.decisions against the previous approach of sorting every
+applicable rule by order and walking the list, three times per request.
+
+No database or LDAP is needed; rules are generated in memory:
+
+    python benchmarks/zone_rules.py --rules 100 1000 10000 --groups 5 50
+"""
+from __future__ import print_function
+
+import argparse
+import collections
+import logging
+import os
+import random
+import sys
+import timeit
+from operator import attrgetter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django.conf import settings  # noqa
+settings.configure()
+
+from auth_request.decisions import CompiledZone, RULE_GROUP, RULE_USER  # noqa
+from auth_request.enums import ZONE_ACCESS_DEFAULT, ZONE_ACCESS_ALLOWED, ZONE_ACCESS_DENIED  # noqa
+
+logger = logging.getLogger('zone_rules')
+
+Rule = collections.namedtuple('Rule', 'order kind pk object_pk access')
+
+
+def legacy_process_rules(zone_access, rules):
+    rules = sorted(rules, key=attrgetter("order"))
+    access = zone_access
+    logger.debug("Default access for matrix: %s", access)
+    for rule in rules:
+        if rule.access != ZONE_ACCESS_DEFAULT:
+            access = rule.access
+        logger.debug("%d: Applied rule for %s: %s, new active access: %s",
+                     rule.order, rule.object_pk, rule.access, access)
+    return access
+
+
+def legacy_evaluate(zone_access, group_rules, user_rules, user_pk, group_pks):
+    # The database used to filter the rules down to the user and its groups.
+    group_rules = [x for x in group_rules if x.object_pk in group_pks]
+    user_rules = [x for x in user_rules if x.object_pk == user_pk]
+    return (legacy_process_rules(zone_access, group_rules + user_rules),
+            legacy_process_rules(zone_access, group_rules),
+            legacy_process_rules(zone_access, user_rules))
+
+
+def make_zone(rule_count, group_count, user_count):
+    accesses = [ZONE_ACCESS_DEFAULT, ZONE_ACCESS_ALLOWED, ZONE_ACCESS_DENIED]
+    rules = []
+    for pk in range(rule_count):
+        kind = RULE_GROUP if random.random() < 0.7 else RULE_USER
+        object_pk = random.randrange(group_count if kind == RULE_GROUP else user_count)
+        rules.append(Rule(random.randrange(100), kind, pk, object_pk, random.choice(accesses)))
+    return rules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rules', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--groups', type=int, nargs='+', default=[5, 50],
+                        help="number of groups the evaluated user is a member of")
+    parser.add_argument('--number', type=int, default=200)
+    options = parser.parse_args()
+    random.seed(0)
+
+    print("%8s %7s %14s %14s %9s" % ('rules', 'groups', 'legacy (us)', 'compiled (us)', 'speedup'))
+    for rule_count in options.rules:
+        group_count = max(10, rule_count // 5)
+        user_count = max(10, rule_count)
+        rules = make_zone(rule_count, group_count, user_count)
+        group_rules = [x for x in rules if x.kind == RULE_GROUP]
+        user_rules = [x for x in rules if x.kind == RULE_USER]
+        compiled = CompiledZone(1, 'bench', 'bench', ZONE_ACCESS_DEFAULT, True, rules)
+        for member_of in options.groups:
+            user_pk = random.randrange(user_count)
+            group_pks = random.sample(range(group_count), min(member_of, group_count))
+            group_set = set(group_pks)
+
+            expected = legacy_evaluate(ZONE_ACCESS_DEFAULT, group_rules, user_rules, user_pk, group_set)
+            assert compiled.evaluate(user_pk, group_pks) == expected
+            assert compiled.explain(user_pk, group_pks)[0] == expected[0]
+
+            legacy = min(timeit.repeat(
+                lambda: legacy_evaluate(ZONE_ACCESS_DEFAULT, group_rules, user_rules, user_pk, group_set),
+                number=options.number, repeat=3)) / options.number
+            fast = min(timeit.repeat(lambda: compiled.evaluate(user_pk, group_pks),
+                                     number=options.number, repeat=3)) / options.number
+            print("%8d %7d %14.2f %14.2f %8.0fx" % (rule_count, member_of, legacy * 1e6, fast * 1e6, legacy / fast))
+
+if __name__ == "__main__":
+    main()
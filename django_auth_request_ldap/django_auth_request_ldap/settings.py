@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/1.8/ref/settings/
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 import os
+import ldap
 from .local_settings import *
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -39,11 +40,14 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'account.middleware.InvalidationMiddleware',
+    'account.replicas.ReplicaStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
+    'account.middleware.SessionRefreshMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -77,6 +81,14 @@ AUTH_USER_MODEL = "account.User"
 AUTH_GROUP_MODEL = "account.Group"
 
 
+# Sessions
+# Auth subrequests read the session on every request; keep it in the cache
+# (backed by the database) and only write it when it needs a new expiry.
+# 'django.contrib.sessions.backends.signed_cookies' avoids storage entirely.
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+
 # Database
 # https://docs.djangoproject.com/en/1.8/ref/settings/#databases
 
@@ -91,9 +103,19 @@ DATABASES = {
         'NAME':     'ldapi:///',
         'USER':     LDAP_ADMIN_DN,
         'PASSWORD': LDAP_ADMIN_PASSWORD,
+        # Bound every operation, so a stalled slapd trips the circuit
+        # breaker (account/breaker.py) rather than hanging the workers.
+        'CONNECTION_OPTIONS': {
+            ldap.OPT_NETWORK_TIMEOUT: 5,
+            ldap.OPT_TIMEOUT: 5,
+        },
     }
 }
 
+# Aliases of read-only LDAP replicas in DATABASES, configured like 'ldap'
+# (the primary, which takes all writes); see account/replicas.py.
+LDAP_REPLICAS = []
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_auth_request_ldap.settings")
 
 application = get_wsgi_application()
+
+# Warm this worker's caches before it takes requests.
+from auth_request.prewarm import prewarm_on_start
+prewarm_on_start()